@@ -0,0 +1,87 @@
+"""Benchmark DetailFetcher over a synthetic corpus of library paths.
+
+Usage: python3 -m benchmarks.bench_detail_fetcher [number of paths]
+"""
+import os
+import random
+import sys
+import time
+
+from morgy.database.detail_fetcher import DetailFetcher
+
+CATEGORIES = ["01 Külföldi Punk", "03 Külföldi Blues, Rock, Metal", "07 Indie, játékzenék"]
+
+
+def synthetic_corpus(size, seed=0):
+    rng = random.Random(seed)
+    corpus = list()
+    while len(corpus) < size:
+        category = os.path.join("/music/00 All", rng.choice(CATEGORIES))
+        artist = "Artist {}".format(rng.randrange(size // 50 + 1))
+        shape = rng.random()
+        if shape < 0.7:
+            dirpath = os.path.join(category, artist, "{} Album".format(rng.randrange(1960, 2020)))
+            names = ["{:02d} Song {}".format(i, i) for i in range(1, 13)]
+        elif shape < 0.8:
+            dirpath = os.path.join(category, artist, "1996 Live", "CD{}".format(rng.randrange(1, 3)))
+            names = ["{:02d} Song {}".format(i, i) for i in range(1, 13)]
+        elif shape < 0.9:
+            dirpath = os.path.join(category, "Compilation {}".format(rng.randrange(100)))
+            names = ["Artist {} - Song {}".format(i, i) for i in range(20)]
+        else:
+            dirpath = os.path.join(category, artist)
+            names = ["{:02d} Song {}".format(i, i) for i in range(1, 6)]
+        corpus.extend((dirpath, name) for name in names)
+    return corpus[:size]
+
+
+def legacy_fetch_detail(dirpath, name):
+    """The hard-coded heuristics DetailFetcher used before layout rules."""
+    dirs = list()
+    while not dirpath.endswith("00 All"):
+        dirpath, directory = os.path.split(dirpath)
+        dirs.append(directory)
+    artist = year = album = cd_number = number = None
+    if len(dirs) == 4:
+        cd_number = dirs[0][-1]
+        dirs = dirs[1:]
+    if len(dirs) == 3:
+        if name[:2].isdigit():
+            number = name[:2]
+            title = name[3:]
+        else:
+            title = name
+        if dirs[0][:4].isdigit():
+            year = dirs[0][:4]
+            album = dirs[0][5:]
+        else:
+            album = dirs[0]
+        artist = dirs[1]
+    elif len(dirs) == 2 and " - " in name:
+        artist, title = name.split(" - ")
+    elif len(dirs) == 2:
+        title = name[3:] if name[:2].isdigit() and int(name[:2]) < 90 else name
+        artist = dirs[0]
+    else:
+        title = name
+    return (artist, year, album, cd_number, number, title)
+
+
+def measure(label, fetch_detail, corpus):
+    start = time.perf_counter()
+    for dirpath, name in corpus:
+        fetch_detail(dirpath, name)
+    elapsed = time.perf_counter() - start
+    print("{:<28}{:>8.3f} s {:>12.0f} paths/s".format(label, elapsed, len(corpus) / elapsed))
+
+
+def main(size):
+    corpus = synthetic_corpus(size)
+    print("{} paths in {} directories".format(len(corpus), len({d for d, _ in corpus})))
+    measure("legacy heuristics", legacy_fetch_detail, corpus)
+    measure("layout rules", DetailFetcher().fetch_detail, corpus)
+    measure("layout rules, no cache", DetailFetcher(cache_size=0).fetch_detail, corpus)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,48 @@
+"""Benchmark DatabaseUpdater with a growing number of worker processes.
+
+Usage: python3 -m benchmarks.bench_parallel_ingest [number of files] [max workers]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_tag_reader import synthetic_mp3
+from morgy.database import Database
+from morgy.database.updater import DatabaseUpdater
+
+
+def build_library(directory, count):
+    root = os.path.join(directory, "00 All")
+    for i in range(count):
+        album_dir = os.path.join(root, "01 Punk", "Artist {}".format(i // 120), "1990 Album {}".format(i // 12))
+        os.makedirs(album_dir, exist_ok=True)
+        with open(os.path.join(album_dir, "{:02d} Song.mp3".format(i % 12 + 1)), "wb") as f:
+            f.write(synthetic_mp3(i, picture_size=32 * 1024, audio_size=64 * 1024))
+    return root
+
+
+def main(count, max_workers):
+    directory = tempfile.mkdtemp()
+    try:
+        root = build_library(directory, count)
+        workers = 1
+        while workers <= max_workers:
+            db_path = os.path.join(directory, "songs{}.db".format(workers))
+            db = Database(db_path)
+            start = time.perf_counter()
+            DatabaseUpdater(db, workers=workers).update_db(root, 10)
+            elapsed = time.perf_counter() - start
+            db.commit_and_close()
+            print("{} workers: {:.3f} s, {:.0f} files/s".format(workers, elapsed, count / elapsed))
+            workers = workers * 2
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count(),
+    )
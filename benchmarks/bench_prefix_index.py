@@ -0,0 +1,61 @@
+"""Benchmark PrefixIndex.complete against indexed LIKE queries on a synthetic
+library.
+
+Usage: python3 -m benchmarks.bench_prefix_index [number of songs]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_search import synthetic_rows, timed
+from morgy.database import Database
+from morgy.database.prefix_index import PrefixIndex
+
+PREFIXES = ["k", "ka", "kar", "gyo", "szolo", "tu"]
+
+
+def main(count):
+    directory = tempfile.mkdtemp()
+    db_path = os.path.join(directory, "songs.db")
+    try:
+        db = Database(db_path)
+        rows = list(synthetic_rows(count))
+        for i in range(0, len(rows), 50000):
+            db.add_detail_rows(rows[i : i + 50000])
+
+        index = PrefixIndex(db, max_age=3600)
+        start = time.perf_counter()
+        index.build()
+        print(
+            "{} songs indexed in {:.2f} s, {} values, {} keys".format(
+                count, time.perf_counter() - start, len(index.values), len(index.keys)
+            )
+        )
+        for prefix in PREFIXES:
+            # the first query of a wide prefix scans, the rest are cached
+            first, _ = timed(lambda: index.complete(prefix), 1)
+            elapsed, results = timed(lambda: index.complete(prefix), 1000)
+            like = prefix.capitalize() + "%"
+            like_elapsed, _ = timed(
+                lambda: db.conn.execute(
+                    """SELECT artist, count(*) FROM tracks WHERE artist LIKE ?
+                    GROUP BY artist ORDER BY count(*) DESC LIMIT 10""",
+                    [like],
+                ).fetchall(),
+                20,
+            )
+            print(
+                "{!r}: complete {:.1f} us (first {:.1f} us, {} results), artist LIKE {:.1f} us".format(
+                    prefix, elapsed * 1e6, first * 1e6, len(results), like_elapsed * 1e6
+                )
+            )
+        db.close()
+    finally:
+        for name in os.listdir(directory):
+            os.unlink(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,75 @@
+"""Benchmark Database.search against a LIKE scan on a synthetic library.
+
+Usage: python3 -m benchmarks.bench_search [number of songs]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from morgy.database import Database
+
+CONSONANTS = ["b", "d", "f", "g", "gy", "h", "k", "l", "m", "n", "ny", "p", "r", "s", "sz", "t", "v", "z", "zs"]
+VOWELS = ["a", "á", "e", "é", "i", "o", "ö", "ő", "u", "ü", "ű"]
+SYLLABLES = [consonant + vowel for consonant in CONSONANTS for vowel in VOWELS]
+QUERIES = ["kare", "gyo nya", "szolo", "tu", "ba de fu"]
+
+
+def word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randrange(1, 4))).capitalize()
+
+
+def synthetic_rows(count, seed=0):
+    rng = random.Random(seed)
+    artists = [" ".join(word(rng) for _ in range(2)) for _ in range(count // 100 + 1)]
+    for i in range(count):
+        artist = rng.choice(artists)
+        album = " ".join(word(rng) for _ in range(rng.randrange(1, 4)))
+        title = " ".join(word(rng) for _ in range(rng.randrange(1, 5)))
+        path = "/music/00 All/01 Punk/{}/1990 {}/{:02d} {}.mp3".format(artist, album, i % 12 + 1, title)
+        yield (path, artist, 1990, album, None, i % 12 + 1, title, 5, None, None, None)
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main(count):
+    directory = tempfile.mkdtemp()
+    db_path = os.path.join(directory, "songs.db")
+    try:
+        db = Database(db_path)
+        start = time.perf_counter()
+        rows = list(synthetic_rows(count))
+        for i in range(0, len(rows), 50000):
+            db.add_detail_rows(rows[i : i + 50000])
+        print("{} songs added in {:.1f} s".format(count, time.perf_counter() - start))
+
+        for query in QUERIES:
+            elapsed, results = timed(lambda: db.search(query), 20)
+            like = "%{}%".format(query.split()[0])
+            scan_elapsed, _ = timed(
+                lambda: db.conn.execute(
+                    "SELECT path FROM details WHERE title LIKE ? OR artist LIKE ? LIMIT 20",
+                    [like, like],
+                ).fetchall(),
+                3,
+            )
+            print(
+                "{!r}: search {:.2f} ms ({} results), LIKE scan {:.2f} ms".format(
+                    query, elapsed * 1000, len(results), scan_elapsed * 1000
+                )
+            )
+        db.close()
+    finally:
+        for name in os.listdir(directory):
+            os.unlink(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 400000)
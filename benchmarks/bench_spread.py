@@ -0,0 +1,40 @@
+"""Benchmark spreader.spread on a picked list with a realistic skew: a few
+artists with many songs, many with a few.
+
+Usage: python3 -m benchmarks.bench_spread [number of songs]
+"""
+import random
+import sys
+import time
+
+from morgy.spreader import spread
+
+
+def picked_songs(count, seed=0):
+    rng = random.Random(seed)
+    songs = list()
+    for i in range(count):
+        # artist n has about 1 / n of the songs
+        artist = int(rng.paretovariate(1.0))
+        album = rng.randrange(1 + artist % 5)
+        songs.append((artist, album, i))
+    rng.shuffle(songs)
+    return songs
+
+
+def back_to_back(order):
+    return sum(1 for first, second in zip(order, order[1:]) if first[0] == second[0])
+
+
+def main(count):
+    songs = picked_songs(count)
+    artists = len({song[0] for song in songs})
+    print("{} songs of {} artists, {} back to back after shuffling".format(count, artists, back_to_back(songs)))
+    start = time.perf_counter()
+    order = spread(songs, lambda song: song[0], lambda song: song[1], random.Random(1))
+    elapsed = time.perf_counter() - start
+    print("spread in {:.1f} ms, {} back to back".format(elapsed * 1000, back_to_back(order)))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,113 @@
+"""Benchmark the Streamer with many listeners at once: every listener plays
+a song the way players do, reading it in Range requests of a chunk each
+over one keep-alive connection. Reports the throughput, the latency
+percentiles of the chunks and the threads the streamer used.
+
+Usage: python3 -m benchmarks.bench_streamer [listeners] [song size in MB] [chunk size in KB]
+"""
+import asyncio
+import http.client
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from morgy.database import Database
+from morgy.streamer import Streamer
+
+SONGS = 20
+
+
+def listen(address, track_id, size, chunk, latencies):
+    connection = http.client.HTTPConnection(*address)
+    try:
+        for first in range(0, size, chunk):
+            start = time.perf_counter()
+            connection.request(
+                "GET",
+                "/tracks/{}.mp3".format(track_id),
+                headers={"Range": "bytes={}-{}".format(first, first + chunk - 1)},
+            )
+            response = connection.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - start)
+            if response.status != 206:
+                raise RuntimeError("Got {}".format(response.status))
+    finally:
+        connection.close()
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main(listeners, size, chunk):
+    directory = tempfile.mkdtemp()
+    db_path = os.path.join(directory, "songs.db")
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever)
+    try:
+        db = Database(db_path)
+        data = os.urandom(size)
+        for number in range(SONGS):
+            path = os.path.join(directory, "{}.mp3".format(number))
+            with open(path, "wb") as song:
+                song.write(data)
+            db.add_detail_row(path, "Artist", 1990, None, None, None, str(number), 5)
+        db.commit()
+
+        streamer = Streamer(db)
+        loop_thread.start()
+        server = asyncio.run_coroutine_threadsafe(
+            streamer.start("127.0.0.1", 0), loop
+        ).result()
+        address = server.sockets[0].getsockname()[:2]
+        latencies = list()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(listeners) as executor:
+            futures = [
+                executor.submit(listen, address, i % SONGS + 1, size, chunk, latencies)
+                for i in range(listeners)
+            ]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - start
+        # the listeners are gone, the rest but this one are the streamer's
+        threads = threading.active_count() - 1
+        asyncio.run_coroutine_threadsafe(streamer.stop(), loop).result()
+        streamer.close()
+        db.close()
+
+        latencies.sort()
+        print(
+            "{} listeners got {:.0f} MB in {:.2f} s: {:.0f} MB/s".format(
+                listeners, listeners * size / 1e6, elapsed, listeners * size / 1e6 / elapsed
+            )
+        )
+        print(
+            "{} KB chunks: p50 {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms".format(
+                chunk // 1024,
+                percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000,
+                latencies[-1] * 1000,
+            )
+        )
+        print("streamer threads: {}".format(threads))
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        if loop_thread.is_alive():
+            loop_thread.join()
+        loop.close()
+        for name in os.listdir(directory):
+            os.unlink(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+        int(float(sys.argv[2]) * 1024 * 1024) if len(sys.argv) > 2 else 8 * 1024 * 1024,
+        int(sys.argv[3]) * 1024 if len(sys.argv) > 3 else 256 * 1024,
+    )
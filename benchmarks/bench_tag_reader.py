@@ -0,0 +1,49 @@
+"""Benchmark TagReader on synthetic mp3 files with a large embedded picture.
+
+Usage: python3 -m benchmarks.bench_tag_reader [number of files]
+"""
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+from morgy.database.tag_reader import TagReader
+
+
+def synthetic_mp3(i, picture_size=256 * 1024, audio_size=512 * 1024):
+    def frame(frame_id, data):
+        return frame_id + struct.pack(">I", len(data)) + b"\x00\x00" + data
+
+    body = frame(b"APIC", b"\x00" * picture_size)
+    body += frame(b"TPE1", b"\x03Artist %d" % (i // 12))
+    body += frame(b"TALB", b"\x03Album %d" % (i // 12))
+    body += frame(b"TRCK", b"\x03%d" % (i % 12 + 1))
+    body += frame(b"TIT2", b"\x03Song %d" % i)
+    size = bytes([(len(body) >> shift) & 0x7F for shift in (21, 14, 7, 0)])
+    return b"ID3\x03\x00\x00" + size + body + b"\xff\xfb\x90\x00" * (audio_size // 4)
+
+
+def main(count):
+    directory = tempfile.mkdtemp()
+    try:
+        paths = list()
+        for i in range(count):
+            path = os.path.join(directory, "{:05d}.mp3".format(i))
+            with open(path, "wb") as f:
+                f.write(synthetic_mp3(i))
+            paths.append(path)
+
+        tag_reader = TagReader()
+        start = time.perf_counter()
+        for path in paths:
+            tag_reader.read_tags(path)
+        elapsed = time.perf_counter() - start
+        print("{} files in {:.3f} s, {:.0f} files/s".format(count, elapsed, count / elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
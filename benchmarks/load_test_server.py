@@ -0,0 +1,105 @@
+"""Load test the HTTP API on a synthetic library: clients send requests
+over keep-alive connections for a while, then the requests per second and
+the latency percentiles are reported.
+
+Usage: python3 -m benchmarks.load_test_server [number of songs] [clients] [seconds]
+"""
+import http.client
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_search import QUERIES, synthetic_rows
+from morgy.database import Database
+from morgy.server import Api, ApiServer
+
+URLS = (
+    ["/search?q={}".format(query.split()[0]) for query in QUERIES]
+    + ["/complete?prefix={}".format(query[:2]) for query in QUERIES]
+    + ["/songs?selection=year%3D1990%20priority%3E%3D5&labels=guitar"]
+)
+
+
+def client(address, stop, latencies, errors, seed):
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection(*address)
+    while not stop.is_set():
+        start = time.perf_counter()
+        connection.request("GET", rng.choice(URLS))
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        if response.status != 200:
+            errors.append(response.status)
+    connection.close()
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main(count, clients, seconds):
+    directory = tempfile.mkdtemp()
+    db_path = os.path.join(directory, "songs.db")
+    try:
+        db = Database(db_path)
+        rows = list(synthetic_rows(count))
+        for i in range(0, len(rows), 50000):
+            db.add_detail_rows(rows[i : i + 50000])
+        # every 20th song is a guitar song
+        db.label_tracks("guitar", range(1, count + 1, 20))
+        db.commit()
+
+        api = Api(db)
+        server = ApiServer(("127.0.0.1", 0), api, workers=clients, quiet=True)
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.start()
+        stop = threading.Event()
+        latencies = list()
+        errors = list()
+        threads = [
+            threading.Thread(target=client, args=(server.server_address, stop, latencies, errors, seed))
+            for seed in range(clients)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+        server.server_close()
+        server_thread.join()
+        db.close()
+
+        latencies.sort()
+        print(
+            "{} requests from {} clients in {:.1f} s: {:.0f} req/s, {} errors".format(
+                len(latencies), clients, elapsed, len(latencies) / elapsed, len(errors)
+            )
+        )
+        print(
+            "latency p50 {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms".format(
+                percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000,
+                latencies[-1] * 1000,
+            )
+        )
+        print("query cache {} hits, {} misses".format(api.cache.hits, api.cache.misses))
+    finally:
+        for name in os.listdir(directory):
+            os.unlink(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 50000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+        float(sys.argv[3]) if len(sys.argv) > 3 else 10.0,
+    )
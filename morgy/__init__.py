@@ -1,17 +1,60 @@
 import click
 import configparser
+import shlex
 
-from morgy.database import Database
+from morgy.database import BUSY_TIMEOUT, CACHE_SIZE, MMAP_SIZE, Database
+from morgy.database.labels import LabelIndex
+from morgy.database.library_layout import LibraryLayout
+from morgy.database.query_cache import MAX_BYTES as QUERY_CACHE_SIZE
+from morgy.database.selection import Selection
+from morgy.database.title_clusters import TitleClusterer
 from morgy.database.updater import DatabaseUpdater
 from morgy.song_cleankeeper.path_sanitizer import PathSanitizer
 from morgy.song_cleankeeper.renamer import Renamer
+from morgy.deduplicator import Deduplicator
 from morgy.integrator import Integrator
+from morgy.labeller import Labeller
+from morgy.playlist_writer import PlaylistWriter
+from morgy import server
 from morgy.smart_picker import SmartPicker
+from morgy import streamer
+from morgy.watcher import Watcher
 
 CONFIG_FILE = "config.ini"
 config = configparser.ConfigParser()
 config.read(CONFIG_FILE)
-db = Database(config["DEFAULT"]["database_path"])
+# opened by the first command that needs it, see get_db
+db = None
+layout = LibraryLayout.from_config(config["DEFAULT"])
+clusterer = TitleClusterer.from_config(config["DEFAULT"])
+read_tags = config["DEFAULT"].getboolean("read_tags", True)
+workers = config["DEFAULT"].getint("workers", 1)
+
+
+def get_db():
+    """Return the database, opening it on first use. It is closed when the
+    command finishes."""
+    global db
+    if db is None:
+        db = Database(
+            config["DEFAULT"]["database_path"],
+            config["DEFAULT"].getint("cache_size", CACHE_SIZE),
+            config["DEFAULT"].getint("mmap_size", MMAP_SIZE),
+            config["DEFAULT"].getfloat("busy_timeout", BUSY_TIMEOUT),
+        )
+    click.get_current_context().call_on_close(db.close)
+    return db
+
+
+def get_track_ids(labels):
+    """Return the ids of the tracks matching a label expression, None
+    without one."""
+    if labels is None:
+        return None
+    try:
+        return LabelIndex(get_db()).track_ids(labels)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--labels")
 
 
 @click.group()
@@ -26,11 +69,47 @@ def morgy():
     help="The priority to add to new music.",
     type=click.IntRange(1, 10),
 )
+@click.option(
+    "--workers",
+    default=workers,
+    help="The number of processes reading the files.",
+    type=click.IntRange(1),
+)
+@click.option(
+    "--full",
+    is_flag=True,
+    help="List every directory, even those unchanged since the last update.",
+)
 @click.argument("directory")
-def update(directory, priority):
+def update(directory, priority, workers, full):
     """Update the database of songs."""
-    db_updater = DatabaseUpdater(db)
-    db_updater.update_db(directory, priority)
+    db_updater = DatabaseUpdater(get_db(), layout, read_tags, workers)
+    db_updater.update_db(directory, priority, full)
+    changed = clusterer.update(get_db())
+    if changed:
+        print("{} songs were clustered again.".format(changed))
+
+
+@morgy.command()
+@click.option(
+    "--priority",
+    default=10,
+    help="The priority to add to new music.",
+    type=click.IntRange(1, 10),
+)
+@click.option(
+    "--debounce",
+    default=2.0,
+    help="Seconds without changes before they are written to the database.",
+)
+@click.option("--poll", is_flag=True, help="Poll the directories instead of inotify.")
+@click.argument("directories", nargs=-1, required=True)
+def watch(directories, priority, debounce, poll):
+    """Keep the database up to date while songs are added, moved or deleted
+    in the directories."""
+    db_updater = DatabaseUpdater(get_db(), layout, read_tags)
+    watcher = Watcher(db_updater, directories, priority, debounce, poll)
+    watcher.run()
 
 
 @morgy.command()
@@ -56,37 +135,126 @@ def rename(apply_file):
 @click.argument("path")
 def mark_with_guitar(path):
     """Mark songs as able to play on guitar."""
-    db.add_guitar_row(path, True)
-    db.commit_and_close()
+    get_db().add_guitar_row(path, True)
+
+
+def report_labelling(found, changed, missing, done):
+    click.echo("{} songs found, {} {}.".format(found, changed, done))
+    if missing:
+        click.echo("{} entries without a song:".format(len(missing)))
+        for entry in missing:
+            click.echo("  {}".format(entry))
+
+
+@morgy.command()
+@click.argument("name")
+@click.argument("sources", nargs=-1, required=True)
+def label(name, sources):
+    """Label songs, e.g. with car, kids or christmas.
+    Sources are M3U playlists, directories, glob patterns or song paths."""
+    try:
+        found, changed, missing = Labeller(get_db()).label(name, sources)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="NAME")
+    report_labelling(found, changed, missing, "newly labelled")
+
+
+@morgy.command()
+@click.argument("name")
+@click.argument("sources", nargs=-1, required=True)
+def unlabel(name, sources):
+    """Remove a label from songs.
+    Sources are M3U playlists, directories, glob patterns or song paths."""
+    found, changed, missing = Labeller(get_db()).unlabel(name, sources)
+    report_labelling(found, changed, missing, "unlabelled")
 
 
 @morgy.command()
 @click.argument("directory")
 def integrate(directory):
     """Integrate new songs into your music folder and database."""
-    integrator = Integrator(directory, db)
+    integrator = Integrator(directory, get_db(), layout)
     integrator.run()
 
 
+def parse_selection(terms, param_hint="SELECTION"):
+    try:
+        return Selection(terms)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint=param_hint)
+
+
 @morgy.command()
+@click.option(
+    "--labels",
+    help='Only songs matching a label expression, e.g. "guitar AND NOT christmas".',
+)
+@click.option("--plain", is_flag=True, help="Only the paths, without #EXTINF lines.")
+@click.option("--relative-to", help="Write the paths relative to this directory.")
+@click.option("--spread", is_flag=True, help="Spread the songs of an artist or album apart.")
 @click.argument("file")
-@click.argument("selection")
-def write_playlist(file, selection):
-    """Create a playlist by selecting filepaths and write it to a file."""
-    with open(file, "w") as playlist:
-        for song_path in db.get_path_where(selection):
-            playlist.write(song_path[0] + "\n")
+@click.argument("selection", nargs=-1)
+def write_playlist(file, selection, labels, plain, relative_to, spread):
+    """Create a playlist by selecting filepaths and write it to a file.
+    Selection is field=value terms, e.g. artist="Mark Knopfler"
+    year=1990..1999 category="01 Külföldi Punk" priority>=5 guitar.
+    Without any, every song is written."""
+    selection = parse_selection(selection)
+    writer = PlaylistWriter(get_db(), relative_to, not plain, spread)
+    writer.write([(file, selection, get_track_ids(labels))])
+
+
+@morgy.command()
+@click.option("--plain", is_flag=True, help="Only the paths, without #EXTINF lines.")
+@click.option("--relative-to", help="Write the paths relative to this directory.")
+@click.option("--spread", is_flag=True, help="Spread the songs of an artist or album apart.")
+@click.argument("definitions", type=click.File("r", encoding="utf-8"))
+def write_playlists(definitions, plain, relative_to, spread):
+    """Write several playlists in one pass over the songs.
+    Every line of the definitions file is a playlist file followed by its
+    selection, like the arguments of write-playlist; # starts a comment."""
+    playlists = list()
+    for number, line in enumerate(definitions, 1):
+        words = shlex.split(line, comments=True)
+        if words:
+            selection = parse_selection(words[1:], "line {}".format(number))
+            playlists.append((words[0], selection, None))
+    counts = PlaylistWriter(get_db(), relative_to, not plain, spread).write(playlists)
+    for (file, _, _), count in zip(playlists, counts):
+        click.echo("{}: {} songs".format(file, count))
 
 
 @morgy.command()
+@click.option("--limit", default=20, help="The number of songs to list.")
+@click.argument("words", nargs=-1, required=True)
+def search(words, limit):
+    """List the paths of the songs best matching the words in their artist,
+    album or title. Accents do not matter, words may be prefixes."""
+    for path, artist, album, title in get_db().search(" ".join(words), limit):
+        click.echo(path)
+
+
+@morgy.command()
+@click.option("--hours", type=float, help="The length of music to be copied.")
+@click.option(
+    "--labels",
+    help='Only songs matching a label expression, e.g. "car OR workout".',
+)
 @click.argument("destination")
-@click.argument("quantity", type=int)
-def pick_and_copy(destination, quantity):
+@click.argument("quantity", type=int, required=False)
+def pick_and_copy(destination, quantity, hours, labels):
     """Copy some smartly picked songs.
     Destination is the destination directory to copy music to.
-    Quantity is the amount of music to be copied in MBs."""
-    smart_picker = SmartPicker(db)
-    to_copy = smart_picker.pick(quantity * 1024 * 1024)
+    Quantity is the amount of music to be copied in MBs.
+    At least one of quantity and --hours is needed."""
+    if quantity is None and hours is None:
+        raise click.UsageError("Give a quantity in MBs, --hours or both.")
+    smart_picker = SmartPicker(get_db(), get_track_ids(labels))
+    to_copy = smart_picker.pick(
+        quantity * 1024 * 1024 if quantity is not None else None,
+        hours * 3600 if hours is not None else None,
+    )
+    to_copy = smart_picker.spread(to_copy)
     smart_picker.decrease_prio(to_copy)
     # should it be a different class?
     smart_picker.copy_list_to_destination(to_copy, destination)
@@ -96,9 +264,47 @@ def pick_and_copy(destination, quantity):
 @click.argument("destination")
 def write_guitar_files(destination):
     """Write files marked with guitar to a destination folder."""
-    smart_picker = SmartPicker(db)
+    smart_picker = SmartPicker(get_db())
     to_copy = smart_picker.pick_all_from_guitar()
     smart_picker.copy_list_to_destination(to_copy, destination)
 
+
+@morgy.command()
+@click.option("--host", default="127.0.0.1", help="The address to listen on.")
+@click.option("--port", default=8080, help="The port to listen on.")
+@click.option(
+    "--workers",
+    default=8,
+    help="The number of threads answering requests.",
+    type=click.IntRange(1),
+)
+def serve(host, port, workers):
+    """Serve queries, picks and labelling as a JSON HTTP API."""
+    cache_size = config["DEFAULT"].getint("query_cache_size", QUERY_CACHE_SIZE // 1024)
+    server.serve(get_db(), host, port, workers, cache_size * 1024)
+
+
+@morgy.command()
+@click.option(
+    "--host", default="0.0.0.0", help="The address to listen on, every one by default."
+)
+@click.option("--port", default=8081, help="The port to listen on.")
+def stream(host, port):
+    """Stream the songs to players on the network. Playlists are at
+    /playlist.m3u?selection=...&labels=...&spread=yes, see write-playlist."""
+    cache_size = config["DEFAULT"].getint("query_cache_size", QUERY_CACHE_SIZE // 1024)
+    streamer.serve(get_db(), host, port, cache_size * 1024)
+
+
+@morgy.command()
+@click.option("--output", default="-", help="The file to write the report to.")
+def dedupe(output):
+    """Find identical song files, even under different names."""
+    deduplicator = Deduplicator(get_db())
+    duplicates = deduplicator.find_duplicates()
+    with click.open_file(output, "w") as report:
+        deduplicator.write_report(duplicates, report)
+
+
 if __name__ == "__main__":
     morgy()
@@ -1,66 +1,718 @@
+import json
+import os
 import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+# columns added to details after its first version, old databases get them
+# when opened
+DETAILS_ADDED_COLUMNS = [
+    ("duration", "real"),
+    ("size", "int"),
+    ("partial_hash", "text"),
+    ("hash", "text"),
+    ("inode", "int"),
+]
+
+# connection settings, cache_size is in KiB, mmap_size in bytes and
+# busy_timeout, the time to wait for a lock held by another process, in seconds
+CACHE_SIZE = 64 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+BUSY_TIMEOUT = 30.0
+
+# rows of track_changes kept for PrefixIndex
+TRACK_CHANGES_KEPT = 10000
+
+# the tables whose changes start a new generation, see add_generation
+GENERATION_TABLES = ("tracks", "directories", "labels", "track_labels")
+
+# rows a fetchmany() without a size gets, the default is one
+FETCH_ROWS = 256
+
+# tracks store their directory once in directories, the details and guitar
+# views give back the full paths
+FULL_PATH = """CASE WHEN directories.path IN ('', '/')
+    THEN directories.path || tracks.filename
+    ELSE directories.path || '/' || tracks.filename END"""
+
+TRACK_ID = """SELECT tracks.id FROM tracks
+    JOIN directories ON directories.id = tracks.dir_id
+    WHERE directories.path = ? AND tracks.filename = ?"""
+
+DIRECTORY_ID = "SELECT id FROM directories WHERE path = ?"
+LABEL_ID = "SELECT id FROM labels WHERE name = ?"
+
+# live versions are the same song for the picker
+TITLE_KEY = "replace(title, ' (live)', '')"
+
+# the directory and everything between "directory/" and "directory0", as
+# "0" follows "/", which is a range of the unique index on directories.path
+SUBTREE_DIRECTORY_IDS = """SELECT id FROM directories
+    WHERE path = ? OR (path >= ? AND path < ?)"""
+
+
+def split_path(path):
+    """Return the (directory, filename) a path is stored as."""
+    return os.path.split(path)
+
+
+def subtree(directory):
+    """Return the parameters of SUBTREE_DIRECTORY_IDS."""
+    directory = directory.rstrip("/")
+    return [directory, directory + "/", directory + "0"]
 
 
 class Database:
-    def __init__(self, db_path):
+    def __init__(
+        self,
+        db_path,
+        cache_size=CACHE_SIZE,
+        mmap_size=MMAP_SIZE,
+        busy_timeout=BUSY_TIMEOUT,
+        read_only=False,
+    ):
         self._db_path = db_path
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self.read_only = read_only
+        # every thread gets its own connection, opened on first use and kept
+        # until close
+        self.local = threading.local()
+        # a read-only database leaves the schema to the writers
+        self.schema_is_ready = read_only
         self.open()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.conn.rollback()
+        self.close()
+
+    @property
+    def conn(self):
+        if getattr(self.local, "conn", None) is None:
+            self.open()
+        return self.local.conn
+
+    @property
+    def cursor(self):
+        if getattr(self.local, "conn", None) is None:
+            self.open()
+        return self.local.cursor
+
     def open(self):
-        self.conn = sqlite3.connect(self._db_path)
-        self.conn.execute("PRAGMA foreign_keys = 1")
-        self.cursor = self.conn.cursor()
-        self.create_new_tables()
+        """Open the connection of the calling thread. The schema is only
+        upgraded by the first one."""
+        if self.read_only:
+            conn = sqlite3.connect(
+                "file:{}?mode=ro".format(pathname2url(self._db_path)),
+                timeout=self.busy_timeout,
+                uri=True,
+            )
+            conn.execute("PRAGMA query_only = 1")
+        else:
+            conn = sqlite3.connect(self._db_path, timeout=self.busy_timeout)
+            # readers do not block the writer and the other way around, see
+            # https://www.sqlite.org/wal.html
+            conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA foreign_keys = 1")
+        # with WAL only a checkpoint syncs, committing stays cheap
+        conn.execute("PRAGMA synchronous = NORMAL")
+        # negative is in KiB instead of pages
+        conn.execute("PRAGMA cache_size = {:d}".format(-self.cache_size))
+        conn.execute("PRAGMA mmap_size = {:d}".format(self.mmap_size))
+        self.local.conn = conn
+        self.local.cursor = conn.cursor()
+        self.local.cursor.arraysize = FETCH_ROWS
+        self.local.transaction_depth = 0
+        if not self.schema_is_ready:
+            self.create_new_tables()
+            self.schema_is_ready = True
+
+    def reader(self):
+        """Return a read-only Database of the same file and settings."""
+        return Database(
+            self._db_path, self.cache_size, self.mmap_size, self.busy_timeout, True
+        )
+
+    def close(self):
+        """Close the connection of the calling thread, the next use opens a
+        new one."""
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
 
     def create_new_tables(self):
+        """Upgrade the schema from its PRAGMA user_version to the latest one
+        in a single transaction. Migration n brings version n to n + 1, so
+        new ones go to the end of the list."""
+        migrations = [
+            self.create_tracks,
+            self.add_indexes,
+            self.add_search,
+            self.add_track_changes,
+            self.add_clusters,
+            self.add_labels,
+            self.add_generation,
+            self.add_clustering,
+        ]
+        self.cursor.execute("PRAGMA user_version")
+        version = self.cursor.fetchone()[0]
+        if version >= len(migrations):
+            return
+        self.cursor.execute("BEGIN")
+        try:
+            for migration in migrations[version:]:
+                migration()
+            # views only select, they are simply recreated
+            self.cursor.execute("DROP VIEW IF EXISTS details")
+            self.cursor.execute("DROP VIEW IF EXISTS guitar")
+            self.create_views()
+            self.cursor.execute("PRAGMA user_version = {}".format(len(migrations)))
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        # the planner picks the new indexes based on these statistics
+        self.cursor.execute("ANALYZE")
+        self.conn.commit()
+
+    def create_tracks(self):
         self.cursor.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' or type='view'"
+            "SELECT name, type FROM sqlite_master WHERE type='table' or type='view'"
         )
-        existing_tables = self.cursor.fetchall()
-        if ("details",) not in existing_tables:
-            self.cursor.execute(
-                """CREATE TABLE details(
-                path text primary key not null,
-                artist text,
-                year int,
-                album text,
-                cd_number int,
-                number int,
-                title text not null,
-                priority int not null
-                )"""
+        existing_tables = dict(self.cursor.fetchall())
+        # databases of this version without user_version have it already
+        if "tracks" not in existing_tables:
+            # the listing cache of older versions, the next update refills it
+            self.cursor.execute("DROP TABLE IF EXISTS directories")
+            self.create_track_tables()
+            if existing_tables.get("details") == "table":
+                self.move_details_to_tracks(existing_tables)
+
+    def add_indexes(self):
+        # the first directory below the library root, see set_categories
+        self.cursor.execute("ALTER TABLE directories ADD COLUMN category text")
+        self.cursor.execute(
+            "CREATE INDEX directories_category ON directories(category)"
+        )
+        self.cursor.execute(
+            "CREATE INDEX tracks_title_key ON tracks({})".format(TITLE_KEY)
+        )
+        self.cursor.execute("CREATE INDEX tracks_priority ON tracks(priority)")
+        self.cursor.execute("CREATE INDEX tracks_artist ON tracks(artist)")
+
+    def add_search(self):
+        # an external content FTS5 table, the text is only stored in tracks;
+        # remove_diacritics 2 makes "kulfoldi" match "Külföldi" and also
+        # strips the double acute of ő and ű
+        self.cursor.execute(
+            """CREATE VIRTUAL TABLE tracks_search USING fts5(
+            artist, album, title,
+            content='tracks', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+            )"""
+        )
+        self.cursor.execute(
+            """CREATE TRIGGER tracks_search_insert AFTER INSERT ON tracks BEGIN
+            INSERT INTO tracks_search(rowid, artist, album, title)
+            VALUES (new.id, new.artist, new.album, new.title);
+            END"""
+        )
+        self.cursor.execute(
+            """CREATE TRIGGER tracks_search_delete AFTER DELETE ON tracks BEGIN
+            INSERT INTO tracks_search(tracks_search, rowid, artist, album, title)
+            VALUES ('delete', old.id, old.artist, old.album, old.title);
+            END"""
+        )
+        self.cursor.execute(
+            """CREATE TRIGGER tracks_search_update
+            AFTER UPDATE OF artist, album, title ON tracks BEGIN
+            INSERT INTO tracks_search(tracks_search, rowid, artist, album, title)
+            VALUES ('delete', old.id, old.artist, old.album, old.title);
+            INSERT INTO tracks_search(rowid, artist, album, title)
+            VALUES (new.id, new.artist, new.album, new.title);
+            END"""
+        )
+        self.cursor.execute(
+            "INSERT INTO tracks_search(tracks_search) VALUES ('rebuild')"
+        )
+
+    def add_track_changes(self):
+        # artists and titles gone (added = 0) or new (added = 1), read by
+        # PrefixIndex; only the last TRACK_CHANGES_KEPT are kept, who falls
+        # further behind reads everything again
+        self.cursor.execute(
+            """CREATE TABLE track_changes(
+            id integer primary key,
+            artist text,
+            title text,
+            added int not null
+            )"""
+        )
+        self.cursor.execute(
+            """CREATE TRIGGER track_changes_trim AFTER INSERT ON track_changes BEGIN
+            DELETE FROM track_changes WHERE id <= new.id - {:d};
+            END""".format(
+                TRACK_CHANGES_KEPT
             )
-            self.conn.commit()
-        if ("guitar",) not in existing_tables:
-            self.cursor.execute(
-                """CREATE TABLE guitar(
-                path text primary key not null,
-                guitar int,
-                FOREIGN KEY(path) REFERENCES details(path) ON DELETE CASCADE
-                )"""
+        )
+        self.cursor.execute(
+            """CREATE TRIGGER track_changes_insert AFTER INSERT ON tracks BEGIN
+            INSERT INTO track_changes(artist, title, added)
+            VALUES (new.artist, new.title, 1);
+            END"""
+        )
+        self.cursor.execute(
+            """CREATE TRIGGER track_changes_delete AFTER DELETE ON tracks BEGIN
+            INSERT INTO track_changes(artist, title, added)
+            VALUES (old.artist, old.title, 0);
+            END"""
+        )
+        self.cursor.execute(
+            """CREATE TRIGGER track_changes_update
+            AFTER UPDATE OF artist, title ON tracks BEGIN
+            INSERT INTO track_changes(artist, title, added)
+            VALUES (old.artist, old.title, 0);
+            INSERT INTO track_changes(artist, title, added)
+            VALUES (new.artist, new.title, 1);
+            END"""
+        )
+
+    def add_clusters(self):
+        # the smallest track id of the titles that are the same song, see
+        # TitleClusterer
+        self.cursor.execute("ALTER TABLE tracks ADD COLUMN cluster int")
+        self.cursor.execute("CREATE INDEX tracks_cluster ON tracks(cluster)")
+
+    def add_labels(self):
+        self.cursor.execute(
+            "CREATE TABLE labels(id integer primary key, name text unique not null)"
+        )
+        self.cursor.execute(
+            """CREATE TABLE track_labels(
+            label_id int not null REFERENCES labels(id) ON DELETE CASCADE,
+            track_id int not null REFERENCES tracks(id) ON DELETE CASCADE,
+            PRIMARY KEY(label_id, track_id)
+            ) WITHOUT ROWID"""
+        )
+        self.cursor.execute(
+            "CREATE INDEX track_labels_track ON track_labels(track_id)"
+        )
+        # guitar marks are the guitar label from now on
+        self.cursor.execute("INSERT INTO labels(name) VALUES ('guitar')")
+        self.cursor.execute(
+            """INSERT INTO track_labels
+            SELECT ({}), track_id FROM guitar_marks WHERE guitar""".format(LABEL_ID),
+            ["guitar"],
+        )
+        self.cursor.execute("DROP TABLE guitar_marks")
+
+    def add_generation(self):
+        # a counter going up with every change of the library, results read
+        # at the same generation are still valid, see QueryCache
+        self.cursor.execute("CREATE TABLE generation(value int not null)")
+        self.cursor.execute("INSERT INTO generation VALUES (0)")
+        for table in GENERATION_TABLES:
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                self.cursor.execute(
+                    """CREATE TRIGGER {0}_generation_{1} AFTER {2} ON {0} BEGIN
+                    UPDATE generation SET value = value + 1;
+                    END""".format(
+                        table, event.lower(), event
+                    )
+                )
+
+    def add_clustering(self):
+        # the last track change and the settings of the stored clusters,
+        # TitleClusterer only clusters again when either differs
+        self.cursor.execute(
+            "CREATE TABLE clustering(last_change int not null, settings text not null)"
+        )
+        # the picker groups by cluster, the title key is only the fallback
+        # of tracks not clustered yet and needs no order
+        self.cursor.execute("DROP INDEX tracks_title_key")
+
+    def create_track_tables(self):
+        self.cursor.execute(
+            """CREATE TABLE directories(
+            id integer primary key,
+            path text unique not null,
+            mtime int,
+            entries int
+            )"""
+        )
+        self.cursor.execute(
+            """CREATE TABLE tracks(
+            id integer primary key,
+            dir_id int not null REFERENCES directories(id),
+            filename text not null,
+            artist text,
+            year int,
+            album text,
+            cd_number int,
+            number int,
+            title text not null,
+            priority int not null,
+            duration real,
+            size int,
+            partial_hash text,
+            hash text,
+            inode int,
+            UNIQUE(dir_id, filename)
+            )"""
+        )
+        self.cursor.execute("CREATE INDEX tracks_size ON tracks(size)")
+        self.cursor.execute("CREATE INDEX tracks_inode ON tracks(inode)")
+        # int, not integer: a missing track must not get a new rowid
+        self.cursor.execute(
+            """CREATE TABLE guitar_marks(
+            track_id int primary key not null
+            REFERENCES tracks(id) ON DELETE CASCADE,
+            guitar int
+            )"""
+        )
+
+    def create_views(self):
+        self.cursor.execute(
+            """CREATE VIEW details AS SELECT
+            {} AS path,
+            artist, year, album, cd_number, number, title, priority,
+            duration, size, partial_hash, hash, inode, category
+            FROM tracks JOIN directories ON directories.id = tracks.dir_id""".format(
+                FULL_PATH
             )
-            self.conn.commit()
+        )
+        self.cursor.execute(
+            """CREATE VIEW guitar AS SELECT {} AS path, 1 AS guitar
+            FROM track_labels
+            JOIN labels ON labels.id = track_labels.label_id
+            JOIN tracks ON tracks.id = track_labels.track_id
+            JOIN directories ON directories.id = tracks.dir_id
+            WHERE labels.name = 'guitar'""".format(
+                FULL_PATH
+            )
+        )
+
+    def move_details_to_tracks(self, existing_tables):
+        """Copy the details and guitar tables of older versions, which store
+        full paths, to tracks and guitar_marks."""
+        self.cursor.execute("PRAGMA table_info(details)")
+        columns = [column[1] for column in self.cursor.fetchall()]
+        for column, column_type in DETAILS_ADDED_COLUMNS:
+            if column not in columns:
+                self.cursor.execute(
+                    "ALTER TABLE details ADD COLUMN {} {}".format(column, column_type)
+                )
+        self.cursor.execute("SELECT path FROM details")
+        paths = [result[0] for result in self.cursor.fetchall()]
+        self.cursor.executemany(
+            "INSERT OR IGNORE INTO directories(path) VALUES (?)",
+            {(split_path(path)[0],) for path in paths},
+        )
+        self.cursor.executemany(
+            """INSERT INTO tracks(
+            dir_id, filename, artist, year, album, cd_number, number, title,
+            priority, duration, size, partial_hash, hash, inode
+            ) SELECT ({}), ?, artist, year, album, cd_number, number, title,
+            priority, duration, size, partial_hash, hash, inode
+            FROM details WHERE path = ?""".format(
+                DIRECTORY_ID
+            ),
+            [(*split_path(path), path) for path in paths],
+        )
+        if "guitar" in existing_tables:
+            self.cursor.execute("SELECT path, guitar FROM guitar")
+            self.cursor.executemany(
+                "INSERT INTO guitar_marks VALUES (({}), ?)".format(TRACK_ID),
+                [(*split_path(path), guitar) for path, guitar in self.cursor.fetchall()],
+            )
+            self.cursor.execute("DROP TABLE guitar")
+        self.cursor.execute("DROP TABLE details")
+
+    def commit(self):
+        """Commit, unless inside a transaction block, which commits at its
+        end."""
+        conn = self.conn
+        if self.local.transaction_depth == 0:
+            conn.commit()
 
-    # FIXME: Do we use it? Do we want to?
     def commit_and_close(self):
-        self.conn.commit()
-        self.conn.close()
+        self.commit()
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        """Make the writes of the block, including the commits of the
+        methods called in it, one transaction: committed at the end of the
+        outermost block, rolled back if an exception leaves it."""
+        conn = self.conn
+        if self.local.transaction_depth == 0 and not conn.in_transaction:
+            conn.execute("BEGIN")
+        self.local.transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self.local.transaction_depth -= 1
+            if self.local.transaction_depth == 0:
+                conn.rollback()
+            raise
+        self.local.transaction_depth -= 1
+        if self.local.transaction_depth == 0:
+            conn.commit()
 
     def add_detail_row(
-        self, path, artist, year, album, cd_number, number, title, priority
+        self,
+        path,
+        artist,
+        year,
+        album,
+        cd_number,
+        number,
+        title,
+        priority,
+        duration=None,
+        size=None,
+        inode=None,
     ):
-        values = [path, artist, year, album, cd_number, number, title, priority]
+        directory, filename = split_path(path)
+        values = [
+            directory,
+            filename,
+            artist,
+            year,
+            album,
+            cd_number,
+            number,
+            title,
+            priority,
+            duration,
+            size,
+            inode,
+        ]
         try:
-            self.cursor.execute("INSERT INTO details VALUES (?,?,?,?,?,?,?,?)", values)
-            self.conn.commit()
+            self.add_directories([directory])
+            self.cursor.execute(
+                """INSERT INTO tracks(
+                dir_id, filename, artist, year, album, cd_number, number, title,
+                priority, duration, size, inode
+                ) VALUES (({}),?,?,?,?,?,?,?,?,?,?,?)""".format(DIRECTORY_ID),
+                values,
+            )
+            self.commit()
         # FIXME: is this the best behaviour?
         except sqlite3.IntegrityError:
             print("most likely has already been added")
 
+    def add_detail_rows(self, rows):
+        """Insert many (path, artist, year, album, cd_number, number, title,
+        priority, duration, size, inode) rows in one transaction, skipping
+        known paths."""
+        rows = [(*split_path(row[0]), *row[1:]) for row in rows]
+        self.add_directories({row[0] for row in rows})
+        self.cursor.executemany(
+            """INSERT OR IGNORE INTO tracks(
+            dir_id, filename, artist, year, album, cd_number, number, title,
+            priority, duration, size, inode
+            ) VALUES (({}),?,?,?,?,?,?,?,?,?,?,?)""".format(DIRECTORY_ID),
+            rows,
+        )
+        self.commit()
+
+    def update_detail_rows(self, rows):
+        """Rewrite the details of known paths from rows like those of
+        add_detail_rows, keeping their priority and labels. The hashes are
+        of the old content, they are computed again when needed."""
+        self.cursor.executemany(
+            """UPDATE tracks SET
+            artist = ?, year = ?, album = ?, cd_number = ?, number = ?, title = ?,
+            duration = ?, size = ?, inode = ?, partial_hash = NULL, hash = NULL
+            WHERE id = ({})""".format(
+                TRACK_ID
+            ),
+            [(*row[1:7], *row[8:], *split_path(row[0])) for row in rows],
+        )
+        self.commit()
+
+    def add_directories(self, directories):
+        self.cursor.executemany(
+            "INSERT OR IGNORE INTO directories(path) VALUES (?)",
+            [[directory] for directory in directories],
+        )
+
+    def has_path(self, path):
+        self.cursor.execute(TRACK_ID, split_path(path))
+        return self.cursor.fetchone() is not None
+
+    def get_paths_with_inode(self, inode, size):
+        self.cursor.execute(
+            "SELECT path FROM details WHERE inode = ? AND size = ?", [inode, size]
+        )
+        return [result[0] for result in self.cursor.fetchall()]
+
+    def get_partial_hashes_with_size(self, size):
+        self.cursor.execute(
+            """SELECT path, partial_hash FROM details
+            WHERE size = ? AND partial_hash IS NOT NULL""",
+            [size],
+        )
+        return self.cursor.fetchall()
+
+    def move_entry(
+        self,
+        old_path,
+        path,
+        artist,
+        year,
+        album,
+        cd_number,
+        number,
+        title,
+        duration,
+        size,
+        inode,
+    ):
+        """Point the entry of old_path to path, keeping its priority and
+        guitar mark."""
+        directory, filename = split_path(path)
+        values = [
+            directory,
+            filename,
+            artist,
+            year,
+            album,
+            cd_number,
+            number,
+            title,
+            duration,
+            size,
+            inode,
+            *split_path(old_path),
+        ]
+        self.add_directories([directory])
+        self.cursor.execute(
+            """UPDATE tracks SET
+            dir_id = ({}), filename = ?, artist = ?, year = ?, album = ?,
+            cd_number = ?, number = ?, title = ?, duration = ?, size = ?, inode = ?
+            WHERE id = ({})""".format(
+                DIRECTORY_ID, TRACK_ID
+            ),
+            values,
+        )
+        self.commit()
+
     def add_guitar_row(self, path, guitar):
-        values = [path, guitar]
-        self.cursor.execute("INSERT INTO guitar VALUES (?,?)", values)
-        self.conn.commit()
+        if guitar:
+            self.add_label_row(path, "guitar")
+
+    def add_label_row(self, path, name):
+        self.cursor.execute("INSERT OR IGNORE INTO labels(name) VALUES (?)", [name])
+        self.cursor.execute(
+            "INSERT INTO track_labels VALUES (({}), ({}))".format(LABEL_ID, TRACK_ID),
+            [name, *split_path(path)],
+        )
+        self.commit()
+
+    def get_track_ids_of_paths(self, paths):
+        """Return the ids of the tracks of paths, found in one query, and
+        the paths without a track."""
+        self.cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS wanted_paths(directory text, filename text)"
+        )
+        self.cursor.execute("DELETE FROM wanted_paths")
+        self.cursor.executemany(
+            "INSERT INTO wanted_paths VALUES (?, ?)", [split_path(path) for path in paths]
+        )
+        self.cursor.execute(
+            """SELECT wanted_paths.directory, wanted_paths.filename, tracks.id
+            FROM wanted_paths
+            LEFT JOIN directories ON directories.path = wanted_paths.directory
+            LEFT JOIN tracks ON tracks.dir_id = directories.id
+            AND tracks.filename = wanted_paths.filename"""
+        )
+        track_ids = list()
+        missing = list()
+        for directory, filename, track_id in self.cursor.fetchall():
+            if track_id is None:
+                missing.append(os.path.join(directory, filename))
+            else:
+                track_ids.append(track_id)
+        self.cursor.execute("DELETE FROM wanted_paths")
+        return track_ids, missing
+
+    def get_path_of_track(self, track_id):
+        """Return the path of the track with id track_id, None if there is
+        none."""
+        self.cursor.execute(
+            """SELECT {} FROM tracks
+            JOIN directories ON directories.id = tracks.dir_id
+            WHERE tracks.id = ?""".format(
+                FULL_PATH
+            ),
+            [track_id],
+        )
+        result = self.cursor.fetchone()
+        return result[0] if result else None
+
+    def get_track_ids_under(self, directory):
+        self.cursor.execute(
+            "SELECT id FROM tracks WHERE dir_id IN ({})".format(SUBTREE_DIRECTORY_IDS),
+            subtree(directory),
+        )
+        return [result[0] for result in self.cursor.fetchall()]
+
+    def label_tracks(self, name, track_ids):
+        """Label the tracks, return the number of those not labelled yet."""
+        self.cursor.execute("INSERT OR IGNORE INTO labels(name) VALUES (?)", [name])
+        self.cursor.executemany(
+            "INSERT OR IGNORE INTO track_labels VALUES (({}), ?)".format(LABEL_ID),
+            [(name, track_id) for track_id in track_ids],
+        )
+        return self.cursor.rowcount
+
+    def unlabel_tracks(self, name, track_ids):
+        """Unlabel the tracks, return the number of those labelled."""
+        self.cursor.executemany(
+            "DELETE FROM track_labels WHERE label_id = ({}) AND track_id = ?".format(
+                LABEL_ID
+            ),
+            [(name, track_id) for track_id in track_ids],
+        )
+        return self.cursor.rowcount
+
+    def get_labels(self):
+        self.cursor.execute("SELECT name FROM labels ORDER BY name")
+        return [result[0] for result in self.cursor.fetchall()]
+
+    def get_label_track_ids(self):
+        """Yield (label, track id) pairs ordered by label."""
+        self.cursor.execute(
+            """SELECT labels.name, track_labels.track_id FROM track_labels
+            JOIN labels ON labels.id = track_labels.label_id
+            ORDER BY track_labels.label_id"""
+        )
+        while True:
+            results = self.cursor.fetchmany()
+            if not results:
+                break
+            for result in results:
+                yield result
+
+    def get_track_ids(self):
+        self.cursor.execute("SELECT id FROM tracks")
+        while True:
+            results = self.cursor.fetchmany()
+            if not results:
+                break
+            for result in results:
+                yield result[0]
 
     def get_all_guitar_paths(self):
         self.cursor.execute("SELECT path FROM guitar")
@@ -80,6 +732,156 @@ class Database:
             for result in results:
                 yield result
 
+    def get_cluster_path_and_prio(self, track_ids=None):
+        """Like get_title_path_and_prio, with the cluster id of the
+        clustered tracks instead of their title, and the title key of the
+        others. Only the tracks in track_ids if given."""
+        self.cursor.execute(
+            """SELECT tracks.id, coalesce(cluster, {}), {}, priority FROM tracks
+            JOIN directories ON directories.id = tracks.dir_id""".format(
+                TITLE_KEY, FULL_PATH
+            )
+        )
+        while True:
+            results = self.cursor.fetchmany()
+            if not results:
+                break
+            for result in results:
+                if track_ids is None or result[0] in track_ids:
+                    yield result[1:]
+
+    def get_path_artist_and_album(self):
+        self.cursor.execute("SELECT path, artist, album FROM details")
+        while True:
+            results = self.cursor.fetchmany()
+            if not results:
+                break
+            for result in results:
+                yield result
+
+    def get_titles_and_clusters(self):
+        self.cursor.execute("SELECT id, artist, title, cluster FROM tracks")
+        while True:
+            results = self.cursor.fetchmany()
+            if not results:
+                break
+            for result in results:
+                yield result
+
+    def set_clusters(self, clusters):
+        """clusters are (cluster, track id) pairs."""
+        self.cursor.executemany("UPDATE tracks SET cluster = ? WHERE id = ?", clusters)
+
+    def get_clustering(self):
+        """Return (last track change, settings) of the stored clusters, None
+        before the first clustering."""
+        self.cursor.execute("SELECT last_change, settings FROM clustering")
+        return self.cursor.fetchone()
+
+    def set_clustering(self, last_change, settings):
+        self.cursor.execute("DELETE FROM clustering")
+        self.cursor.execute(
+            "INSERT INTO clustering VALUES (?, ?)", [last_change, settings]
+        )
+
+    def get_path_and_duration(self):
+        self.cursor.execute("SELECT path, duration FROM details")
+        while True:
+            results = self.cursor.fetchmany()
+            if not results:
+                break
+            for result in results:
+                yield result
+
+    def get_paths_without_size(self):
+        self.cursor.execute("SELECT path FROM details WHERE size IS NULL")
+        return [result[0] for result in self.cursor.fetchall()]
+
+    def get_same_size_rows(self):
+        """Return (path, size, partial_hash, hash) of the files whose size is
+        not unique, ordered by size."""
+        self.cursor.execute(
+            """SELECT path, size, partial_hash, hash FROM details
+            WHERE size IN (
+                SELECT size FROM details WHERE size IS NOT NULL
+                GROUP BY size HAVING COUNT(*) > 1
+            )
+            ORDER BY size"""
+        )
+        while True:
+            results = self.cursor.fetchmany()
+            if not results:
+                break
+            for result in results:
+                yield result
+
+    def set_sizes(self, sizes_and_paths):
+        self.conn.executemany(
+            "UPDATE tracks SET size = ? WHERE id = ({})".format(TRACK_ID),
+            [(size, *split_path(path)) for size, path in sizes_and_paths],
+        )
+        self.commit()
+
+    def set_hashes(self, hashes_and_paths):
+        """Store (partial_hash, hash, path) rows, None keeps the old value."""
+        self.conn.executemany(
+            """UPDATE tracks SET
+            partial_hash = coalesce(?, partial_hash), hash = coalesce(?, hash)
+            WHERE id = ({})""".format(
+                TRACK_ID
+            ),
+            [
+                (partial_hash, full_hash, *split_path(path))
+                for partial_hash, full_hash, path in hashes_and_paths
+            ],
+        )
+        self.commit()
+
+    def get_directories(self):
+        self.cursor.execute("SELECT path, mtime, entries FROM directories")
+        return {path: (mtime, entries) for path, mtime, entries in self.cursor}
+
+    def set_directories(self, rows):
+        """Store (path, mtime, entries) of listed directories."""
+        self.cursor.executemany(
+            """INSERT INTO directories(path, mtime, entries) VALUES (?,?,?)
+            ON CONFLICT(path) DO UPDATE SET
+            mtime = excluded.mtime, entries = excluded.entries""",
+            rows,
+        )
+        self.commit()
+
+    def delete_directories(self, paths):
+        """Forget the directories and everything below them. Those that
+        still have tracks are kept without mtime."""
+        subtrees = [subtree(path) for path in paths]
+        self.cursor.executemany(
+            """DELETE FROM directories WHERE id IN ({})
+            AND NOT EXISTS (SELECT 1 FROM tracks WHERE dir_id = directories.id)""".format(
+                SUBTREE_DIRECTORY_IDS
+            ),
+            subtrees,
+        )
+        self.cursor.executemany(
+            """UPDATE directories SET mtime = NULL, entries = NULL
+            WHERE id IN ({})""".format(
+                SUBTREE_DIRECTORY_IDS
+            ),
+            subtrees,
+        )
+        self.commit()
+
+    def get_directories_without_category(self):
+        self.cursor.execute("SELECT path FROM directories WHERE category IS NULL")
+        return [result[0] for result in self.cursor.fetchall()]
+
+    def set_categories(self, categories_and_paths):
+        self.cursor.executemany(
+            "UPDATE directories SET category = ? WHERE path = ?",
+            categories_and_paths,
+        )
+        self.commit()
+
     def get_rows_from_table(self, table):
         self.cursor.execute("SELECT * FROM {}".format(table))
         while True:
@@ -90,7 +892,8 @@ class Database:
                 yield result
 
     def get_path_where(self, where):
-        # FIXME: SQLi
+        # only for SQL written by us, user input goes through
+        # get_paths_matching
         self.cursor.execute("SELECT path FROM details WHERE {}".format(where))
         while True:
             results = self.cursor.fetchmany()
@@ -99,18 +902,169 @@ class Database:
             for result in results:
                 yield result
 
+    def get_paths_matching(self, selection, track_ids=None):
+        """Yield the paths matching a Selection, only those in track_ids if
+        given."""
+        where = selection.where()
+        parameters = selection.parameters()
+        if track_ids is not None:
+            # a JSON array is one parameter whatever its length, and works on
+            # read-only connections where temporary tables do not
+            where = "({}) AND tracks.id IN (SELECT value FROM json_each(?))".format(where)
+            parameters = parameters + [json.dumps(sorted(track_ids))]
+        self.cursor.execute(
+            """SELECT {} FROM tracks
+            JOIN directories ON directories.id = tracks.dir_id
+            WHERE {}""".format(
+                FULL_PATH, where
+            ),
+            parameters,
+        )
+        while True:
+            results = self.cursor.fetchmany()
+            if not results:
+                break
+            for result in results:
+                yield result[0]
+
+    def get_playlist_entries(self, selections):
+        """Yield (track id, path, artist, album, title, duration, matches)
+        of the tracks matching any of the Selections in one pass, matches
+        telling which of them they match."""
+        wheres = ["({})".format(selection.where()) for selection in selections]
+        parameters = [
+            parameter for selection in selections for parameter in selection.parameters()
+        ]
+        self.cursor.execute(
+            """SELECT tracks.id, {}, artist, album, title, duration, {} FROM tracks
+            JOIN directories ON directories.id = tracks.dir_id
+            WHERE {}""".format(
+                FULL_PATH, ", ".join(wheres), " OR ".join(wheres)
+            ),
+            parameters * 2,
+        )
+        while True:
+            results = self.cursor.fetchmany()
+            if not results:
+                break
+            for result in results:
+                yield result[:6] + (result[6:],)
+
+    def search(self, query, limit=20):
+        """Return (path, artist, album, title) of the best matches of the
+        words of query in artist, album and title. Accents and case do not
+        matter and the words may be prefixes, so "kulf" finds "Külföldi"."""
+        words = ['"{}"*'.format(word.replace('"', '""')) for word in query.split()]
+        if not words:
+            return list()
+        self.cursor.execute(
+            """SELECT {}, tracks.artist, tracks.album, tracks.title
+            FROM tracks_search
+            JOIN tracks ON tracks.id = tracks_search.rowid
+            JOIN directories ON directories.id = tracks.dir_id
+            WHERE tracks_search MATCH ?
+            ORDER BY bm25(tracks_search, 2.0, 1.0, 4.0)
+            LIMIT ?""".format(
+                FULL_PATH
+            ),
+            [" ".join(words), limit],
+        )
+        return self.cursor.fetchall()
+
+    def get_artists_and_titles(self):
+        self.cursor.execute("SELECT artist, title FROM tracks")
+        while True:
+            results = self.cursor.fetchmany()
+            if not results:
+                break
+            for result in results:
+                yield result
+
+    def get_generation(self):
+        self.cursor.execute("SELECT value FROM generation")
+        return self.cursor.fetchone()[0]
+
+    def get_last_track_change(self):
+        self.cursor.execute("SELECT coalesce(max(id), 0) FROM track_changes")
+        return self.cursor.fetchone()[0]
+
+    def get_track_changes(self, since):
+        """Return (id, artist, title, added) of the changes after the one
+        with id since, or None if some of them are not kept any more."""
+        # the change since itself, or the first one ever, proves that
+        # nothing in between was trimmed
+        first = max(since, 1)
+        self.cursor.execute(
+            """SELECT id, artist, title, added FROM track_changes
+            WHERE id >= ? ORDER BY id""",
+            [first],
+        )
+        changes = self.cursor.fetchall()
+        if changes and changes[0][0] != first:
+            return None
+        if not changes and since:
+            return None
+        return [change for change in changes if change[0] > since]
+
     def decrease_prio(self, path):
-        path = [path]
+        self.decrease_prios([path])
+
+    def decrease_prios(self, paths):
+        self.cursor.executemany(
+            """UPDATE tracks SET priority = priority - 1
+            WHERE id = ({}) AND priority > 1""".format(
+                TRACK_ID
+            ),
+            [split_path(path) for path in paths],
+        )
+
+    def decrease_prio_under(self, directory):
         self.cursor.execute(
-            "UPDATE details SET priority = priority - 1 WHERE path LIKE (?) AND priority > 1",
-            path,
+            """UPDATE tracks SET priority = priority - 1
+            WHERE dir_id IN ({}) AND priority > 1""".format(
+                SUBTREE_DIRECTORY_IDS
+            ),
+            subtree(directory),
         )
 
     def delete_entry_with_path(self, path):
-        path = [path]
-        self.cursor.execute("DELETE FROM details WHERE path LIKE (?)", path)
+        self.delete_entries_with_paths([path])
+
+    def delete_entries_with_paths(self, paths):
+        self.cursor.executemany(
+            "DELETE FROM tracks WHERE id = ({})".format(TRACK_ID),
+            [split_path(path) for path in paths],
+        )
+
+    def delete_entries_under(self, directory):
+        self.cursor.execute(
+            "DELETE FROM tracks WHERE dir_id IN ({})".format(SUBTREE_DIRECTORY_IDS),
+            subtree(directory),
+        )
 
     def delete_entry_with_path_from_guitar(self, path):
-        path = [path]
-        self.cursor.execute("DELETE FROM guitar WHERE path LIKE (?)", path)
-        self.conn.commit()
+        self.delete_label_row(path, "guitar")
+
+    def delete_entries_from_guitar_under(self, directory):
+        self.delete_labels_under(directory, "guitar")
+
+    def delete_label_row(self, path, name):
+        self.cursor.execute(
+            """DELETE FROM track_labels
+            WHERE label_id = ({}) AND track_id = ({})""".format(
+                LABEL_ID, TRACK_ID
+            ),
+            [name, *split_path(path)],
+        )
+        self.commit()
+
+    def delete_labels_under(self, directory, name):
+        self.cursor.execute(
+            """DELETE FROM track_labels WHERE label_id = ({}) AND track_id IN (
+            SELECT id FROM tracks WHERE dir_id IN ({})
+            )""".format(
+                LABEL_ID, SUBTREE_DIRECTORY_IDS
+            ),
+            [name, *subtree(directory)],
+        )
+        self.commit()
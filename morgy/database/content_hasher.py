@@ -0,0 +1,28 @@
+import hashlib
+
+# the partial hash covers this much from both ends of the file
+PARTIAL_HASH_CHUNK = 64 * 1024
+FULL_HASH_BLOCK = 1024 * 1024
+
+
+class ContentHasher:
+    def partial_hash(self, path, size):
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            digest.update(f.read(PARTIAL_HASH_CHUNK))
+            if size > PARTIAL_HASH_CHUNK:
+                f.seek(max(size - PARTIAL_HASH_CHUNK, PARTIAL_HASH_CHUNK))
+                digest.update(f.read(PARTIAL_HASH_CHUNK))
+        return digest.hexdigest()
+
+    def is_covered_by_partial_hash(self, size):
+        return size <= 2 * PARTIAL_HASH_CHUNK
+
+    def full_hash(self, path):
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            block = f.read(FULL_HASH_BLOCK)
+            while block:
+                digest.update(block)
+                block = f.read(FULL_HASH_BLOCK)
+        return digest.hexdigest()
@@ -1,54 +1,41 @@
-import os
+from functools import lru_cache
 
+from morgy.database.library_layout import LibraryLayout
 
-class DetailFetcher:
-    def split_to_dirs(self, path):
-        dirs = list()
-        while not path.endswith("00 All"):
-            path, directory = os.path.split(path)
-            dirs.append(directory)
-        return dirs
-
-    def fetch_detail(self, dirpath, name):
-        dirs = self.split_to_dirs(dirpath)
-        artist = None
-        year = None
-        album = None
-        cd_number = None
-        number = None
-
-        # 00 All/03 Külföldi Blues, Rock, Metal/Mark Knopfler/1996 Live in Copenhagen/CD1/12 Sultans of swing.mp3
-        if len(dirs) == 4:
-            cd_number = dirs[0][-1]
-            dirs = dirs[1:]
 
-        # 00 All/01 Külföldi Punk/Millencolin/1994 Same old tunes/06 Leona.mp3
-        if len(dirs) == 3:
-            if name[:2].isdigit():
-                number = name[:2]
-                title = name[3:]
-            else:
-                title = name
-
-            if dirs[0][:4].isdigit():
-                year = dirs[0][:4]
-                album = dirs[0][5:]
-            else:
-                album = dirs[0]
-            artist = dirs[1]
+class DetailFetcher:
+    def __init__(self, layout=None, cache_size=4096):
+        self.layout = layout if layout is not None else LibraryLayout()
+        # every file of an album shares the same directories, so the
+        # directory-level details are parsed only once per dirpath
+        self.parse_dirs = lru_cache(maxsize=cache_size)(self.parse_dirs)
 
-        # 00 All/07 Indie, játékzenék/THPS 2/Papa roach - Blood brothers.mp3
-        elif len(dirs) == 2 and " - " in name:
-            artist, title = name.split(" - ")
+    def split_to_dirs(self, path):
+        return self.layout.split_to_dirs(path)
 
-        elif len(dirs) == 2:
-            # 00 All/03 Külföldi Blues, Rock, Metal/Metallica/13 Enter sandman.mp3
-            # 00 All/01 Külföldi Punk/Alkaline Trio/Private eye.mp3
-            # special: 00 All/01 Külföldi Punk/CKY/96 quite bitter beings.mp3
-            title = name[3:] if name[:2].isdigit() and int(name[:2]) < 90 else name
-            artist = dirs[0]
+    def parse_dirs(self, dirpath):
+        return self.layout.match_dirs(self.split_to_dirs(dirpath))
 
-        else:
-            title = name
+    def fetch_category(self, dirpath):
+        for dir_fields, _ in self.parse_dirs(dirpath):
+            if dir_fields.get("category") is not None:
+                return dir_fields["category"]
+        return None
 
-        return (artist, year, album, cd_number, number, title)
+    def fetch_detail(self, dirpath, name):
+        for dir_fields, file_regex in self.parse_dirs(dirpath):
+            match = file_regex.fullmatch(name)
+            if match:
+                details = dict(dir_fields)
+                for field, value in match.groupdict().items():
+                    if value is not None:
+                        details[field] = value
+                return (
+                    details.get("artist"),
+                    details.get("year"),
+                    details.get("album"),
+                    details.get("cd_number"),
+                    details.get("number"),
+                    details["title"],
+                )
+        return (None, None, None, None, None, name)
@@ -0,0 +1,135 @@
+import re
+
+TOKEN = re.compile(r"\s*(?:(\()|(\))|([\w-]+))")
+OPERATORS = ("and", "or", "not")
+NAME = re.compile(r"[\w-]+")
+# the set bits of every byte value
+BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def is_name(name):
+    """Whether name can be used as a label in expressions."""
+    return bool(NAME.fullmatch(name)) and name.lower() not in OPERATORS
+
+
+def to_bitmap(track_ids):
+    """An int with the bits of the track ids set."""
+    track_ids = list(track_ids)
+    if not track_ids:
+        return 0
+    bitmap = bytearray(max(track_ids) // 8 + 1)
+    for track_id in track_ids:
+        bitmap[track_id >> 3] |= 1 << (track_id & 7)
+    return int.from_bytes(bitmap, "little")
+
+
+def from_bitmap(bitmap):
+    """The track ids of the set bits of bitmap in order."""
+    track_ids = list()
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for index, byte in enumerate(data):
+        if byte:
+            base = index * 8
+            track_ids.extend(base + bit for bit in BYTE_BITS[byte])
+    return track_ids
+
+
+def tokenize(expression):
+    tokens = list()
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN.match(expression, position)
+        if not match:
+            raise ValueError("Unexpected {!r} in {!r}".format(expression[position:], expression))
+        tokens.append(match.group(match.lastindex))
+        position = match.end()
+    return tokens
+
+
+def normalise(expression):
+    """The expression with single spaces and lower case operators, equal for
+    the ways of writing the same one."""
+    return " ".join(
+        token.lower() if token.lower() in OPERATORS else token
+        for token in tokenize(expression)
+    )
+
+
+class LabelIndex:
+    """The tracks of every label as a bitmap in memory, bit n standing for
+    the track with id n, so label expressions like
+
+        guitar AND NOT (christmas OR kids)
+
+    are a few operations on Python ints. Operators are AND, OR and NOT in
+    any case, NOT binding the strongest and OR the weakest. The bitmaps are
+    read from the database on first use and again once its generation has
+    changed, see Database.add_generation."""
+
+    def __init__(self, db):
+        self.db = db
+        self.bitmaps = None
+        self.all_tracks = 0
+        self.generation = None
+
+    def is_stale(self):
+        return self.bitmaps is None or self.db.get_generation() != self.generation
+
+    def reload(self):
+        # read first, a change while loading makes the bitmaps stale
+        self.generation = self.db.get_generation()
+        track_ids = dict()
+        for label, track_id in self.db.get_label_track_ids():
+            track_ids.setdefault(label, list()).append(track_id)
+        self.bitmaps = {label: to_bitmap(ids) for label, ids in track_ids.items()}
+        for label in self.db.get_labels():
+            self.bitmaps.setdefault(label, 0)
+        self.all_tracks = to_bitmap(self.db.get_track_ids())
+
+    def evaluate(self, expression):
+        """Return the bitmap of the tracks matching expression."""
+        if self.is_stale():
+            self.reload()
+        tokens = tokenize(expression)
+        if not tokens:
+            raise ValueError("Empty label expression")
+        bitmap, position = self.parse_or(tokens, 0)
+        if position != len(tokens):
+            raise ValueError("Unexpected {!r} in {!r}".format(tokens[position], expression))
+        return bitmap
+
+    def track_ids(self, expression):
+        return set(from_bitmap(self.evaluate(expression)))
+
+    def parse_or(self, tokens, position):
+        bitmap, position = self.parse_and(tokens, position)
+        while position < len(tokens) and tokens[position].lower() == "or":
+            other, position = self.parse_and(tokens, position + 1)
+            bitmap = bitmap | other
+        return bitmap, position
+
+    def parse_and(self, tokens, position):
+        bitmap, position = self.parse_not(tokens, position)
+        while position < len(tokens) and tokens[position].lower() == "and":
+            other, position = self.parse_not(tokens, position + 1)
+            bitmap = bitmap & other
+        return bitmap, position
+
+    def parse_not(self, tokens, position):
+        if position >= len(tokens):
+            raise ValueError("Label expression ends too early")
+        token = tokens[position]
+        if token.lower() == "not":
+            bitmap, position = self.parse_not(tokens, position + 1)
+            return self.all_tracks & ~bitmap, position
+        if token == "(":
+            bitmap, position = self.parse_or(tokens, position + 1)
+            if position >= len(tokens) or tokens[position] != ")":
+                raise ValueError("Missing )")
+            return bitmap, position + 1
+        if token == ")" or token.lower() in OPERATORS:
+            raise ValueError("Unexpected {!r}".format(token))
+        if token not in self.bitmaps:
+            raise ValueError("Unknown label: {}".format(token))
+        return self.bitmaps[token], position + 1
@@ -0,0 +1,111 @@
+import os
+import re
+
+DEFAULT_ROOT = "00 All"
+
+# Templates are relative to the library root, the last part is the filename
+# without its extension. Fields are written as {field} or {field:regex},
+# {_:regex} matches without storing anything, * matches any text inside a
+# directory name and [...] makes its content optional.
+# The first rule that matches both the directories and the filename wins.
+DEFAULT_RULES = [
+    # 03 Külföldi Blues, Rock, Metal/Mark Knopfler/1996 Live in Copenhagen/CD1/12 Sultans of swing
+    "{category}/{artist}/[{year} ]{album}/*{cd_number}/[{number} ]{title}",
+    # 01 Külföldi Punk/Millencolin/1994 Same old tunes/06 Leona
+    "{category}/{artist}/[{year} ]{album}/[{number} ]{title}",
+    # 07 Indie, játékzenék/THPS 2/Papa roach - Blood brothers
+    "{category}/*/{artist} - {title}",
+    # 03 Külföldi Blues, Rock, Metal/Metallica/13 Enter sandman
+    # 01 Külföldi Punk/Alkaline Trio/Private eye
+    # special: 01 Külföldi Punk/CKY/96 quite bitter beings
+    r"{category}/{artist}/[{_:[0-8]\d} ]{title}",
+    "{category}/{title}",
+]
+
+FIELDS = ("artist", "year", "album", "cd_number", "number", "title", "category")
+
+FIELD_PATTERNS = {
+    "year": r"\d{4}",
+    "cd_number": r"\d+",
+    "number": r"\d\d",
+    "title": r".+",
+}
+
+TOKEN = re.compile(r"\{(\w+)(?::([^}]*))?\}|\[|\]|\*")
+
+
+class LibraryLayout:
+    def __init__(self, rules=DEFAULT_RULES, root=DEFAULT_ROOT):
+        self.root = root
+        self.rules_by_depth = dict()
+        for rule in rules:
+            dir_template, _, file_template = rule.rpartition("/")
+            if "{title}" not in file_template and "{title:" not in file_template:
+                raise ValueError("Layout rule has no {{title}}: {}".format(rule))
+            depth = dir_template.count("/") + 1 if dir_template else 0
+            compiled = (self.compile(dir_template), self.compile(file_template))
+            self.rules_by_depth.setdefault(depth, list()).append(compiled)
+
+    @classmethod
+    def from_config(cls, section):
+        root = section.get("library_root", DEFAULT_ROOT)
+        rules = section.get("layout_rules")
+        if rules:
+            rules = [rule.strip() for rule in rules.splitlines() if rule.strip()]
+        else:
+            rules = DEFAULT_RULES
+        return cls(rules, root)
+
+    def compile(self, template):
+        regex = list()
+        position = 0
+        for token in TOKEN.finditer(template):
+            regex.append(re.escape(template[position : token.start()]))
+            position = token.end()
+            field, pattern = token.group(1), token.group(2)
+            if token.group() == "[":
+                regex.append("(?:")
+            elif token.group() == "]":
+                regex.append(")?")
+            elif token.group() == "*":
+                regex.append("[^/]*?")
+            elif field == "_":
+                regex.append("(?:{})".format(pattern))
+            elif field in FIELDS:
+                if pattern is None:
+                    pattern = FIELD_PATTERNS.get(field, "[^/]+?")
+                regex.append("(?P<{}>{})".format(field, pattern))
+            else:
+                raise ValueError("Unknown field in layout rule: {}".format(field))
+        regex.append(re.escape(template[position:]))
+        return re.compile("".join(regex))
+
+    def split_to_dirs(self, dirpath):
+        """Return the directories below the library root, top-down, or None
+        if dirpath is not inside the library root."""
+        if os.path.isabs(self.root):
+            root = os.path.normpath(self.root)
+            if dirpath == root:
+                return list()
+            if not dirpath.startswith(root.rstrip(os.sep) + os.sep):
+                return None
+            return dirpath[len(root) :].strip(os.sep).split(os.sep)
+
+        dirs = dirpath.split(os.sep)
+        for i in range(len(dirs) - 1, -1, -1):
+            if dirs[i] == self.root:
+                return dirs[i + 1 :]
+        return None
+
+    def match_dirs(self, dirs):
+        """Return (directory fields, filename regex) for every rule whose
+        directory part matches, in rule order."""
+        if dirs is None:
+            return tuple()
+        relative_path = "/".join(dirs)
+        candidates = list()
+        for dir_regex, file_regex in self.rules_by_depth.get(len(dirs), ()):
+            match = dir_regex.fullmatch(relative_path)
+            if match:
+                candidates.append((match.groupdict(), file_regex))
+        return tuple(candidates)
@@ -0,0 +1,151 @@
+import heapq
+import sys
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+
+FIELDS = ("artist", "title")
+# past this many keys the completions of a prefix are cached until the next
+# change
+SCAN_LIMIT = 256
+CACHE_SIZE = 4096
+# after the last key of any prefix
+END = "\U0010ffff"
+
+
+def normalise(text):
+    """Case folded without accents, like the remove_diacritics tokenizer of
+    tracks_search."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def keys_of(value):
+    """The value from each of its words on, so "knopf" completes
+    "Mark Knopfler"."""
+    words = normalise(value).split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex:
+    """Completes prefixes of artists and titles, the most frequent first.
+
+    Every value is stored once, interned, with its field and number of tracks
+    in arrays indexed by value id. Its keys are in one sorted list with the
+    value ids next to them in an array, so the keys of a prefix are a slice
+    found by bisection. The index is read from the database on first use and
+    then follows it through the track_changes table, at most every max_age
+    seconds."""
+
+    def __init__(self, db, max_age=1.0):
+        self.db = db
+        self.max_age = max_age
+        self.last_change = None
+        self.refreshed = 0.0
+
+    def clear(self):
+        self.values = list()
+        self.fields = bytearray()
+        self.counts = array("l")
+        # (field, value) -> value id
+        self.ids = dict()
+        self.keys = list()
+        self.key_ids = array("l")
+        # (prefix, field, k) -> completions
+        self.cache = dict()
+
+    def build(self):
+        """Read every artist and title in one pass."""
+        self.clear()
+        with self.db.transaction():
+            # changes after this one are not part of the pass
+            self.last_change = self.db.get_last_track_change()
+            for artist, title in self.db.get_artists_and_titles():
+                self.count(0, artist, 1)
+                self.count(1, title, 1)
+        pairs = [
+            (key, value_id)
+            for value_id, value in enumerate(self.values)
+            for key in keys_of(value)
+        ]
+        pairs.sort()
+        self.keys = [sys.intern(key) for key, _ in pairs]
+        self.key_ids = array("l", (value_id for _, value_id in pairs))
+        self.refreshed = time.monotonic()
+
+    def refresh(self):
+        """Apply the changes since the last build or refresh."""
+        if self.last_change is None:
+            self.build()
+            return
+        changes = self.db.get_track_changes(self.last_change)
+        if changes is None:
+            self.build()
+            return
+        for change_id, artist, title, added in changes:
+            self.update(0, artist, 1 if added else -1)
+            self.update(1, title, 1 if added else -1)
+            self.last_change = change_id
+        if changes:
+            self.cache.clear()
+        self.refreshed = time.monotonic()
+
+    def count(self, field, value, delta):
+        """Add delta to the count of value, return its id if it is new."""
+        if value is None:
+            return None
+        value_id = self.ids.get((field, value))
+        if value_id is not None:
+            self.counts[value_id] += delta
+            return None
+        value_id = len(self.values)
+        self.ids[(field, value)] = value_id
+        self.values.append(sys.intern(value))
+        self.fields.append(field)
+        self.counts.append(delta)
+        return value_id
+
+    def update(self, field, value, delta):
+        # values are not removed at zero, adding them again is a count
+        value_id = self.count(field, value, delta)
+        if value_id is None:
+            return
+        for key in keys_of(value):
+            position = bisect_right(self.keys, key)
+            self.keys.insert(position, sys.intern(key))
+            self.key_ids.insert(position, value_id)
+
+    def complete(self, prefix, k=10, field=None):
+        """Return the k most frequent (value, field, count) starting with
+        prefix, or with a word of it starting with prefix. field limits them
+        to artists or titles."""
+        if self.last_change is None or time.monotonic() - self.refreshed > self.max_age:
+            self.refresh()
+        prefix = normalise(prefix)
+        cache_key = (prefix, field, k)
+        if cache_key in self.cache:
+            return self.cache[cache_key]
+
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + END, start)
+        wanted = FIELDS.index(field) if field is not None else None
+        counts = self.counts
+        value_ids = {
+            value_id
+            for value_id in self.key_ids[start:end]
+            if counts[value_id] > 0
+            and (wanted is None or self.fields[value_id] == wanted)
+        }
+        best = heapq.nsmallest(
+            k, value_ids, key=lambda value_id: (-counts[value_id], self.values[value_id])
+        )
+        completions = [
+            (self.values[value_id], FIELDS[self.fields[value_id]], counts[value_id])
+            for value_id in best
+        ]
+        if end - start > SCAN_LIMIT:
+            if len(self.cache) >= CACHE_SIZE:
+                self.cache.clear()
+            self.cache[cache_key] = completions
+        return completions
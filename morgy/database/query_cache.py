@@ -0,0 +1,107 @@
+import sys
+import threading
+from collections import OrderedDict
+
+# bytes the results may take, roughly
+MAX_BYTES = 64 * 1024 * 1024
+
+
+def size_of_row(row):
+    """Roughly the bytes of a row, a value or a tuple of values."""
+    size = sys.getsizeof(row)
+    if isinstance(row, tuple):
+        size += sum(sys.getsizeof(value) for value in row)
+    return size
+
+
+def size_of(rows):
+    """Roughly the bytes of a tuple of rows."""
+    return sys.getsizeof(rows) + sum(size_of_row(row) for row in rows)
+
+
+class QueryCache:
+    """Results of Database getters kept until the library changes.
+
+    Every change of tracks, directories and labels increments the generation
+    of the database, see Database.add_generation. The results are stamped
+    with the generation they were read at, and the first lookup finding a
+    newer one drops them all, so a lookup costs a single one-row query while
+    nothing changes. Past max_bytes the least recently used results go first.
+
+    Keys are up to the caller and have to be equal for equal queries, see
+    Selection.key and labels.normalise. Results are tuples shared by every
+    caller getting them."""
+
+    def __init__(self, db, max_bytes=MAX_BYTES):
+        self.db = db
+        self.max_bytes = max_bytes
+        # key -> (result, size), the least recently used first
+        self.results = OrderedDict()
+        self.size = 0
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def clear(self):
+        self.results.clear()
+        self.size = 0
+
+    def get(self, key, read):
+        """Return the result of read() of the current generation stored
+        under key, calling read() if there is none."""
+        generation, result = self.lookup(key)
+        if result is None:
+            result = tuple(read())
+            self.store(key, generation, result)
+        return result
+
+    def stream(self, key, read):
+        """Like get, but yield the rows, passing those of read() on while
+        it is being read. The result is only kept while it fits in
+        max_bytes and once read() is exhausted."""
+        generation, result = self.lookup(key)
+        if result is not None:
+            yield from result
+            return
+        rows = list()
+        size = 0
+        for row in read():
+            if rows is not None:
+                rows.append(row)
+                size += size_of_row(row)
+                if size > self.max_bytes:
+                    rows = None
+            yield row
+        if rows is not None:
+            self.store(key, generation, tuple(rows))
+
+    def lookup(self, key):
+        """Return the current generation and the result stored under key,
+        None if there is none."""
+        # read before the query, a change in between only makes the result
+        # stale early
+        generation = self.db.get_generation()
+        with self.lock:
+            if self.generation is None or generation > self.generation:
+                self.clear()
+                self.generation = generation
+            if generation == self.generation and key in self.results:
+                self.results.move_to_end(key)
+                self.hits += 1
+                return generation, self.results[key][0]
+            self.misses += 1
+        return generation, None
+
+    def store(self, key, generation, result):
+        size = size_of(result)
+        with self.lock:
+            # a thread behind the others does not store its older result
+            if generation == self.generation and size <= self.max_bytes:
+                if key in self.results:
+                    self.size -= self.results.pop(key)[1]
+                self.results[key] = (result, size)
+                self.size += size
+                while self.size > self.max_bytes:
+                    _, (_, evicted_size) = self.results.popitem(last=False)
+                    self.size -= evicted_size
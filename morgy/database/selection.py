@@ -0,0 +1,137 @@
+import re
+import shlex
+from functools import lru_cache
+
+# field -> column of "tracks JOIN directories", see Database.get_paths_matching
+COLUMNS = {
+    "artist": "tracks.artist",
+    "album": "tracks.album",
+    "title": "tracks.title",
+    "year": "tracks.year",
+    "priority": "tracks.priority",
+    "category": "directories.category",
+}
+NUMERIC_FIELDS = ("year", "priority")
+GUITAR_TRACK_IDS = """SELECT track_id FROM track_labels
+    WHERE label_id = (SELECT id FROM labels WHERE name = 'guitar')"""
+# terms of a field with these match if any of them does, the rest if all do
+ANY_OPERATORS = ("=", "..")
+
+TERM = re.compile(r"(\w+)(!=|>=|<=|=|>|<)(.*)", re.DOTALL)
+RANGE = re.compile(r"(\d*)\.\.(\d*)")
+YES = ("yes", "true", "1")
+NO = ("no", "false", "0")
+
+
+class Selection:
+    """Filters written as field=value terms, all of which have to match:
+
+        artist="Mark Knopfler" year=1990..1999 priority>=5 guitar
+
+    Fields are artist, album, title, year, priority and category. year and
+    priority take =, !=, <, <=, >, >= and from..to ranges (either end may be
+    left out), the others = and !=. A field given with = or a range more than
+    once matches any of them. guitar alone or guitar=no filters on the
+    guitar mark."""
+
+    def __init__(self, terms=()):
+        # (field, operator, value), ranges are ("..", (from, to))
+        self.terms = list()
+        for term in terms:
+            self.add(term)
+
+    @classmethod
+    def parse(cls, text):
+        return cls(shlex.split(text))
+
+    def add(self, term):
+        if term == "guitar":
+            term = "guitar=yes"
+        match = TERM.fullmatch(term)
+        if not match:
+            raise ValueError("Not a field=value term: {}".format(term))
+        field, operator, value = match.groups()
+        if field == "guitar":
+            if operator != "=" or value.lower() not in YES + NO:
+                raise ValueError("guitar is yes or no, not {}".format(value))
+            # marked is "=", not marked is "!="
+            self.terms.append(("guitar", "=" if value.lower() in YES else "!=", None))
+        elif field not in COLUMNS:
+            raise ValueError("Unknown field: {}".format(field))
+        elif field in NUMERIC_FIELDS:
+            self.terms.append((field,) + self.parse_number(field, operator, value))
+        elif operator in ("=", "!="):
+            self.terms.append((field, operator, value))
+        else:
+            raise ValueError("{} can only be compared with = or !=".format(field))
+
+    def parse_number(self, field, operator, value):
+        match = RANGE.fullmatch(value)
+        if match and operator == "=":
+            start, end = match.groups()
+            if start and end:
+                return "..", (int(start), int(end))
+            if start:
+                return ">=", int(start)
+            if end:
+                return "<=", int(end)
+        elif value.isdigit():
+            return operator, int(value)
+        raise ValueError("{} needs a number or a range: {}".format(field, value))
+
+    def sorted_terms(self):
+        # the terms matching any of them are next to each other
+        return sorted(
+            self.terms, key=lambda term: (term[0], term[1] not in ANY_OPERATORS, term[1])
+        )
+
+    def shape(self):
+        """The terms without their values, equal shapes compile to the same
+        SQL."""
+        return tuple((field, operator) for field, operator, _ in self.sorted_terms())
+
+    def parameters(self):
+        parameters = list()
+        for field, operator, value in self.sorted_terms():
+            if operator == "..":
+                parameters.extend(value)
+            elif field != "guitar":
+                parameters.append(value)
+        return parameters
+
+    def where(self):
+        return compile_where(self.shape())
+
+    def key(self):
+        """Equal for selections of the same terms in any order."""
+        return self.shape(), tuple(self.parameters())
+
+
+@lru_cache(maxsize=128)
+def compile_where(shape):
+    """Return the WHERE clause of a shape. Caching it keeps the SQL text of a
+    shape identical, so the statement cache of the sqlite3 connection reuses
+    the prepared statement."""
+    # lists of conditions any of which has to match
+    groups = list()
+    previous = None
+    for field, operator in shape:
+        if field == "guitar":
+            condition = "tracks.id {} ({})".format(
+                "IN" if operator == "=" else "NOT IN", GUITAR_TRACK_IDS
+            )
+        elif operator == "..":
+            condition = "{} BETWEEN ? AND ?".format(COLUMNS[field])
+        else:
+            condition = "{} {} ?".format(COLUMNS[field], operator)
+        if field != "guitar" and operator in ANY_OPERATORS and previous == field:
+            groups[-1].append(condition)
+        else:
+            groups.append([condition])
+        previous = field if operator in ANY_OPERATORS else None
+
+    conditions = list()
+    for group in groups:
+        joined = " OR ".join(group)
+        conditions.append("({})".format(joined) if len(group) > 1 else joined)
+    return " AND ".join(conditions) or "1"
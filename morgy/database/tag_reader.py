@@ -0,0 +1,333 @@
+import mmap
+import struct
+
+FIELDS = ("artist", "year", "album", "cd_number", "number", "title")
+
+ID3V2_FRAMES = {
+    "TP1": "artist",
+    "TPE1": "artist",
+    "TYE": "year",
+    "TYER": "year",
+    "TDRC": "year",
+    "TAL": "album",
+    "TALB": "album",
+    "TPA": "cd_number",
+    "TPOS": "cd_number",
+    "TRK": "number",
+    "TRCK": "number",
+    "TT2": "title",
+    "TIT2": "title",
+}
+
+VORBIS_COMMENTS = {
+    "ARTIST": "artist",
+    "DATE": "year",
+    "YEAR": "year",
+    "ALBUM": "album",
+    "DISCNUMBER": "cd_number",
+    "TRACKNUMBER": "number",
+    "TITLE": "title",
+}
+
+ASF_ATTRIBUTES = {
+    "WM/Year": "year",
+    "WM/AlbumTitle": "album",
+    "WM/PartOfSet": "cd_number",
+    "WM/TrackNumber": "number",
+}
+
+ASF_HEADER = bytes.fromhex("3026b2758e66cf11a6d900aa0062ce6c")
+ASF_CONTENT_DESCRIPTION = bytes.fromhex("3326b2758e66cf11a6d900aa0062ce6c")
+ASF_EXTENDED_CONTENT_DESCRIPTION = bytes.fromhex("40a4d0d207e3d21197f000a0c95ea850")
+ASF_FILE_PROPERTIES = bytes.fromhex("a1dcab8c47a9cf118ee400c00c205365")
+
+ID3V2_ENCODINGS = ("latin-1", "utf-16", "utf-16-be", "utf-8")
+
+# kbps by (MPEG version 1 or 2, layer) and bitrate index, MPEG 2.5 uses 2
+MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+# how far to look for the first frame after the ID3v2 tag
+MP3_SYNC_WINDOW = 64 * 1024
+
+
+def synchsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+class TagReader:
+    """Reads artist, year, album, cd_number, number, title and the duration
+    in seconds from mp3, flac and wma files. The file is memory mapped and
+    only the header bytes are touched, so pictures and audio data are never
+    read. The duration of an mp3 comes from its Xing or VBRI header, or is
+    extrapolated from the first frame."""
+
+    def read_tags(self, path):
+        try:
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return self.parse(data)
+        # empty, unreadable or truncated files simply have no tags
+        except (OSError, ValueError, IndexError, struct.error):
+            return dict()
+
+    def read_duration(self, path):
+        return self.read_tags(path).get("duration")
+
+    def parse(self, data):
+        tags = dict()
+        offset = 0
+        if data[:3] == b"ID3":
+            offset = self.parse_id3v2(data, tags)
+        if data[offset : offset + 4] == b"fLaC":
+            self.parse_flac(data, offset + 4, tags)
+        elif data[:16] == ASF_HEADER:
+            self.parse_asf(data, tags)
+        else:
+            has_id3v1 = len(data) >= 128 and data[-128:-125] == b"TAG"
+            if has_id3v1:
+                for field, value in self.parse_id3v1(data[-128:]).items():
+                    tags.setdefault(field, value)
+            end = len(data) - 128 if has_id3v1 else len(data)
+            duration = self.parse_mp3_duration(data, offset, end)
+            if duration is not None:
+                tags["duration"] = duration
+        return tags
+
+    def add(self, tags, field, value):
+        value = value.strip("\x00 \ufeff").split("\x00")[0].strip()
+        if not value:
+            return
+        if field in ("number", "cd_number"):
+            # "3/12" means the third track out of twelve
+            value = value.split("/")[0].strip()
+            if not value.isdigit():
+                return
+        elif field == "year":
+            value = value[:4]
+            if not value.isdigit():
+                return
+        tags.setdefault(field, value)
+
+    def parse_id3v2(self, data, tags):
+        version = data[3]
+        flags = data[5]
+        end = 10 + synchsafe(data[6:10])
+        if flags & 0x10:
+            end = end + 10
+        limit = min(end, len(data))
+        # the frames are walked in place and only the wanted ones are copied
+        unsynchronised = bool(flags & 0x80) and version < 4
+        position = 10
+        if flags & 0x40 and version == 3:
+            size_end = self.skip_id3v2(data, position, 4, limit, unsynchronised)
+            size = struct.unpack(">I", self.read_id3v2(data, position, size_end, unsynchronised))[0]
+            position = self.skip_id3v2(data, size_end, size, limit, unsynchronised)
+        elif flags & 0x40 and version == 4:
+            position = position + synchsafe(data[position : position + 4])
+
+        id_size, header_size = (3, 6) if version == 2 else (4, 10)
+        while position + header_size <= limit:
+            start = self.skip_id3v2(data, position, header_size, limit, unsynchronised)
+            header = self.read_id3v2(data, position, start, unsynchronised)
+            if len(header) < header_size:
+                break
+            frame_id = header[:id_size]
+            if not frame_id.strip(b"\x00") or not frame_id.isalnum():
+                break
+            size_bytes = header[id_size : id_size * 2]
+            if version == 2:
+                size = int.from_bytes(size_bytes, "big")
+            elif version == 4:
+                size = synchsafe(size_bytes)
+            else:
+                size = struct.unpack(">I", size_bytes)[0]
+            position = self.skip_id3v2(data, start, size, limit, unsynchronised)
+            field = ID3V2_FRAMES.get(frame_id.decode("latin-1"))
+            if field is not None and size > 1:
+                frame = self.read_id3v2(data, start, position, unsynchronised)
+                if version == 4 and header[9] & 0x02:
+                    frame = frame.replace(b"\xff\x00", b"\xff")
+                if version == 4 and header[9] & 0x01:
+                    frame = frame[4:]
+                encoding = ID3V2_ENCODINGS[frame[0]] if frame[0] < 4 else "latin-1"
+                self.add(tags, field, frame[1:].decode(encoding, "replace"))
+        return end
+
+    def skip_id3v2(self, data, start, size, limit, unsynchronised):
+        """Return the position size bytes of the tag after start. An
+        unsynchronised tag has a 0x00 after some 0xff bytes, which are not
+        counted in the sizes."""
+        stop = min(start + size, limit)
+        if unsynchronised:
+            position = data.find(b"\xff\x00", start, stop + 1)
+            while position != -1 and stop < limit:
+                stop = stop + 1
+                position = data.find(b"\xff\x00", position + 2, stop + 1)
+        return stop
+
+    def read_id3v2(self, data, start, stop, unsynchronised):
+        if unsynchronised:
+            return data[start:stop].replace(b"\xff\x00", b"\xff")
+        return data[start:stop]
+
+    def parse_id3v1(self, tag):
+        def text(start, end):
+            return tag[start:end].split(b"\x00")[0].decode("latin-1").strip()
+
+        tags = dict()
+        self.add(tags, "title", text(3, 33))
+        self.add(tags, "artist", text(33, 63))
+        self.add(tags, "album", text(63, 93))
+        self.add(tags, "year", text(93, 97))
+        # ID3v1.1 stores the track number in the last byte of the comment
+        if tag[125] == 0 and tag[126] != 0:
+            self.add(tags, "number", str(tag[126]))
+        return tags
+
+    def parse_flac(self, data, offset, tags):
+        last = False
+        while not last and offset + 4 <= len(data):
+            block_type = data[offset] & 0x7F
+            last = bool(data[offset] & 0x80)
+            size = int.from_bytes(data[offset + 1 : offset + 4], "big")
+            offset = offset + 4
+            if block_type == 0:
+                self.parse_flac_streaminfo(data[offset : offset + size], tags)
+            elif block_type == 4:
+                self.parse_vorbis_comment(data[offset : offset + size], tags)
+            offset = offset + size
+
+    def parse_flac_streaminfo(self, block, tags):
+        sample_rate = (block[10] << 12) | (block[11] << 4) | (block[12] >> 4)
+        total_samples = ((block[13] & 0x0F) << 32) | struct.unpack(">I", block[14:18])[0]
+        if sample_rate and total_samples:
+            tags["duration"] = total_samples / sample_rate
+
+    def parse_vorbis_comment(self, block, tags):
+        vendor_length = struct.unpack("<I", block[:4])[0]
+        position = 4 + vendor_length
+        count = struct.unpack("<I", block[position : position + 4])[0]
+        position = position + 4
+        for _ in range(count):
+            length = struct.unpack("<I", block[position : position + 4])[0]
+            comment = block[position + 4 : position + 4 + length].decode("utf-8", "replace")
+            position = position + 4 + length
+            key, _, value = comment.partition("=")
+            field = VORBIS_COMMENTS.get(key.upper())
+            if field is not None:
+                self.add(tags, field, value)
+
+    def parse_asf(self, data, tags):
+        header_size, object_count = struct.unpack("<QI", data[16:28])
+        offset = 30
+        for _ in range(object_count):
+            if offset + 24 > header_size:
+                break
+            guid = data[offset : offset + 16]
+            size = struct.unpack("<Q", data[offset + 16 : offset + 24])[0]
+            body = data[offset + 24 : offset + size]
+            if guid == ASF_CONTENT_DESCRIPTION:
+                self.parse_asf_content_description(body, tags)
+            elif guid == ASF_EXTENDED_CONTENT_DESCRIPTION:
+                self.parse_asf_extended_content_description(body, tags)
+            elif guid == ASF_FILE_PROPERTIES:
+                self.parse_asf_file_properties(body, tags)
+            if size < 24:
+                break
+            offset = offset + size
+
+    def parse_asf_file_properties(self, body, tags):
+        # play duration is in 100 ns units and includes the preroll in ms
+        play_duration, _, preroll = struct.unpack("<QQQ", body[40:64])
+        if play_duration:
+            tags["duration"] = max(play_duration / 10000000 - preroll / 1000, 0)
+
+    def parse_asf_content_description(self, body, tags):
+        title_length, author_length = struct.unpack("<HH", body[:4])
+        position = 10
+        title = body[position : position + title_length].decode("utf-16-le", "replace")
+        position = position + title_length
+        author = body[position : position + author_length].decode("utf-16-le", "replace")
+        self.add(tags, "title", title)
+        self.add(tags, "artist", author)
+
+    def parse_asf_extended_content_description(self, body, tags):
+        count = struct.unpack("<H", body[:2])[0]
+        position = 2
+        for _ in range(count):
+            name_length = struct.unpack("<H", body[position : position + 2])[0]
+            position = position + 2
+            name = body[position : position + name_length].decode("utf-16-le", "replace")
+            position = position + name_length
+            value_type, value_length = struct.unpack("<HH", body[position : position + 4])
+            position = position + 4
+            value = body[position : position + value_length]
+            position = position + value_length
+            field = ASF_ATTRIBUTES.get(name.rstrip("\x00"))
+            if field is None:
+                continue
+            if value_type == 0:
+                self.add(tags, field, value.decode("utf-16-le", "replace"))
+            elif value_type in (3, 4, 5):
+                self.add(tags, field, str(int.from_bytes(value, "little")))
+
+    def find_mp3_frame(self, data, start, end):
+        position = data.find(b"\xff", start, min(end, start + MP3_SYNC_WINDOW))
+        while position != -1 and position + 4 <= end:
+            header = self.parse_mp3_frame_header(data[position : position + 4])
+            if header is not None:
+                return position, header
+            position = data.find(b"\xff", position + 1, min(end, start + MP3_SYNC_WINDOW))
+        return None, None
+
+    def parse_mp3_frame_header(self, header):
+        if header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+            return None
+        version = (header[1] >> 3) & 0x03
+        layer = 4 - ((header[1] >> 1) & 0x03)
+        bitrate_index = header[2] >> 4
+        sample_rate_index = (header[2] >> 2) & 0x03
+        if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+            return None
+        mpeg1 = version == 3
+        bitrate = MP3_BITRATES[(1 if mpeg1 else 2, layer)][bitrate_index] * 1000
+        sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+        if layer == 1:
+            samples_per_frame = 384
+        elif layer == 3 and not mpeg1:
+            samples_per_frame = 576
+        else:
+            samples_per_frame = 1152
+        mono = header[3] >> 6 == 3
+        return mpeg1, mono, bitrate, sample_rate, samples_per_frame
+
+    def parse_mp3_duration(self, data, start, end):
+        position, header = self.find_mp3_frame(data, start, end)
+        if header is None:
+            return None
+        mpeg1, mono, bitrate, sample_rate, samples_per_frame = header
+
+        # VBR files count their frames in a Xing (or Info) or a VBRI header
+        if mpeg1:
+            xing = position + (21 if mono else 36)
+        else:
+            xing = position + (13 if mono else 21)
+        if data[xing : xing + 4] in (b"Xing", b"Info"):
+            flags = struct.unpack(">I", data[xing + 4 : xing + 8])[0]
+            if flags & 0x01:
+                frames = struct.unpack(">I", data[xing + 8 : xing + 12])[0]
+                return frames * samples_per_frame / sample_rate
+        vbri = position + 36
+        if data[vbri : vbri + 4] == b"VBRI":
+            frames = struct.unpack(">I", data[vbri + 14 : vbri + 18])[0]
+            return frames * samples_per_frame / sample_rate
+
+        # constant bitrate: every frame has the size of the first one
+        return (end - position) * 8 / bitrate
@@ -0,0 +1,172 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+# words of the suffixes telling a variant of a song, not a different one
+VARIANT_WORDS = (
+    "live",
+    "remaster",
+    "remastered",
+    "remix",
+    "mix",
+    "edit",
+    "version",
+    "mono",
+    "stereo",
+    "demo",
+    "acoustic",
+    "unplugged",
+    "single",
+    "radio",
+    "bonus",
+)
+VARIANT = r"\b(?:{})\b".format("|".join(VARIANT_WORDS))
+# "Song (Live at Wembley)", "Song [2011 Remaster]"
+BRACKETED_SUFFIX = re.compile(
+    r"\s*[(\[][^()\[\]]*{}[^()\[\]]*[)\]]\s*$".format(VARIANT), re.IGNORECASE
+)
+# "Song - Live", "Song - Remastered 2011"
+DASHED_SUFFIX = re.compile(r"\s+[-–]\s+[^-–]*{}[^-–]*$".format(VARIANT), re.IGNORECASE)
+PUNCTUATION = re.compile(r"[^\w\s]+")
+NUMBER = re.compile(r"\d+")
+
+DEFAULT_STEPS = ("brackets", "dashes", "case", "accents", "punctuation")
+# Dice coefficient of the trigrams of two titles of an artist from which they
+# are the same song
+SIMILARITY = 0.8
+
+
+def strip_suffixes(pattern, title):
+    while True:
+        stripped = pattern.sub("", title)
+        # a title is never stripped to nothing
+        if stripped == title or not stripped.strip():
+            return title
+        title = stripped
+
+
+def strip_accents(title):
+    decomposed = unicodedata.normalize("NFKD", title)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+STEPS = {
+    "brackets": lambda title: strip_suffixes(BRACKETED_SUFFIX, title),
+    "dashes": lambda title: strip_suffixes(DASHED_SUFFIX, title),
+    "case": str.casefold,
+    "accents": strip_accents,
+    "punctuation": lambda title: PUNCTUATION.sub(" ", title),
+}
+
+
+def trigrams(key):
+    padded = "  {} ".format(key)
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleClusterer:
+    """Finds the titles that are the same song: those with the same key after
+    the normalisation steps, and those of an artist with similar keys, like
+    "Enter Sandman (Remastered)", "enter sandman" and "Enter sandman - live".
+
+    Similar keys are found through an index of their trigrams, only the keys
+    sharing some are compared. Numbers have to match, "Part 1" and "Part 2"
+    stay apart. Every track of a cluster gets the smallest track id of it as
+    cluster id."""
+
+    def __init__(self, steps=DEFAULT_STEPS, similarity=SIMILARITY):
+        for step in steps:
+            if step not in STEPS:
+                raise ValueError("Unknown normalisation step: {}".format(step))
+        self.steps = [STEPS[step] for step in steps]
+        self.similarity = similarity
+        # stored with the clusters, other settings cluster again
+        self.settings = "{} {}".format(",".join(steps), similarity)
+
+    @classmethod
+    def from_config(cls, section):
+        steps = section.get("title_normalisation")
+        if steps is None:
+            return cls(similarity=section.getfloat("title_similarity", SIMILARITY))
+        return cls(
+            [step.strip() for step in steps.split(",") if step.strip()],
+            section.getfloat("title_similarity", SIMILARITY),
+        )
+
+    def normalise(self, title):
+        for step in self.steps:
+            title = step(title)
+        return " ".join(title.split())
+
+    def clusters(self, tracks):
+        """Return {track id: cluster id} of (track id, artist, title)s."""
+        parents = dict()
+
+        def find(track_id):
+            root = track_id
+            while parents[root] != root:
+                root = parents[root]
+            while parents[track_id] != root:
+                parents[track_id], track_id = root, parents[track_id]
+            return root
+
+        def union(first, second):
+            first, second = find(first), find(second)
+            if first != second:
+                parents[max(first, second)] = min(first, second)
+
+        # key -> first track id, artist -> {key: first track id}
+        keys = dict()
+        artists = defaultdict(dict)
+        for track_id, artist, title in tracks:
+            parents[track_id] = track_id
+            key = self.normalise(title)
+            if key in keys:
+                union(keys[key], track_id)
+            else:
+                keys[key] = track_id
+            artists[artist].setdefault(key, track_id)
+
+        for artist_keys in artists.values():
+            for first, second in self.similar_pairs(list(artist_keys)):
+                union(artist_keys[first], artist_keys[second])
+        return {track_id: find(track_id) for track_id in parents}
+
+    def similar_pairs(self, keys):
+        index = defaultdict(list)
+        grams = [trigrams(key) for key in keys]
+        numbers = [NUMBER.findall(key) for key in keys]
+        for i, key in enumerate(keys):
+            shared = defaultdict(int)
+            for gram in grams[i]:
+                for j in index[gram]:
+                    shared[j] += 1
+                index[gram].append(i)
+            for j, count in shared.items():
+                dice = 2 * count / (len(grams[i]) + len(grams[j]))
+                if dice >= self.similarity and numbers[i] == numbers[j]:
+                    yield key, keys[j]
+
+    def update(self, db):
+        """Store the clusters of every track, return the number of tracks
+        whose cluster changed. Nothing is read if no artist or title has
+        changed since the last time with the same settings, see
+        Database.add_track_changes."""
+        # read first, a change while clustering is clustered next time
+        last_change = db.get_last_track_change()
+        if db.get_clustering() == (last_change, self.settings):
+            return 0
+        tracks = list()
+        current = dict()
+        for track_id, artist, title, cluster in db.get_titles_and_clusters():
+            tracks.append((track_id, artist, title))
+            current[track_id] = cluster
+        changed = [
+            (cluster, track_id)
+            for track_id, cluster in self.clusters(tracks).items()
+            if current[track_id] != cluster
+        ]
+        db.set_clusters(changed)
+        db.set_clustering(last_change, self.settings)
+        db.commit()
+        return len(changed)
@@ -1,13 +1,50 @@
 import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
 from morgy.database import Database
+from morgy.database.content_hasher import ContentHasher
 from morgy.database.detail_fetcher import DetailFetcher
+from morgy.database.tag_reader import FIELDS, TagReader
+
+# the updater of a worker process, see init_worker
+worker_updater = None
+
+
+def init_worker(layout, read_tags):
+    global worker_updater
+    worker_updater = DatabaseUpdater(None, layout, read_tags)
+
+
+def fetch_details(dirpath, names):
+    return [
+        (os.path.join(dirpath, name),) + worker_updater.fetch_detail(dirpath, name)
+        for name in names
+    ]
 
 
 class DatabaseUpdater:
-    def __init__(self, db):
+    def __init__(
+        self, db, layout=None, read_tags=True, workers=1, batch_size=500, chunk_size=64
+    ):
         self.db = db
-        self.detail_fetcher = DetailFetcher()
+        self.layout = layout
+        self.detail_fetcher = DetailFetcher(layout)
+        self.tag_reader = TagReader()
+        self.hasher = ContentHasher()
+        self.read_tags = read_tags
         self.extensions = [".mp3", ".wma", ".flac"]
+        # parallel ingest: files are sent to the workers in chunks of
+        # chunk_size, at most queue_size chunks are in flight at once and
+        # the rows are written in transactions of batch_size
+        self.workers = workers
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.queue_size = 4 * workers
+        # (path, mtime, entries) of the directories listed by the last walk
+        # and the known directories it did not find, see walk
+        self.listed_directories = list()
+        self.vanished_directories = list()
 
     def remove_not_existing_entries(self):
         not_existing_paths = list()
@@ -16,38 +53,237 @@ class DatabaseUpdater:
             if not os.path.exists(path[0]):
                 not_existing_paths.append(path[0])
 
-        for path in not_existing_paths:
-            self.db.delete_entry_with_path(path)
+        self.db.delete_entries_with_paths(not_existing_paths)
 
         for guitar_path in self.db.get_rows_from_table("guitar"):
             if guitar_path[0] in not_existing_paths:
                 print("Deleting {} from guitar table.".format(guitar_path[0]))
                 self.db.delete_entry_with_path_from_guitar(guitar_path[0])
 
-        self.db.commit_and_close()
-        self.db.open()
+        self.db.commit()
+
+    def fetch_detail(self, dirpath, name):
+        details = self.detail_fetcher.fetch_detail(dirpath, name[:-4])
+        path = os.path.join(dirpath, name)
+        tags = self.tag_reader.read_tags(path)
+        if self.read_tags:
+            # embedded tags win, the path is the fallback for missing ones
+            details = tuple(tags.get(field, value) for field, value in zip(FIELDS, details))
+        stat = os.stat(path)
+        return details + (tags.get("duration"), stat.st_size, stat.st_ino)
+
+    def build_row(self, dirpath, name, priority):
+        path = os.path.join(dirpath, name)
+        (
+            artist,
+            year,
+            album,
+            cd_number,
+            number,
+            title,
+            duration,
+            size,
+            inode,
+        ) = self.fetch_detail(dirpath, name)
+        return (
+            path,
+            artist,
+            year,
+            album,
+            cd_number,
+            number,
+            title,
+            priority,
+            duration,
+            size,
+            inode,
+        )
+
+    def is_song(self, name):
+        return any(name.lower().endswith(extension) for extension in self.extensions)
+
+    def walk(self, directory, full=True):
+        """Yield (dirpath, song filenames) in chunks of chunk_size.
+        Adding, removing or renaming a file changes the mtime of its
+        directory, so unless full, a directory with the mtime stored in the
+        database is not listed again: only its known subdirectories are
+        visited, which costs a stat per directory."""
+        # stored without a trailing slash, like the parents of its
+        # subdirectories
+        directory = os.path.abspath(directory)
+        known = dict() if full else self.db.get_directories()
+        subdirectories = dict()
+        for path in known:
+            subdirectories.setdefault(os.path.dirname(path), list()).append(path)
+        # an mtime this recent may change again within its resolution
+        racy_mtime = time.time_ns() - 1000000000
+        self.listed_directories = list()
+        self.vanished_directories = list()
 
-    def update_db(self, directory, priority):
-        for dirpath, dirnames, filenames in os.walk(directory):
-            filtered_filenames = [
-                x
-                for x in filenames
-                for extension in self.extensions
-                if x.lower().endswith(extension)
+        to_visit = [directory]
+        while to_visit:
+            dirpath = to_visit.pop()
+            try:
+                mtime = os.stat(dirpath).st_mtime_ns
+                if dirpath in known and known[dirpath][0] == mtime:
+                    to_visit.extend(subdirectories.get(dirpath, ()))
+                    continue
+                entries = list(os.scandir(dirpath))
+            except OSError:
+                if dirpath in known:
+                    self.vanished_directories.append(dirpath)
+                continue
+
+            filtered_filenames = list()
+            found = set()
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        to_visit.append(entry.path)
+                        found.add(entry.path)
+                elif self.is_song(entry.name):
+                    filtered_filenames.append(entry.name)
+            self.vanished_directories.extend(
+                path for path in subdirectories.get(dirpath, ()) if path not in found
+            )
+            # recent ones are stored without mtime, so that their parent
+            # still knows them, but listed again the next time
+            self.listed_directories.append(
+                (dirpath, mtime if mtime < racy_mtime else None, len(entries))
+            )
+            for i in range(0, len(filtered_filenames), self.chunk_size):
+                yield dirpath, filtered_filenames[i : i + self.chunk_size]
+
+    def update_db(self, directory, priority, full=False):
+        if self.workers > 1:
+            self.update_db_parallel(directory, priority, full)
+        else:
+            for dirpath, filtered_filenames in self.walk(directory, full):
+                for name in filtered_filenames:
+                    row = self.build_row(dirpath, name, priority)
+                    if not self.move_entry_if_moved(row):
+                        self.db.add_detail_row(*row)
+        # only stored when every file of the directories is written
+        self.db.set_directories(self.listed_directories)
+        self.db.delete_directories(self.vanished_directories)
+        self.store_categories()
+
+    def store_categories(self):
+        self.db.set_categories(
+            [
+                (self.detail_fetcher.fetch_category(path), path)
+                for path in self.db.get_directories_without_category()
             ]
-            for name in filtered_filenames:
-                (
-                    artist,
-                    year,
-                    album,
-                    cd_number,
-                    number,
-                    title,
-                ) = self.detail_fetcher.fetch_detail(dirpath, name[:-4])
-                path = os.path.join(dirpath, name)
-                self.db.add_detail_row(
-                    path, artist, year, album, cd_number, number, title, priority
-                )
+        )
+
+    def update_files(self, paths, priority):
+        """Add, move or refresh the entries of the given song files. Known
+        paths get the tags, duration and size of the file again, as it may
+        have been written since."""
+        rows = list()
+        known = list()
+        for path in paths:
+            dirpath, name = os.path.split(path)
+            if not self.is_song(name) or not os.path.isfile(path):
+                continue
+            row = self.build_row(dirpath, name, priority)
+            if self.db.has_path(path):
+                known.append(row)
+            elif not self.move_entry_if_moved(row):
+                rows.append(row)
+        self.db.update_detail_rows(known)
+        self.db.add_detail_rows(rows)
+        self.store_categories()
+
+    def remove_entries(self, paths):
+        self.db.delete_entries_with_paths(paths)
+        self.db.commit()
+
+    def find_moved_path(self, path, size, inode):
+        """Return the path of a vanished database entry with the same
+        content as the file at path, or None."""
+        for old_path in self.db.get_paths_with_inode(inode, size):
+            if old_path != path and not os.path.exists(old_path):
+                return old_path
+
+        # e.g. moved to another file system, only comparable if hashed before
+        vanished = [
+            (old_path, partial_hash)
+            for old_path, partial_hash in self.db.get_partial_hashes_with_size(size)
+            if not os.path.exists(old_path)
+        ]
+        if vanished:
+            new_partial_hash = self.hasher.partial_hash(path, size)
+            for old_path, partial_hash in vanished:
+                if partial_hash == new_partial_hash:
+                    return old_path
+        return None
+
+    def move_entry_if_moved(self, row):
+        """Rewrite the entry of a moved or renamed file in place, so it keeps
+        its priority and guitar mark. Return whether it was moved."""
+        (
+            path,
+            artist,
+            year,
+            album,
+            cd_number,
+            number,
+            title,
+            _,
+            duration,
+            size,
+            inode,
+        ) = row
+        if self.db.has_path(path):
+            return False
+        old_path = self.find_moved_path(path, size, inode)
+        if old_path is None:
+            return False
+        print("Moved: {} -> {}".format(old_path, path))
+        self.db.move_entry(
+            old_path,
+            path,
+            artist,
+            year,
+            album,
+            cd_number,
+            number,
+            title,
+            duration,
+            size,
+            inode,
+        )
+        return True
+
+    def update_db_parallel(self, directory, priority, full=False):
+        rows = list()
+        pending = set()
+        with ProcessPoolExecutor(
+            self.workers,
+            initializer=init_worker,
+            initargs=(self.layout, self.read_tags),
+        ) as executor:
+            for dirpath, names in self.walk(directory, full):
+                pending.add(executor.submit(fetch_details, dirpath, names))
+                if len(pending) >= self.queue_size:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self.write_details(done, priority, rows)
+            done, _ = wait(pending)
+            self.write_details(done, priority, rows)
+        self.db.add_detail_rows(rows)
+
+    def write_details(self, futures, priority, rows):
+        for future in futures:
+            for path, *details, duration, size, inode in future.result():
+                row = (path, *details, priority, duration, size, inode)
+                if not self.move_entry_if_moved(row):
+                    rows.append(row)
+            if len(rows) >= self.batch_size:
+                self.db.add_detail_rows(rows)
+                rows.clear()
 
     def close(self):
-        self.db.commit_and_close()
+        """Commit, the connection stays open for further use of the
+        database."""
+        self.db.commit()
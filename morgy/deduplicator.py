@@ -0,0 +1,96 @@
+import os
+from itertools import groupby
+
+from morgy.database.content_hasher import ContentHasher
+
+
+class Deduplicator:
+    """Finds identical files: only files of the same size get a partial hash
+    of their first and last 64 KiB, and only files whose partial hashes
+    collide get a full hash. Sizes and hashes are stored in the database,
+    so later runs only hash new files."""
+
+    def __init__(self, db, batch_size=1000):
+        self.db = db
+        self.hasher = ContentHasher()
+        self.batch_size = batch_size
+
+    def store_missing_sizes(self):
+        sizes = list()
+        for path in self.db.get_paths_without_size():
+            try:
+                sizes.append((os.path.getsize(path), path))
+            except OSError:
+                print("Cannot read {}".format(path))
+        self.db.set_sizes(sizes)
+
+    def group_by_hash(self, candidates, hash_function, hashes):
+        """Group [path, stored hash] pairs by their hash, computing and
+        collecting the missing ones into hashes."""
+        groups = dict()
+        for path, stored_hash in candidates:
+            if stored_hash is None:
+                try:
+                    stored_hash = hash_function(path)
+                except OSError:
+                    print("Cannot read {}".format(path))
+                    continue
+                hashes.append((path, stored_hash))
+            groups.setdefault(stored_hash, list()).append(path)
+        return [paths for paths in groups.values() if len(paths) > 1]
+
+    def find_duplicates(self):
+        """Return (size, [path, ...]) for every set of identical files."""
+        self.store_missing_sizes()
+        duplicates = list()
+        partial_hashes = list()
+        full_hashes = list()
+        rows = self.db.get_same_size_rows()
+        for size, same_size in groupby(list(rows), key=lambda row: row[1]):
+            same_size = list(same_size)
+            full_hash_of = {path: full_hash for path, _, _, full_hash in same_size}
+            partial_groups = self.group_by_hash(
+                [(path, partial_hash) for path, _, partial_hash, _ in same_size],
+                lambda path: self.hasher.partial_hash(path, size),
+                partial_hashes,
+            )
+            for paths in partial_groups:
+                if self.hasher.is_covered_by_partial_hash(size):
+                    duplicates.append((size, paths))
+                    continue
+                for same_content in self.group_by_hash(
+                    [(path, full_hash_of[path]) for path in paths],
+                    self.hasher.full_hash,
+                    full_hashes,
+                ):
+                    duplicates.append((size, same_content))
+            if len(partial_hashes) + len(full_hashes) >= self.batch_size:
+                self.store_hashes(partial_hashes, full_hashes)
+        self.store_hashes(partial_hashes, full_hashes)
+        return duplicates
+
+    def store_hashes(self, partial_hashes, full_hashes):
+        self.db.set_hashes(
+            [(partial_hash, None, path) for path, partial_hash in partial_hashes]
+            + [(None, full_hash, path) for path, full_hash in full_hashes]
+        )
+        partial_hashes.clear()
+        full_hashes.clear()
+
+    def write_report(self, duplicates, output):
+        redundant_files = 0
+        redundant_bytes = 0
+        for size, paths in sorted(duplicates, key=lambda duplicate: -duplicate[0]):
+            output.write(
+                "{} copies, {:.1f} MB each:\n".format(len(paths), size / 1024 / 1024)
+            )
+            for path in sorted(paths):
+                output.write(path + "\n")
+            output.write("\n")
+            redundant_files = redundant_files + len(paths) - 1
+            redundant_bytes = redundant_bytes + (len(paths) - 1) * size
+        output.write(
+            "{} redundant files, {:.1f} MB\n".format(
+                redundant_files, redundant_bytes / 1024 / 1024
+            )
+        )
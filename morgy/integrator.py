@@ -8,10 +8,10 @@ from morgy.song_cleankeeper.renamer import Renamer
 
 
 class Integrator:
-    def __init__(self, to_integrate, db):
+    def __init__(self, to_integrate, db, layout=None):
         self.to_integrate = os.path.realpath(to_integrate)
         self.info = dict()
-        self.db_updater = DatabaseUpdater(db)
+        self.db_updater = DatabaseUpdater(db, layout)
         self.path_sanitizer = PathSanitizer()
         self.renamer = Renamer()
 
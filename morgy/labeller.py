@@ -0,0 +1,73 @@
+import glob
+import os
+
+from morgy.database.labels import is_name
+
+PLAYLIST_EXTENSIONS = (".m3u", ".m3u8")
+
+
+class Labeller:
+    """Labels and unlabels the songs of M3U playlists, directories, glob
+    patterns and single paths. The paths are looked up in one query and the
+    labels are written in one transaction."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def read_playlist(self, playlist):
+        """Return the paths of an M3U playlist, relative ones joined to its
+        directory."""
+        directory = os.path.dirname(playlist)
+        paths = list()
+        with open(playlist, encoding="utf-8-sig", errors="replace") as lines:
+            for line in lines:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    paths.append(os.path.normpath(os.path.join(directory, line)))
+        return paths
+
+    def resolve(self, sources):
+        """Return the track ids of the sources and the entries without a
+        song."""
+        paths = list()
+        track_ids = list()
+        missing = list()
+        for source in sources:
+            # the database only knows absolute paths
+            path = os.path.abspath(source)
+            if os.path.isdir(path):
+                under = self.db.get_track_ids_under(path)
+                if not under:
+                    missing.append(source)
+                track_ids.extend(under)
+            elif path.lower().endswith(PLAYLIST_EXTENSIONS) and os.path.isfile(path):
+                paths.extend(self.read_playlist(path))
+            elif glob.has_magic(path):
+                matches = [match for match in glob.glob(path, recursive=True) if os.path.isfile(match)]
+                if not matches:
+                    missing.append(source)
+                paths.extend(matches)
+            else:
+                paths.append(path)
+        found, not_found = self.db.get_track_ids_of_paths(paths)
+        track_ids.extend(found)
+        missing.extend(not_found)
+        return set(track_ids), missing
+
+    def label(self, name, sources):
+        """Return the number of songs found, of those newly labelled and
+        the entries without a song. Raise ValueError if name could not be
+        selected with a label expression."""
+        if not is_name(name):
+            raise ValueError("Not a label name: {}".format(name))
+        with self.db.transaction():
+            track_ids, missing = self.resolve(sources)
+            changed = self.db.label_tracks(name, track_ids)
+        return len(track_ids), changed, missing
+
+    def unlabel(self, name, sources):
+        """Like label, but the changed ones are those unlabelled."""
+        with self.db.transaction():
+            track_ids, missing = self.resolve(sources)
+            changed = self.db.unlabel_tracks(name, track_ids)
+        return len(track_ids), changed, missing
@@ -0,0 +1,84 @@
+import os
+
+from morgy.spreader import spread
+
+BUFFER_SIZE = 64 * 1024
+
+
+class PlaylistWriter:
+    """Writes playlists of Selections, extended M3U with the artist, title
+    and duration of every song or bare paths. All of them are written in a
+    single pass over the tracks. Paths are relative to root if given, like
+    the root of the device the playlists are copied to, or URLs of the
+    tracks on a Streamer at url. With spread the songs of an artist or album
+    are spread apart, see spreader.spread, otherwise they are in the order
+    of the database."""
+
+    def __init__(self, db, root=None, extended=True, spread=False, url=None):
+        self.db = db
+        self.root = root
+        self.extended = extended
+        self.spread = spread
+        self.url = url
+
+    def entry(self, track_id, path, artist, title, duration):
+        if self.url is not None:
+            # players tell the format by the extension
+            path = "{}/tracks/{}{}".format(self.url, track_id, os.path.splitext(path)[1])
+        elif self.root is not None:
+            path = os.path.relpath(path, self.root)
+        if not self.extended:
+            return path + "\n"
+        name = "{} - {}".format(artist, title) if artist else title
+        seconds = round(duration) if duration is not None else -1
+        return "#EXTINF:{},{}\n{}\n".format(seconds, name, path)
+
+    def write(self, playlists):
+        """playlists are (file, Selection, track ids or None) triples, the
+        track ids limiting the songs of the playlist, see LabelIndex.
+        Return the number of songs written to each."""
+        if not playlists:
+            return list()
+        files = [
+            open(file, "w", encoding="utf-8", buffering=BUFFER_SIZE)
+            for file, _, _ in playlists
+        ]
+        try:
+            return self.write_to(
+                [
+                    (playlist, selection, track_ids)
+                    for playlist, (_, selection, track_ids) in zip(files, playlists)
+                ]
+            )
+        finally:
+            for playlist in files:
+                playlist.close()
+
+    def write_to(self, playlists):
+        """Like write, with open text files instead of file names."""
+        files = [playlist for playlist, _, _ in playlists]
+        counts = [0] * len(playlists)
+        if self.extended:
+            for playlist in files:
+                playlist.write("#EXTM3U\n")
+        entries = self.db.get_playlist_entries(
+            [selection for _, selection, _ in playlists]
+        )
+        # (entry, artist, album) of each playlist to spread at the end
+        held = [list() for _ in playlists]
+        for track_id, path, artist, album, title, duration, matches in entries:
+            entry = None
+            for i, match in enumerate(matches):
+                track_ids = playlists[i][2]
+                if match and (track_ids is None or track_id in track_ids):
+                    if entry is None:
+                        entry = self.entry(track_id, path, artist, title, duration)
+                    if self.spread:
+                        held[i].append((entry, artist, album))
+                    else:
+                        files[i].write(entry)
+                    counts[i] += 1
+        for playlist, songs in zip(files, held):
+            ordered = spread(songs, lambda song: song[1], lambda song: song[2])
+            playlist.write("".join(song[0] for song in ordered))
+        return counts
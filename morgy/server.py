@@ -0,0 +1,270 @@
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from morgy.database.labels import LabelIndex, normalise as normalise_labels
+from morgy.database.prefix_index import PrefixIndex
+from morgy.database.query_cache import MAX_BYTES, QueryCache
+from morgy.database.selection import Selection
+from morgy.labeller import Labeller
+from morgy.smart_picker import SmartPicker
+
+# items of a streamed JSON array sent in one chunk
+CHUNK_ITEMS = 256
+# seconds an idle keep-alive connection may hold a worker
+IDLE_TIMEOUT = 5.0
+
+
+class Api:
+    """The endpoints of the HTTP API. They read through a read-only copy of
+    db, every worker thread of the server keeping its own connection, and
+    write through db in a single writer thread, one write at a time.
+
+    GET  /search?q=words&limit=20       best matches, see Database.search
+    GET  /complete?prefix=ma&k=10       artists and titles, see PrefixIndex
+    GET  /songs?selection=...&labels=.. paths, see Selection and LabelIndex
+    GET  /labels                        the label names
+    POST /pick                          {"quantity": MB, "hours": h,
+                                        "labels": expression}, picks songs
+                                        and decreases their priorities
+    POST /labels/NAME                   {"sources": [...]}, see Labeller
+    DELETE /labels/NAME                 the same, unlabelling
+
+    An endpoint returns a dict, sent as a JSON object, or an iterable, sent
+    as a JSON array while it is being read. The results of search, songs
+    and labels are kept in a QueryCache of cache_bytes until the library
+    changes, songs only if they fit in it."""
+
+    def __init__(self, db, cache_bytes=MAX_BYTES):
+        self.db = db
+        self.reader = db.reader()
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.cache = QueryCache(self.reader, cache_bytes)
+        # shared by the workers
+        self.prefix_index = PrefixIndex(self.reader)
+        self.label_index = LabelIndex(self.reader)
+        self.index_lock = threading.Lock()
+        self.routes = {
+            ("GET", "search"): self.search,
+            ("GET", "complete"): self.complete,
+            ("GET", "songs"): self.songs,
+            ("GET", "labels"): self.labels,
+            ("POST", "pick"): self.pick,
+            ("POST", "labels"): self.label,
+            ("DELETE", "labels"): self.unlabel,
+        }
+
+    def write(self, function, *args):
+        """Run function(db, *args) in the writer thread, return its
+        result."""
+        return self.writer.submit(function, self.db, *args).result()
+
+    def close(self):
+        self.writer.submit(self.db.close).result()
+        self.writer.shutdown()
+
+    def get_track_ids(self, labels):
+        if not labels:
+            return None
+        with self.index_lock:
+            return self.label_index.track_ids(labels)
+
+    def search(self, query, body):
+        words = query.get("q", "")
+        limit = int(query.get("limit", 20))
+        # the full text index ignores case and spacing
+        key = ("search", " ".join(words.lower().split()), limit)
+        for path, artist, album, title in self.cache.get(
+            key, lambda: self.reader.search(words, limit)
+        ):
+            yield {"path": path, "artist": artist, "album": album, "title": title}
+
+    def complete(self, query, body):
+        field = query.get("field")
+        if field not in (None, "artist", "title"):
+            raise ValueError("field is artist or title, not {}".format(field))
+        # refreshing changes the index
+        with self.index_lock:
+            completions = self.prefix_index.complete(
+                query.get("prefix", ""), int(query.get("k", 10)), field
+            )
+        return [
+            {"value": value, "field": field, "count": count}
+            for value, field, count in completions
+        ]
+
+    def songs(self, query, body):
+        selection = Selection.parse(query.get("selection", ""))
+        expression = query.get("labels")
+        key = ("songs", selection.key(), normalise_labels(expression) if expression else None)
+        # streamed even when read, the whole library may not fit the cache
+        return self.cache.stream(
+            key,
+            lambda: self.reader.get_paths_matching(selection, self.get_track_ids(expression)),
+        )
+
+    def labels(self, query, body):
+        return self.cache.get(("labels",), self.reader.get_labels)
+
+    def pick(self, query, body):
+        quantity = body.get("quantity")
+        hours = body.get("hours")
+        if quantity is None and hours is None:
+            raise ValueError("Give a quantity in MBs, hours or both.")
+        picker = SmartPicker(self.reader, self.get_track_ids(body.get("labels")))
+        picked = picker.pick(
+            quantity * 1024 * 1024 if quantity is not None else None,
+            hours * 3600 if hours is not None else None,
+        )
+        picked = picker.spread(picked)
+        self.write(lambda db: SmartPicker(db).decrease_prio(picked))
+        return picked
+
+    def label(self, query, body, name):
+        found, changed, missing = self.write(
+            lambda db: Labeller(db).label(name, body.get("sources", []))
+        )
+        return {"found": found, "changed": changed, "missing": missing}
+
+    def unlabel(self, query, body, name):
+        found, changed, missing = self.write(
+            lambda db: Labeller(db).unlabel(name, body.get("sources", []))
+        )
+        return {"found": found, "changed": changed, "missing": missing}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = IDLE_TIMEOUT
+    # headers and body are separate writes, with Nagle's algorithm the body
+    # waits for the client's delayed ACK of the headers, some 40 ms
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        name, *args = url.path.strip("/").split("/")
+        endpoint = self.server.api.routes.get((method, name))
+        length = int(self.headers.get("Content-Length", 0))
+        # read even if unused, the next request of the connection follows it
+        data = self.rfile.read(length) if length else b""
+        if endpoint is None:
+            self.send_json(404, {"error": "Not found: {} {}".format(method, url.path)})
+            return
+        try:
+            body = json.loads(data) if data else dict()
+            if not isinstance(body, dict):
+                raise ValueError("The body is not a JSON object")
+            result = endpoint(dict(parse_qsl(url.query)), body, *args)
+            if isinstance(result, dict):
+                self.send_json(200, result)
+                return
+            items = iter(result)
+            # the first item runs the query, its errors are still a 400
+            first = next(items, None)
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self.log_error("%s failed: %r", url.path, e)
+            self.send_json(500, {"error": str(e)})
+            return
+        self.send_stream(first, items)
+
+    def send_json(self, status, result):
+        data = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def send_stream(self, first, items):
+        """Send first and the rest of items as a JSON array in chunks."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        parts = ["["]
+        if first is not None:
+            parts.append(json.dumps(first))
+            for item in items:
+                parts.append("," + json.dumps(item))
+                if len(parts) >= CHUNK_ITEMS:
+                    self.send_chunk("".join(parts))
+                    parts.clear()
+        parts.append("]")
+        self.send_chunk("".join(parts))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class ApiServer(HTTPServer):
+    """Serves the Api with a fixed pool of worker threads instead of a
+    thread per connection, so every worker keeps its read-only connection
+    between requests."""
+
+    def __init__(self, address, api, workers=8, quiet=False):
+        super().__init__(address, RequestHandler)
+        self.api = api
+        self.quiet = quiet
+        self.connections = queue.Queue()
+        self.workers = [threading.Thread(target=self.work) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def process_request(self, request, client_address):
+        self.connections.put((request, client_address))
+
+    def work(self):
+        try:
+            while True:
+                connection = self.connections.get()
+                if connection is None:
+                    break
+                request, client_address = connection
+                try:
+                    self.finish_request(request, client_address)
+                except Exception:
+                    self.handle_error(request, client_address)
+                finally:
+                    self.shutdown_request(request)
+        finally:
+            self.api.reader.close()
+
+    def server_close(self):
+        super().server_close()
+        for _ in self.workers:
+            self.connections.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.api.close()
+
+
+def serve(db, host="127.0.0.1", port=8080, workers=8, cache_bytes=MAX_BYTES):
+    server = ApiServer((host, port), Api(db, cache_bytes), workers)
+    print("Serving on http://{}:{}/".format(*server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -4,18 +4,23 @@ import sys
 import random
 
 from morgy.database import Database
+from morgy.database.tag_reader import TagReader
+from morgy.spreader import spread
 
 
 class SmartPicker:
-    def __init__(self, db):
+    def __init__(self, db, track_ids=None):
         self.db = db
+        # only these tracks are picked if given, see LabelIndex
+        self.track_ids = track_ids
+        self.tag_reader = TagReader()
 
     def build_dict_from_database(self):
         titles = dict()
-        generator = self.db.get_title_path_and_prio()
+        # the variants of a song share a cluster, see TitleClusterer; tracks
+        # added since the last clustering go by their title without ' (live)'
+        generator = self.db.get_cluster_path_and_prio(self.track_ids)
         for (title, path, prio) in generator:
-            # remove ' (live)', because it is the same song
-            title = "".join(title.split(" (live)"))
             if title not in titles:
                 titles[title] = list()
             titles[title].append((path, prio))
@@ -30,25 +35,66 @@ class SmartPicker:
                 selected_paths.append(selected_path)
         return selected_paths
 
-    def pick(self, quantity):
+    def get_duration(self, path, durations):
+        """Return the seconds of path, None if neither the database nor the
+        file knows them."""
+        duration = durations.get(path)
+        if duration is None:
+            # not known by the database yet, the file header tells it cheaply
+            duration = self.tag_reader.read_duration(path)
+        return duration
+
+    def pick(self, quantity=None, duration=None):
+        """Quantity is a size budget in bytes, duration is a time budget in
+        seconds. Picking stops as soon as any of the given budgets runs out;
+        with a time budget, songs of unknown duration are not picked."""
         # db -> dict: 'title': [(path1, prio1), (path2, prio2), ...]
         titles = self.build_dict_from_database()
         # pick one (path, prio) for each title
         # put paths prio times in a list (path1, path1, path1, path2, ...)
         selected_paths = self.get_weighted_selected_paths(titles)
         random.shuffle(selected_paths)
+        if duration is not None:
+            durations = dict(self.db.get_path_and_duration())
 
-        # copy to a new list if: not copied yet, quantity is not reached yet
+        # copy to a new list if: not copied yet, budgets are not reached yet
         list_to_copy = list()
+        # songs without a duration would not use up the time budget
+        unknown = set()
         for path in selected_paths:
-            if path not in list_to_copy:
+            if path not in list_to_copy and path not in unknown:
+                if duration is not None:
+                    song_duration = self.get_duration(path, durations)
+                    if song_duration is None:
+                        unknown.add(path)
+                        continue
                 list_to_copy.append(path)
-                quantity = quantity - os.stat(path).st_size
-                if quantity < 0:
+                if quantity is not None:
+                    quantity = quantity - os.stat(path).st_size
+                if duration is not None:
+                    duration = duration - song_duration
+                if (quantity is not None and quantity < 0) or (
+                    duration is not None and duration < 0
+                ):
                     break
 
         return list_to_copy
 
+    def spread(self, list_to_copy):
+        """Order the picked paths so that the songs of an artist or album do
+        not play back to back."""
+        wanted = set(list_to_copy)
+        albums = {
+            path: (artist, album)
+            for path, artist, album in self.db.get_path_artist_and_album()
+            if path in wanted
+        }
+        return spread(
+            list_to_copy,
+            lambda path: albums.get(path, (None, None))[0],
+            lambda path: albums.get(path, (None, None)),
+        )
+
     def pick_all_from_guitar(self):
         guitar_paths = self.db.get_all_guitar_paths()
         list_to_copy = list()
@@ -57,9 +103,8 @@ class SmartPicker:
         return list_to_copy
 
     def decrease_prio(self, list_to_copy):
-        for path in list_to_copy:
-            self.db.decrease_prio(path)
-        self.db.commit_and_close()
+        self.db.decrease_prios(list_to_copy)
+        self.db.commit()
 
     def prepend_number(self, path, number):
         number_to_prepend = str(number).zfill(3)
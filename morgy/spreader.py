@@ -0,0 +1,66 @@
+import heapq
+import random
+
+
+def interleave(groups, rng=random):
+    """Merge lists of items so that the items of a list are spread apart and
+    keep their order. The items of a list of k out of n are due about n / k
+    apart from a random offset, and the earliest due goes next through a
+    heap, unless its list was the previous one. A list holding half of the
+    items left goes next anyway, otherwise its items would end up back to
+    back. Takes O(n log g) for g lists."""
+    groups = [group for group in groups if group]
+    left = sum(len(group) for group in groups)
+    taken = [0] * len(groups)
+    # (due, index, taken), stale once the list has moved on
+    due = [(rng.random() / len(group), index, 0) for index, group in enumerate(groups)]
+    heapq.heapify(due)
+    # (-items left, index), stale once the list has fewer left
+    largest = [(-len(group), index) for index, group in enumerate(groups)]
+    heapq.heapify(largest)
+
+    def is_stale(entry):
+        return entry[2] != taken[entry[1]]
+
+    order = list()
+    previous = None
+    while left:
+        while -largest[0][0] != len(groups[largest[0][1]]) - taken[largest[0][1]]:
+            heapq.heappop(largest)
+        while is_stale(due[0]):
+            heapq.heappop(due)
+        if -largest[0][0] * 2 > left:
+            index = largest[0][1]
+        elif due[0][1] == previous:
+            # the second earliest, if there is any other list
+            first = heapq.heappop(due)
+            while due and is_stale(due[0]):
+                heapq.heappop(due)
+            index = due[0][1] if due else first[1]
+            heapq.heappush(due, first)
+        else:
+            index = due[0][1]
+        group = groups[index]
+        order.append(group[taken[index]])
+        taken[index] += 1
+        left -= 1
+        previous = index
+        if taken[index] < len(group):
+            next_due = (taken[index] + rng.random()) / len(group)
+            heapq.heappush(due, (next_due, index, taken[index]))
+            heapq.heappush(largest, (-(len(group) - taken[index]), index))
+    return order
+
+
+def spread(items, artist, album, rng=random):
+    """Order items so that the songs of an artist, and the songs of an album
+    of an artist, are spread apart instead of playing back to back. artist
+    and album return them for an item. The albums of an artist are
+    interleaved first, then the artists."""
+    artists = dict()
+    for item in items:
+        albums = artists.setdefault(artist(item), dict())
+        albums.setdefault(album(item), list()).append(item)
+    return interleave(
+        [interleave(albums.values(), rng) for albums in artists.values()], rng
+    )
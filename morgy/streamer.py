@@ -0,0 +1,288 @@
+import asyncio
+import io
+import mimetypes
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+from morgy.database.labels import LabelIndex, normalise as normalise_labels
+from morgy.database.query_cache import MAX_BYTES, QueryCache
+from morgy.database.selection import Selection
+from morgy.playlist_writer import PlaylistWriter
+
+# seconds an idle keep-alive connection is kept open
+IDLE_TIMEOUT = 30.0
+RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+# not known to every mimetypes database
+AUDIO_TYPES = {".flac": "audio/flac", ".wma": "audio/x-ms-wma", ".m4a": "audio/mp4"}
+
+
+def parse_range(header, size):
+    """Return (first, last) byte of a Range header of a file of size bytes,
+    or None to send the whole file: ranges that are not one byte range are
+    ignored, as HTTP allows. Raise ValueError if the range is past the end
+    of the file."""
+    match = RANGE.fullmatch(header.strip()) if header else None
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # the last bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError("Empty range")
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise ValueError("Range past the end")
+    last = min(int(last), size - 1) if last else size - 1
+    return first, last
+
+
+def content_type(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in AUDIO_TYPES:
+        return AUDIO_TYPES[extension]
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+class Streamer:
+    """Streams the songs of the library to players on the network:
+
+    GET /tracks/ID.mp3                  the file of the track with id ID, the
+                                        extension is only for the players;
+                                        Range requests are answered with 206
+    GET /playlist.m3u?selection=...&labels=...&spread=yes
+                                        an extended M3U of the songs pointing
+                                        at /tracks of this server
+
+    HEAD works on both. One asyncio event loop serves every listener, the
+    files are sent with sendfile, so their bytes do not pass through Python.
+    The database is read by a single thread next to it, through a read-only
+    copy of db; playlists are kept in a QueryCache until the library
+    changes, except the spread ones, which are shuffled every time."""
+
+    def __init__(self, db, cache_bytes=MAX_BYTES):
+        self.reader = db.reader()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.cache = QueryCache(self.reader, cache_bytes)
+        self.label_index = LabelIndex(self.reader)
+        self.server = None
+        # of the open connections
+        self.handlers = set()
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        for handler in self.handlers:
+            handler.cancel()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        await self.server.wait_closed()
+
+    def close(self):
+        self.executor.submit(self.reader.close).result()
+        self.executor.shutdown()
+
+    async def read(self, function, *args):
+        """Run function(*args) in the database thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    async def handle(self, reader, writer):
+        handler = asyncio.current_task()
+        self.handlers.add(handler)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT
+                    )
+                except (
+                    asyncio.IncompleteReadError,
+                    asyncio.LimitOverrunError,
+                    asyncio.TimeoutError,
+                ):
+                    break
+                head = head.decode("latin-1")
+                try:
+                    keep_alive = await self.respond(head, writer)
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    # e.g. the database is locked by a busy writer
+                    print("{} failed: {!r}".format(head.split("\r\n")[0], e), file=sys.stderr)
+                    await self.send(writer, HTTPStatus.INTERNAL_SERVER_ERROR, keep_alive=False)
+                    break
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.handlers.discard(handler)
+            writer.close()
+
+    async def respond(self, head, writer):
+        """Answer the request of head, return whether the connection is
+        kept open."""
+        request, *lines = head.rstrip("\r\n").split("\r\n")
+        try:
+            method, target, version = request.split()
+        except ValueError:
+            await self.send(writer, HTTPStatus.BAD_REQUEST, keep_alive=False)
+            return False
+        headers = dict()
+        for line in lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        # requests with a body are not expected, the connection ends after
+        # them instead of reading it
+        keep_alive = (
+            version == "HTTP/1.1"
+            and headers.get("connection", "").lower() != "close"
+            and "content-length" not in headers
+            and "transfer-encoding" not in headers
+        )
+        if method not in ("GET", "HEAD"):
+            await self.send(
+                writer,
+                HTTPStatus.METHOD_NOT_ALLOWED,
+                [("Allow", "GET, HEAD")],
+                keep_alive=keep_alive,
+            )
+            return keep_alive
+        url = urlsplit(target)
+        parts = url.path.strip("/").split("/")
+        head_only = method == "HEAD"
+        if len(parts) == 2 and parts[0] == "tracks":
+            await self.send_track(
+                writer, parts[1], headers.get("range"), head_only, keep_alive
+            )
+        elif parts == ["playlist.m3u"]:
+            # the address the player reached us at
+            host = headers.get("host")
+            if not host:
+                host = "{}:{}".format(*writer.get_extra_info("sockname")[:2])
+            await self.send_playlist(
+                writer, dict(parse_qsl(url.query)), "http://" + host, head_only, keep_alive
+            )
+        else:
+            await self.send(writer, HTTPStatus.NOT_FOUND, keep_alive=keep_alive)
+        return keep_alive
+
+    async def send(
+        self, writer, status, headers=(), body=b"", head_only=False, keep_alive=True
+    ):
+        lines = ["HTTP/1.1 {} {}".format(status.value, status.phrase)]
+        lines.extend("{}: {}".format(name, value) for name, value in headers)
+        if not any(name == "Content-Length" for name, _ in headers):
+            lines.append("Content-Length: {}".format(len(body)))
+        if not keep_alive:
+            lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if body and not head_only:
+            writer.write(body)
+        await writer.drain()
+
+    async def send_track(self, writer, name, range_header, head_only, keep_alive):
+        track_id = name.split(".")[0]
+        path = None
+        if track_id.isdigit():
+            path = await self.read(self.reader.get_path_of_track, int(track_id))
+        try:
+            song = open(path, "rb") if path is not None else None
+        except OSError:
+            song = None
+        if song is None:
+            await self.send(writer, HTTPStatus.NOT_FOUND, keep_alive=keep_alive)
+            return
+        with song:
+            size = os.fstat(song.fileno()).st_size
+            headers = [("Content-Type", content_type(path)), ("Accept-Ranges", "bytes")]
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                headers.append(("Content-Range", "bytes */{}".format(size)))
+                await self.send(
+                    writer,
+                    HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                    headers,
+                    keep_alive=keep_alive,
+                )
+                return
+            if byte_range is None:
+                status, first, count = HTTPStatus.OK, 0, size
+            else:
+                first, last = byte_range
+                status, count = HTTPStatus.PARTIAL_CONTENT, last - first + 1
+                headers.append(("Content-Range", "bytes {}-{}/{}".format(first, last, size)))
+            headers.append(("Content-Length", str(count)))
+            await self.send(writer, status, headers, keep_alive=keep_alive)
+            if not head_only and count:
+                loop = asyncio.get_running_loop()
+                await loop.sendfile(writer.transport, song, first, count)
+
+    async def send_playlist(self, writer, query, base, head_only, keep_alive):
+        try:
+            playlist = await self.read(self.playlist, query, base)
+        except ValueError as e:
+            await self.send(
+                writer,
+                HTTPStatus.BAD_REQUEST,
+                [("Content-Type", "text/plain; charset=utf-8")],
+                str(e).encode(),
+                head_only,
+                keep_alive,
+            )
+            return
+        await self.send(
+            writer,
+            HTTPStatus.OK,
+            [("Content-Type", "audio/x-mpegurl; charset=utf-8")],
+            playlist,
+            head_only,
+            keep_alive,
+        )
+
+    def playlist(self, query, base):
+        """The extended M3U of query, encoded. Runs in the database
+        thread."""
+        selection = Selection.parse(query.get("selection", ""))
+        expression = query.get("labels")
+        spread = query.get("spread", "no").lower() in ("yes", "true", "1")
+
+        def write():
+            track_ids = self.label_index.track_ids(expression) if expression else None
+            playlist = io.StringIO()
+            writer = PlaylistWriter(self.reader, spread=spread, url=base)
+            writer.write_to([(playlist, selection, track_ids)])
+            return [playlist.getvalue().encode()]
+
+        if spread:
+            return write()[0]
+        labels = normalise_labels(expression) if expression else None
+        key = ("playlist", selection.key(), labels, base)
+        return self.cache.get(key, write)[0]
+
+
+def serve(db, host="0.0.0.0", port=8081, cache_bytes=MAX_BYTES):
+    streamer = Streamer(db, cache_bytes)
+
+    async def run():
+        server = await streamer.start(host, port)
+        print("Streaming on http://{}:{}/".format(*server.sockets[0].getsockname()[:2]))
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        streamer.close()
@@ -98,6 +98,20 @@ class TestCLI(unittest.TestCase):
         priorities = [row[0] for row in cursor.fetchall()]
         self.assertEqual(set(priorities), {5})
 
+    def test_update_command_with_workers(self):
+        album_dir = os.path.join(self.temp_dir, "00 All", "Artist", "1990 Album")
+        os.makedirs(album_dir)
+        for number in range(1, 4):
+            with open(os.path.join(album_dir, "0{} Song.mp3".format(number)), "w") as f:
+                f.write("content")
+
+        result = self.runner.invoke(morgy.morgy, ['update', '--workers', '2', os.path.join(self.temp_dir, "00 All")])
+
+        self.assertEqual(result.exit_code, 0)
+        cursor = self.test_db.cursor
+        cursor.execute("SELECT COUNT(*) FROM details")
+        self.assertEqual(cursor.fetchone()[0], 3)
+
     def test_update_command_invalid_priority(self):
         """Test update command with invalid priority."""
         music_dir = os.path.join(self.temp_dir, "music")
@@ -184,7 +198,7 @@ class TestCLI(unittest.TestCase):
         self.test_db.add_detail_row(song2, "Artist2", "1991", "Album2", "1", "02", "Song2", 1)
         
         playlist_file = os.path.join(self.temp_dir, "playlist.txt")
-        result = self.runner.invoke(morgy.morgy, ['write-playlist', playlist_file, "artist='Artist1'"])
+        result = self.runner.invoke(morgy.morgy, ['write-playlist', playlist_file, "artist=Artist1"])
         
         self.assertEqual(result.exit_code, 0)
         self.assertTrue(os.path.exists(playlist_file))
@@ -195,6 +209,82 @@ class TestCLI(unittest.TestCase):
             self.assertIn(song1, content)
             self.assertNotIn(song2, content)  # Should only have Artist1
 
+    def test_write_playlist_command_rejects_sql(self):
+        playlist_file = os.path.join(self.temp_dir, "playlist.txt")
+        result = self.runner.invoke(morgy.morgy, ['write-playlist', playlist_file, "1=1; DROP TABLE tracks"])
+
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn("Unknown field: 1", result.output)
+
+    def test_write_playlist_command_with_labels(self):
+        for number in range(1, 4):
+            self.test_db.add_detail_row("/test/song{}.mp3".format(number), "Artist", "1990", "Album", "1", "01", "Song", 1)
+        self.test_db.add_label_row("/test/song1.mp3", "car")
+        self.test_db.add_label_row("/test/song2.mp3", "car")
+        self.test_db.add_label_row("/test/song2.mp3", "christmas")
+
+        playlist_file = os.path.join(self.temp_dir, "playlist.txt")
+        result = self.runner.invoke(morgy.morgy, ['write-playlist', '--plain', '--labels', 'car AND NOT christmas', playlist_file])
+
+        self.assertEqual(result.exit_code, 0)
+        with open(playlist_file, "r") as f:
+            self.assertEqual(f.read(), "/test/song1.mp3\n")
+
+        result = self.runner.invoke(morgy.morgy, ['write-playlist', '--labels', 'car AND', playlist_file])
+        self.assertEqual(result.exit_code, 2)
+
+    def test_write_playlists_command(self):
+        self.test_db.add_detail_row("/test/song1.mp3", "Artist1", "1990", "Album1", "1", "01", "Song1", 1)
+        self.test_db.add_detail_row("/test/song2.mp3", "Artist2", "1991", "Album2", "1", "02", "Song2", 1)
+        definitions = os.path.join(self.temp_dir, "playlists.txt")
+        first = os.path.join(self.temp_dir, "first.m3u")
+        second = os.path.join(self.temp_dir, "second.m3u")
+        with open(definitions, "w") as f:
+            f.write("# nightly\n{} artist=Artist1\n\n{} year=1990..1991\n".format(first, second))
+
+        result = self.runner.invoke(morgy.morgy, ['write-playlists', '--relative-to', '/test', definitions])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output, "{}: 1 songs\n{}: 2 songs\n".format(first, second))
+        with open(first, "r") as f:
+            self.assertEqual(f.read(), "#EXTM3U\n#EXTINF:-1,Artist1 - Song1\nsong1.mp3\n")
+
+        with open(definitions, "w") as f:
+            f.write("{} genre=Punk\n".format(first))
+        result = self.runner.invoke(morgy.morgy, ['write-playlists', definitions])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn("line 1", result.output)
+
+    def test_label_and_unlabel_commands(self):
+        self.test_db.add_detail_row("/test/song1.mp3", "Artist", "1990", "Album", "1", "01", "Song", 1)
+        playlist_file = os.path.join(self.temp_dir, "kids.m3u")
+        with open(playlist_file, "w") as f:
+            f.write("/test/song1.mp3\n/test/missing.mp3\n")
+
+        result = self.runner.invoke(morgy.morgy, ['label', 'kids', playlist_file])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(
+            result.output,
+            "1 songs found, 1 newly labelled.\n1 entries without a song:\n  /test/missing.mp3\n",
+        )
+
+        result = self.runner.invoke(morgy.morgy, ['unlabel', 'kids', '/test/song1.mp3'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output, "1 songs found, 1 unlabelled.\n")
+
+        result = self.runner.invoke(morgy.morgy, ['label', 'not', '/test/song1.mp3'])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn("Not a label name: not", result.output)
+
+    def test_search_command(self):
+        self.test_db.add_detail_row("/test/song1.mp3", "Kispál és a Borz", "1993", "Album1", "1", "01", "Song1", 1)
+        self.test_db.add_detail_row("/test/song2.mp3", "Artist2", "1991", "Album2", "1", "02", "Song2", 1)
+
+        result = self.runner.invoke(morgy.morgy, ['search', 'kispal'])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output, "/test/song1.mp3\n")
+
     def test_pick_and_copy_command(self):
         """Test the pick_and_copy CLI command."""
         # Create test files with proper structure for DetailFetcher
@@ -224,6 +314,27 @@ class TestCLI(unittest.TestCase):
         # Actual file copying depends on random selection and quantity limits
         self.assertGreaterEqual(len(copied_files), 0)
 
+    def test_pick_and_copy_command_with_hours(self):
+        source_dir = os.path.join(self.temp_dir, "source")
+        os.makedirs(source_dir)
+        for i in range(5):
+            path = os.path.join(source_dir, "song{}.mp3".format(i))
+            with open(path, "w") as f:
+                f.write("content")
+            self.test_db.add_detail_row(path, "Artist", "1990", "Album", "1", "01", "Song{}".format(i), 1, 1800.0)
+
+        dest_dir = os.path.join(self.temp_dir, "dest")
+        os.makedirs(dest_dir)
+
+        result = self.runner.invoke(morgy.morgy, ['pick-and-copy', '--hours', '1.2', dest_dir + os.sep])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(len(os.listdir(dest_dir)), 3)
+
+    def test_pick_and_copy_command_without_budget(self):
+        result = self.runner.invoke(morgy.morgy, ['pick-and-copy', self.temp_dir + os.sep])
+        self.assertNotEqual(result.exit_code, 0)
+
     def test_write_guitar_files_command(self):
         """Test the write_guitar_files CLI command."""
         # Create test files
@@ -285,6 +396,24 @@ class TestCLI(unittest.TestCase):
         # Exit code 1 is acceptable if vim/system calls fail
         self.assertIn(result.exit_code, [0, 1])
 
+    def test_dedupe_command(self):
+        source_dir = os.path.join(self.temp_dir, "source")
+        os.makedirs(source_dir)
+        for name in ["a.mp3", "b.mp3"]:
+            path = os.path.join(source_dir, name)
+            with open(path, "w") as f:
+                f.write("same content")
+            self.test_db.add_detail_row(path, "Artist", "1990", "Album", "1", "01", name, 1)
+        report_file = os.path.join(self.temp_dir, "report.txt")
+
+        result = self.runner.invoke(morgy.morgy, ['dedupe', '--output', report_file])
+
+        self.assertEqual(result.exit_code, 0)
+        with open(report_file) as f:
+            report = f.read()
+        self.assertIn(os.path.join(source_dir, "a.mp3"), report)
+        self.assertIn("1 redundant files", report)
+
     def test_cli_help(self):
         """Test that CLI help works."""
         result = self.runner.invoke(morgy.morgy, ['--help'])
@@ -2,9 +2,10 @@ import unittest
 import os
 import sqlite3
 import tempfile
+import threading
 from unittest.mock import patch, MagicMock
 
-from morgy.database import Database
+from morgy.database import Database, SUBTREE_DIRECTORY_IDS, TRACK_ID
 
 
 class TestNewDatabase(unittest.TestCase):
@@ -30,6 +31,69 @@ class TestNewDatabase(unittest.TestCase):
                 new_db.conn.close()
 
 
+class TestOldDatabase(unittest.TestCase):
+    def test_duration_column_is_added_to_an_old_database(self):
+        with tempfile.NamedTemporaryFile() as db_file:
+            conn = sqlite3.connect(db_file.name)
+            conn.execute(
+                """CREATE TABLE details(
+                path text primary key not null,
+                artist text,
+                year int,
+                album text,
+                cd_number int,
+                number int,
+                title text not null,
+                priority int not null
+                )"""
+            )
+            conn.execute("INSERT INTO details VALUES ('p', 'a', 1, 'b', 1, 1, 't', 5)")
+            conn.commit()
+            conn.close()
+
+            db = Database(db_file.name)
+            try:
+                db.cursor.execute("SELECT path, priority, duration FROM details")
+                self.assertEqual(db.cursor.fetchall(), [("p", 5, None)])
+            finally:
+                db.conn.close()
+
+    def test_old_guitar_table_follows_moved_paths(self):
+        with tempfile.NamedTemporaryFile() as db_file:
+            conn = sqlite3.connect(db_file.name)
+            conn.execute(
+                """CREATE TABLE details(
+                path text primary key not null,
+                artist text,
+                year int,
+                album text,
+                cd_number int,
+                number int,
+                title text not null,
+                priority int not null
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE guitar(
+                path text primary key not null,
+                guitar int,
+                FOREIGN KEY(path) REFERENCES details(path) ON DELETE CASCADE
+                )"""
+            )
+            conn.execute("INSERT INTO details VALUES ('p', 'a', 1, 'b', 1, 1, 't', 5)")
+            conn.execute("INSERT INTO guitar VALUES ('p', 1)")
+            conn.commit()
+            conn.close()
+
+            db = Database(db_file.name)
+            try:
+                db.move_entry("p", "q", "a", 1, "b", 1, 1, "t", None, None, None)
+                db.cursor.execute("SELECT * FROM guitar")
+                self.assertEqual(db.cursor.fetchall(), [("q", 1)])
+            finally:
+                db.conn.close()
+
+
 class TestExistingDatabase(unittest.TestCase):
     def setUp(self):
         # Suppress print statements during tests
@@ -66,16 +130,26 @@ class TestExistingDatabase(unittest.TestCase):
 
     def test_no_new_tables_are_created(self):
         existing_tables = self.query(
-            "SELECT name FROM sqlite_master WHERE type='table' or type='view'"
+            """SELECT name FROM sqlite_master
+            WHERE (type='table' or type='view') AND name NOT LIKE 'sqlite_%'
+            AND name NOT LIKE 'tracks_search_%'"""
         )
         self.assertTrue(("details",) in existing_tables)
         self.assertTrue(("guitar",) in existing_tables)
-        self.assertEqual(len(existing_tables), 2)
+        self.assertTrue(("directories",) in existing_tables)
+        self.assertTrue(("tracks",) in existing_tables)
+        self.assertTrue(("labels",) in existing_tables)
+        self.assertTrue(("track_labels",) in existing_tables)
+        self.assertTrue(("tracks_search",) in existing_tables)
+        self.assertTrue(("track_changes",) in existing_tables)
+        self.assertTrue(("generation",) in existing_tables)
+        self.assertTrue(("clustering",) in existing_tables)
+        self.assertEqual(len(existing_tables), 10)
         self.assertEqual(len(existing_tables[0]), 1)
 
     def test_querying_an_added_row(self):
         row_details = ("path", "artist", "1990", "album", "1", "02", "title", 3)
-        expected = ("path", "artist", 1990, "album", 1, 2, "title", 3)
+        expected = ("path", "artist", 1990, "album", 1, 2, "title", 3) + (None,) * 6
         self.db.add_detail_row(*row_details)
         result = self.query("SELECT * FROM details WHERE path='path'")
         self.assertEqual(expected, result[0])
@@ -87,6 +161,68 @@ class TestExistingDatabase(unittest.TestCase):
         result = self.query("SELECT * FROM guitar WHERE path='path'")
         self.assertEqual(("path", 1), result[0])
 
+    def test_querying_an_added_row_with_duration(self):
+        row_details = ("path", "artist", "1990", "album", "1", "02", "title", 3, 201.5)
+        self.db.add_detail_row(*row_details)
+        result = self.query("SELECT duration FROM details WHERE path='path'")
+        self.assertEqual(result[0][0], 201.5)
+
+    def test_get_path_and_duration(self):
+        self.db.add_detail_row("path", "artist", "1990", "album", "1", "02", "title", 3, 60.0)
+        durations = dict(self.db.get_path_and_duration())
+        self.assertEqual(durations["path"], 60.0)
+        self.assertIsNone(durations["/path/to/song1.mp3"])
+
+    def test_add_detail_rows(self):
+        rows = [
+            ("path1", "artist", "1990", "album", "1", "01", "title1", 3, 60.0, 1024, 1),
+            ("path2", "artist", "1990", "album", "1", "02", "title2", 3, None, None, None),
+            ("/path/to/song1.mp3", "other", "1990", "album", "1", "02", "other", 9, None, 1, 2),
+        ]
+        self.db.add_detail_rows(rows)
+        result = self.query("SELECT path, title, priority FROM details ORDER BY path")
+        self.assertEqual(
+            result,
+            [
+                ("/path/to/song1.mp3", "Song One", 5),
+                ("/path/to/song2.mp3", "Song Two", 3),
+                ("/path/to/song3.mp3", "Song Three", 7),
+                ("path1", "title1", 3),
+                ("path2", "title2", 3),
+            ],
+        )
+
+    def test_get_same_size_rows(self):
+        self.db.set_sizes([(10, "/path/to/song1.mp3"), (10, "/path/to/song2.mp3"), (20, "/path/to/song3.mp3")])
+        self.assertEqual(self.db.get_paths_without_size(), [])
+        rows = list(self.db.get_same_size_rows())
+        self.assertEqual(
+            sorted(rows),
+            [("/path/to/song1.mp3", 10, None, None), ("/path/to/song2.mp3", 10, None, None)],
+        )
+
+    def test_set_hashes_keeps_unknown_values(self):
+        self.db.set_hashes([("partial", None, "/path/to/song1.mp3")])
+        self.db.set_hashes([(None, "full", "/path/to/song1.mp3")])
+        result = self.query("SELECT partial_hash, hash FROM details WHERE path=?", ["/path/to/song1.mp3"])
+        self.assertEqual(result, [("partial", "full")])
+
+    def test_move_entry_keeps_priority_and_guitar(self):
+        self.db.move_entry(
+            "/path/to/song1.mp3", "/new/song1.mp3", "Artist", 1990, "Album", 1, 1, "New", 60.0, 10, 1
+        )
+        result = self.query("SELECT path, title, priority FROM details WHERE path LIKE '%song1%'")
+        self.assertEqual(result, [("/new/song1.mp3", "New", 5)])
+        result = self.query("SELECT path FROM guitar WHERE path LIKE '%song1%'")
+        self.assertEqual(result, [("/new/song1.mp3",)])
+
+    def test_get_paths_with_inode(self):
+        self.db.add_detail_row("path", "artist", "1990", "album", "1", "02", "title", 3, None, 10, 42)
+        self.assertEqual(self.db.get_paths_with_inode(42, 10), ["path"])
+        self.assertEqual(self.db.get_paths_with_inode(42, 11), [])
+        self.assertTrue(self.db.has_path("path"))
+        self.assertFalse(self.db.has_path("other"))
+
     def test_get_title_path_and_prio_returns_valid_data(self):
         data = self.db.get_title_path_and_prio()
         (title, path, prio) = next(data)
@@ -103,7 +239,8 @@ class TestExistingDatabase(unittest.TestCase):
 
     def test_get_path_where_returns_valid_data(self):
         data = self.db.get_rows_from_table("details")
-        (path, artist, _, _, _, _, title, _) = next(data)
+        row = next(data)
+        (path, artist, title) = (row[0], row[1], row[6])
         where_clause = "artist='{}' AND title='{}'".format(artist, title)
         expected_path = next(self.db.get_path_where(where_clause))
         self.assertEqual(path, expected_path[0])
@@ -166,11 +303,17 @@ class TestExistingDatabase(unittest.TestCase):
         result = self.query("SELECT path FROM details WHERE path=?", ["/path/to/song2.mp3"])
         self.assertEqual(len(result), 0)
 
-    def test_delete_entry_with_path_like_pattern(self):
-        # Test LIKE pattern matching
+    def test_delete_entry_with_path_matches_exactly(self):
+        self.db.add_detail_row("/path/to/100% song_1.mp3", "Artist", "1990", "Album", "1", "01", "Title", 5)
         self.db.delete_entry_with_path("%song1%")
+        self.db.delete_entry_with_path("/path/to/100% song_1.mp3")
         result = self.query("SELECT path FROM details WHERE path LIKE ?", ["%song1%"])
-        self.assertEqual(len(result), 0)
+        self.assertEqual(result, [("/path/to/song1.mp3",)])
+        self.assertFalse(self.db.has_path("/path/to/100% song_1.mp3"))
+
+    def test_delete_entries_with_paths(self):
+        self.db.delete_entries_with_paths(["/path/to/song1.mp3", "/path/to/song3.mp3", "/not/there.mp3"])
+        self.assertEqual(self.query("SELECT path FROM details"), [("/path/to/song2.mp3",)])
 
     def test_delete_entry_with_path_cascades_to_guitar(self):
         # Delete a detail entry that has a guitar entry
@@ -187,10 +330,30 @@ class TestExistingDatabase(unittest.TestCase):
         result = self.query("SELECT path FROM details WHERE path=?", ["/path/to/song1.mp3"])
         self.assertEqual(len(result), 1)
 
-    def test_delete_entry_with_path_from_guitar_like_pattern(self):
+    def test_delete_entry_with_path_from_guitar_matches_exactly(self):
         self.db.delete_entry_with_path_from_guitar("%song1%")
         result = self.query("SELECT path FROM guitar WHERE path LIKE ?", ["%song1%"])
-        self.assertEqual(len(result), 0)
+        self.assertEqual(len(result), 1)
+
+    def test_delete_entries_from_guitar_under(self):
+        self.db.add_detail_row("/path/tone/song4.mp3", "Artist", "1990", "Album", "1", "04", "Title", 5)
+        self.db.add_guitar_row("/path/tone/song4.mp3", 1)
+        self.db.delete_entries_from_guitar_under("/path/to/")
+        self.assertEqual(self.query("SELECT path FROM guitar"), [("/path/tone/song4.mp3",)])
+        self.assertEqual(len(self.query("SELECT path FROM details")), 4)
+
+    def test_path_operations_use_indexes(self):
+        statements = [
+            "SELECT 1 FROM tracks WHERE id = ({})".format(TRACK_ID),
+            "DELETE FROM tracks WHERE dir_id IN ({})".format(SUBTREE_DIRECTORY_IDS),
+            "DELETE FROM track_labels WHERE label_id = 1 AND track_id = ({})".format(TRACK_ID),
+        ]
+        for statement in statements:
+            plan = self.query("EXPLAIN QUERY PLAN " + statement, [""] * statement.count("?"))
+            details = [row[3] for row in plan]
+            self.assertFalse(
+                any(detail.startswith("SCAN") for detail in details), details
+            )
 
     def test_commit_and_close(self):
         # Add a row and commit/close
@@ -245,23 +408,348 @@ class TestExistingDatabase(unittest.TestCase):
         self.assertIn("/path/to/song1.mp3", path_values)
         self.assertIn("/path/to/song3.mp3", path_values)
 
-    def test_decrease_prio_like_pattern(self):
-        # Test that LIKE pattern works in decrease_prio
+    def test_decrease_prio_matches_exactly(self):
         self.db.add_detail_row("/test/song.mp3", "Artist", "1990", "Album", "1", "01", "Title", 5)
         self.db.decrease_prio("%song%")
         result = self.query("SELECT priority FROM details WHERE path=?", ["/test/song.mp3"])
-        self.assertEqual(result[0][0], 4)
+        self.assertEqual(result[0][0], 5)
 
-    def test_decrease_prio_multiple_matches(self):
-        # Add multiple paths matching pattern
+    def test_decrease_prios(self):
         self.db.add_detail_row("/test/song1.mp3", "Artist", "1990", "Album", "1", "01", "Title", 5)
         self.db.add_detail_row("/test/song2.mp3", "Artist", "1990", "Album", "1", "02", "Title", 3)
-        self.db.decrease_prio("%song%")
+        self.db.decrease_prios(["/test/song1.mp3", "/test/song2.mp3"])
         result1 = self.query("SELECT priority FROM details WHERE path=?", ["/test/song1.mp3"])
         result2 = self.query("SELECT priority FROM details WHERE path=?", ["/test/song2.mp3"])
         self.assertEqual(result1[0][0], 4)
         self.assertEqual(result2[0][0], 2)
 
+    def test_decrease_prio_under(self):
+        self.db.add_detail_row("/test/song1.mp3", "Artist", "1990", "Album", "1", "01", "Title", 5)
+        self.db.add_detail_row("/test/sub/song2.mp3", "Artist", "1990", "Album", "1", "02", "Title", 3)
+        self.db.decrease_prio_under("/test")
+        result1 = self.query("SELECT priority FROM details WHERE path=?", ["/test/song1.mp3"])
+        result2 = self.query("SELECT priority FROM details WHERE path=?", ["/test/sub/song2.mp3"])
+        self.assertEqual(result1[0][0], 4)
+        self.assertEqual(result2[0][0], 2)
+
+
+    def test_tracks_of_a_directory_share_its_row(self):
+        self.assertEqual(self.query("SELECT path FROM directories"), [("/path/to",)])
+        self.assertEqual(
+            self.query("SELECT filename FROM tracks ORDER BY filename"),
+            [("song1.mp3",), ("song2.mp3",), ("song3.mp3",)],
+        )
+
+    def test_paths_without_parent_directory_are_kept(self):
+        for path in ["/root.mp3", "relative.mp3", "relative/song.mp3"]:
+            self.db.add_detail_row(path, "Artist", "1990", "Album", "1", "01", "Title", 5)
+            self.assertTrue(self.db.has_path(path))
+            self.assertEqual(self.query("SELECT path FROM details WHERE path=?", [path]), [(path,)])
+
+    def test_delete_entries_under_is_a_range_scan(self):
+        self.db.add_detail_row("/path/to/sub/song4.mp3", "Artist", "1990", "Album", "1", "04", "Title", 5)
+        self.db.add_detail_row("/path/tone/song5.mp3", "Artist", "1990", "Album", "1", "05", "Title", 5)
+        self.db.delete_entries_under("/path/to")
+        self.assertEqual(self.query("SELECT path FROM details"), [("/path/tone/song5.mp3",)])
+        self.assertEqual(self.query("SELECT path FROM guitar"), [])
+
+        plan = self.query(
+            """EXPLAIN QUERY PLAN DELETE FROM tracks WHERE dir_id IN (
+            SELECT id FROM directories WHERE path = ? OR (path >= ? AND path < ?))""",
+            ["/path/to", "/path/to/", "/path/to0"],
+        )
+        self.assertFalse(any(row[3].startswith("SCAN") for row in plan))
+
+
+class TestDatabaseWithFullPaths(unittest.TestCase):
+    """Databases of older versions stored the full path in details."""
+
+    def test_details_are_moved_to_tracks(self):
+        with tempfile.NamedTemporaryFile() as db_file:
+            conn = sqlite3.connect(db_file.name)
+            conn.execute(
+                """CREATE TABLE details(
+                path text primary key not null,
+                artist text,
+                year int,
+                album text,
+                cd_number int,
+                number int,
+                title text not null,
+                priority int not null
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE guitar(
+                path text primary key not null,
+                guitar int,
+                FOREIGN KEY(path) REFERENCES details(path)
+                )"""
+            )
+            conn.execute("INSERT INTO details VALUES ('/a/1.mp3', 'a', 1, 'b', 1, 1, 't', 5)")
+            conn.execute("INSERT INTO details VALUES ('/a/2.mp3', 'a', 1, 'b', 1, 2, 'u', 3)")
+            conn.execute("INSERT INTO guitar VALUES ('/a/2.mp3', 1)")
+            conn.commit()
+            conn.close()
+
+            db = Database(db_file.name)
+            try:
+                db.cursor.execute("SELECT path, title, priority FROM details ORDER BY path")
+                self.assertEqual(db.cursor.fetchall(), [("/a/1.mp3", "t", 5), ("/a/2.mp3", "u", 3)])
+                db.cursor.execute("SELECT * FROM guitar")
+                self.assertEqual(db.cursor.fetchall(), [("/a/2.mp3", 1)])
+                db.cursor.execute("SELECT path FROM directories")
+                self.assertEqual(db.cursor.fetchall(), [("/a",)])
+                self.assertEqual([result[0] for result in db.search("u")], ["/a/2.mp3"])
+            finally:
+                db.conn.close()
+
+
+class TestSchemaMigrations(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+
+    def tearDown(self):
+        os.unlink(self.db_file.name)
+
+    def test_schema_version_is_stored(self):
+        db = Database(self.db_file.name)
+        try:
+            db.cursor.execute("PRAGMA user_version")
+            self.assertEqual(db.cursor.fetchone()[0], 8)
+            db.cursor.execute("SELECT name FROM sqlite_master WHERE type='index'")
+            indexes = [result[0] for result in db.cursor.fetchall()]
+            self.assertNotIn("tracks_title_key", indexes)
+            for index in [
+                "tracks_priority",
+                "tracks_artist",
+                "tracks_cluster",
+                "directories_category",
+            ]:
+                self.assertIn(index, indexes)
+            # ANALYZE ran after the migrations
+            db.cursor.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'")
+            self.assertIsNotNone(db.cursor.fetchone())
+        finally:
+            db.conn.close()
+
+    def test_failed_migration_changes_nothing(self):
+        conn = sqlite3.connect(self.db_file.name)
+        conn.execute("CREATE TABLE details(path text primary key not null, title text)")
+        conn.execute("INSERT INTO details VALUES ('/a/1.mp3', 't')")
+        conn.commit()
+        conn.close()
+
+        # there is no priority column to copy
+        with self.assertRaises(sqlite3.OperationalError):
+            Database(self.db_file.name)
+
+        conn = sqlite3.connect(self.db_file.name)
+        try:
+            tables = conn.execute("SELECT name FROM sqlite_master").fetchall()
+            self.assertEqual(tables, [("details",), ("sqlite_autoindex_details_1",)])
+            self.assertEqual(conn.execute("PRAGMA user_version").fetchone(), (0,))
+        finally:
+            conn.close()
+
+
+class TestConcurrentAccess(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.db = Database(self.db_file.name)
+
+    def tearDown(self):
+        self.db.conn.close()
+        os.unlink(self.db_file.name)
+
+    def test_connection_pragmas(self):
+        db = Database(self.db_file.name, cache_size=1024, mmap_size=4096)
+        try:
+            pragmas = [
+                db.conn.execute("PRAGMA {}".format(pragma)).fetchone()[0]
+                for pragma in ["journal_mode", "synchronous", "cache_size", "mmap_size"]
+            ]
+            # synchronous NORMAL is 1
+            self.assertEqual(pragmas, ["wal", 1, -1024, 4096])
+        finally:
+            db.conn.close()
+
+    def test_one_writer_and_readers_run_concurrently(self):
+        errors = list()
+        counts = list()
+        writing = threading.Event()
+        done = threading.Event()
+
+        def write():
+            db = Database(self.db_file.name)
+            try:
+                for batch in range(50):
+                    db.add_detail_rows(
+                        [
+                            ("/{}/{}.mp3".format(batch, i), "a", 1, "b", 1, i, "t", 5, None, None, None)
+                            for i in range(100)
+                        ]
+                    )
+                    writing.set()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                done.set()
+                db.conn.close()
+
+        def read():
+            db = Database(self.db_file.name)
+            try:
+                writing.wait()
+                seen = list()
+                while not done.is_set():
+                    seen.append(sum(1 for _ in db.get_title_path_and_prio()))
+                counts.append(seen)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.conn.close()
+
+        threads = [threading.Thread(target=write)]
+        threads.extend(threading.Thread(target=read) for _ in range(4))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(counts), 4)
+        for seen in counts:
+            # every read sees whole batches only, and never fewer rows
+            self.assertTrue(all(count % 100 == 0 for count in seen))
+            self.assertEqual(seen, sorted(seen))
+        self.db.cursor.execute("SELECT COUNT(*) FROM details")
+        self.assertEqual(self.db.cursor.fetchone()[0], 5000)
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.db = Database(self.db_file.name)
+        self.db.add_detail_rows(
+            [
+                ("/a/1.mp3", "Kispál és a Borz", "1993", "Naphoz holddal", None, "01", "Ha az életben", 5, None, None, None),
+                ("/a/2.mp3", "Tankcsapda", "1995", "Jönnek a férgek", None, "02", "Mennyország", 5, None, None, None),
+                ("/a/3.mp3", "Mennyország Tourist", "1990", "Live", None, "03", "Intro", 5, None, None, None),
+            ]
+        )
+
+    def tearDown(self):
+        self.db.close()
+        os.unlink(self.db_file.name)
+
+    def paths(self, query):
+        return [result[0] for result in self.db.search(query)]
+
+    def test_search_ignores_accents_and_case(self):
+        self.assertEqual(self.paths("KISPAL borz"), ["/a/1.mp3"])
+        self.assertEqual(self.paths("jonnek fergek"), ["/a/2.mp3"])
+
+    def test_search_matches_prefixes(self):
+        self.assertEqual(self.paths("tank"), ["/a/2.mp3"])
+
+    def test_search_ranks_title_matches_first(self):
+        self.assertEqual(self.paths("mennyorszag"), ["/a/2.mp3", "/a/3.mp3"])
+
+    def test_search_quotes_the_words(self):
+        self.assertEqual(self.paths('"Ha" OR NEAR(az'), [])
+        self.assertEqual(self.paths(""), [])
+
+    def test_search_follows_changes(self):
+        self.db.move_entry("/a/2.mp3", "/b/2.mp3", "Tankcsapda", "1995", "Agyarország", None, "02", "Mennyország", None, None, None)
+        self.db.delete_entry_with_path("/a/1.mp3")
+        self.assertEqual(self.paths("agyar"), ["/b/2.mp3"])
+        self.assertEqual(self.paths("jonnek"), [])
+        self.assertEqual(self.paths("kispal"), [])
+
+    def test_generation_goes_up_with_every_change(self):
+        generations = [self.db.get_generation()]
+        self.db.search("kispal")
+        self.assertEqual(self.db.get_generation(), generations[-1])
+        for change in [
+            lambda: self.db.decrease_prio("/a/1.mp3"),
+            lambda: self.db.add_label_row("/a/1.mp3", "car"),
+            lambda: self.db.set_categories([("Rock", "/a")]),
+            lambda: self.db.delete_entry_with_path("/a/1.mp3"),
+        ]:
+            change()
+            self.assertGreater(self.db.get_generation(), generations[-1])
+            generations.append(self.db.get_generation())
+
+    def test_search_uses_the_full_text_index(self):
+        self.db.cursor.execute(
+            "EXPLAIN QUERY PLAN SELECT rowid FROM tracks_search WHERE tracks_search MATCH ?",
+            ["kispal"],
+        )
+        self.assertIn("VIRTUAL TABLE INDEX", self.db.cursor.fetchone()[3])
+
+
+class TestConnectionLifecycle(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.db = Database(self.db_file.name)
+
+    def tearDown(self):
+        self.db.close()
+        os.unlink(self.db_file.name)
+
+    def count(self):
+        with Database(self.db_file.name) as other_db:
+            other_db.cursor.execute("SELECT COUNT(*) FROM details")
+            return other_db.cursor.fetchone()[0]
+
+    def add_row(self, path):
+        self.db.add_detail_row(path, "Artist", "1990", "Album", "1", "01", "Title", 5)
+
+    def test_context_manager_commits_and_closes(self):
+        with Database(self.db_file.name) as db:
+            db.add_detail_rows([("/a.mp3", None, None, None, None, None, "a", 5, None, None, None)])
+            conn = db.conn
+        self.assertEqual(self.count(), 1)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+    def test_transaction_commits_at_the_end_of_the_block(self):
+        with self.db.transaction():
+            self.add_row("/a.mp3")
+            with self.db.transaction():
+                self.add_row("/b.mp3")
+            self.assertEqual(self.count(), 0)
+        self.assertEqual(self.count(), 2)
+
+    def test_transaction_rolls_back_on_exceptions(self):
+        with self.assertRaises(ValueError):
+            with self.db.transaction():
+                self.add_row("/a.mp3")
+                raise ValueError()
+        self.assertFalse(self.db.has_path("/a.mp3"))
+        self.add_row("/b.mp3")
+        self.assertEqual(self.count(), 1)
+
+    def test_closed_database_reconnects_without_migrating(self):
+        self.db.close()
+        with patch.object(Database, "create_new_tables") as create_new_tables:
+            self.add_row("/a.mp3")
+        create_new_tables.assert_not_called()
+        self.assertTrue(self.db.has_path("/a.mp3"))
+
+    def test_threads_get_their_own_connection(self):
+        connections = list()
+        thread = threading.Thread(target=lambda: connections.append(self.db.conn))
+        thread.start()
+        thread.join()
+        self.assertIsNot(connections[0], self.db.conn)
+        self.assertIs(self.db.conn, self.db.conn)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -6,6 +6,7 @@ from unittest.mock import patch, MagicMock
 
 from morgy.database import Database
 from morgy.database.updater import DatabaseUpdater
+from morgy.tests.test_tag_reader import id3v2
 
 
 class TestDatabaseUpdater(unittest.TestCase):
@@ -167,6 +168,276 @@ class TestDatabaseUpdater(unittest.TestCase):
         self.assertIsNotNone(row[4])  # title should be set
         # The exact parsing depends on DetailFetcher logic, which is tested separately
 
+    def test_update_db_prefers_embedded_tags(self):
+        album_dir = os.path.join(self.temp_dir, "00 All", "01 Punk", "Artist", "1990 Album")
+        os.makedirs(album_dir)
+        song_path = os.path.join(album_dir, "01 Path title.mp3")
+        with open(song_path, "wb") as f:
+            f.write(id3v2([("TIT2", "Tag title"), ("TPE1", "Tag artist")]))
+
+        self.updater.update_db(os.path.join(self.temp_dir, "00 All"), 1)
+
+        cursor = self.db.cursor
+        cursor.execute("SELECT artist, year, album, number, title FROM details")
+        self.assertEqual(cursor.fetchone(), ("Tag artist", 1990, "Album", 1, "Tag title"))
+
+    def test_update_db_stores_durations(self):
+        test_dir = os.path.join(self.temp_dir, "00 All", "Test")
+        os.makedirs(test_dir)
+        with open(os.path.join(test_dir, "song.mp3"), "wb") as f:
+            # one second of 128 kbps constant bitrate mp3
+            f.write(b"\xff\xfb\x90\x00" + b"\x00" * (16000 - 4))
+        with open(os.path.join(test_dir, "other.mp3"), "w") as f:
+            f.write("fake mp3 content")
+
+        self.updater.update_db(os.path.join(self.temp_dir, "00 All"), 1)
+
+        cursor = self.db.cursor
+        cursor.execute("SELECT title, duration FROM details ORDER BY title")
+        self.assertEqual(cursor.fetchall(), [("other", None), ("song", 1.0)])
+
+    def test_update_db_without_reading_tags(self):
+        album_dir = os.path.join(self.temp_dir, "00 All", "01 Punk", "Artist", "1990 Album")
+        os.makedirs(album_dir)
+        with open(os.path.join(album_dir, "01 Path title.mp3"), "wb") as f:
+            f.write(id3v2([("TIT2", "Tag title")]))
+
+        updater = DatabaseUpdater(self.db, read_tags=False)
+        updater.update_db(os.path.join(self.temp_dir, "00 All"), 1)
+
+        cursor = self.db.cursor
+        cursor.execute("SELECT artist, title FROM details")
+        self.assertEqual(cursor.fetchone(), ("Artist", "Path title"))
+
+    def test_parallel_update_db_matches_serial_update(self):
+        for album in range(3):
+            album_dir = os.path.join(self.temp_dir, "00 All", "01 Punk", "Artist", "199{} Album".format(album))
+            os.makedirs(album_dir)
+            for number in range(1, 6):
+                with open(os.path.join(album_dir, "0{} Song.mp3".format(number)), "wb") as f:
+                    f.write(id3v2([("TIT2", "Song {} {}".format(album, number))]))
+        base_dir = os.path.join(self.temp_dir, "00 All")
+        self.updater.update_db(base_dir, 3)
+        cursor = self.db.cursor
+        cursor.execute("SELECT * FROM details ORDER BY path")
+        serial_rows = cursor.fetchall()
+        cursor.execute("DELETE FROM tracks")
+
+        updater = DatabaseUpdater(self.db, workers=2, batch_size=4, chunk_size=2)
+        updater.update_db(base_dir, 3)
+
+        cursor.execute("SELECT * FROM details ORDER BY path")
+        self.assertEqual(cursor.fetchall(), serial_rows)
+        self.assertEqual(len(serial_rows), 15)
+
+    def test_parallel_update_db_skips_known_paths(self):
+        song_path = self._create_test_structure()[0]
+        self.db.add_detail_row(song_path, "Artist", "1990", "Album", "1", "01", "Song", 9)
+
+        updater = DatabaseUpdater(self.db, workers=2)
+        updater.update_db(os.path.join(self.temp_dir, "00 All"), 1)
+
+        cursor = self.db.cursor
+        cursor.execute("SELECT priority FROM details ORDER BY path")
+        self.assertEqual(cursor.fetchall(), [(9,), (1,)])
+
+    def _update_and_move(self, updater=None):
+        song_path = self._create_test_structure()[0]
+        base_dir = os.path.join(self.temp_dir, "00 All")
+        self.updater.update_db(base_dir, 10)
+        self.db.decrease_prio(song_path)
+        self.db.add_guitar_row(song_path, 1)
+
+        new_dir = os.path.join(base_dir, "01 Punk", "Test Artist", "1990 Test Album")
+        os.makedirs(new_dir)
+        new_path = os.path.join(new_dir, "01 Renamed Song.mp3")
+        os.rename(song_path, new_path)
+        (updater or self.updater).update_db(base_dir, 10)
+        return song_path, new_path
+
+    def test_update_db_moves_renamed_entries_in_place(self):
+        song_path, new_path = self._update_and_move()
+
+        cursor = self.db.cursor
+        cursor.execute("SELECT path, title, priority FROM details ORDER BY path")
+        rows = cursor.fetchall()
+        self.assertEqual(len(rows), 2)
+        self.assertIn((new_path, "Renamed Song", 9), rows)
+        self.assertFalse(self.db.has_path(song_path))
+        cursor.execute("SELECT path FROM guitar")
+        self.assertEqual(cursor.fetchall(), [(new_path,)])
+
+    def test_parallel_update_db_moves_renamed_entries_in_place(self):
+        _, new_path = self._update_and_move(DatabaseUpdater(self.db, workers=2))
+
+        cursor = self.db.cursor
+        cursor.execute("SELECT priority FROM details WHERE path = ?", [new_path])
+        self.assertEqual(cursor.fetchall(), [(9,)])
+        cursor.execute("SELECT path FROM guitar")
+        self.assertEqual(cursor.fetchall(), [(new_path,)])
+
+    def test_update_db_matches_moved_files_by_partial_hash(self):
+        song_path = self._create_test_structure()[0]
+        base_dir = os.path.join(self.temp_dir, "00 All")
+        self.updater.update_db(base_dir, 10)
+        size = os.path.getsize(song_path)
+        partial_hash = self.updater.hasher.partial_hash(song_path, size)
+        self.db.set_hashes([(partial_hash, None, song_path)])
+        # a copy has a new inode, like a move between file systems
+        new_path = os.path.join(os.path.dirname(song_path), "03 Copied.mp3")
+        shutil.copyfile(song_path, new_path)
+        os.unlink(song_path)
+
+        self.updater.update_db(base_dir, 10)
+
+        cursor = self.db.cursor
+        cursor.execute("SELECT partial_hash FROM details WHERE path = ?", [new_path])
+        self.assertEqual(cursor.fetchall(), [(partial_hash,)])
+        self.assertFalse(self.db.has_path(song_path))
+
+    def test_update_db_does_not_move_existing_files(self):
+        song_path = self._create_test_structure()[0]
+        base_dir = os.path.join(self.temp_dir, "00 All")
+        self.updater.update_db(base_dir, 10)
+        os.link(song_path, os.path.join(os.path.dirname(song_path), "03 Hard link.mp3"))
+
+        self.updater.update_db(base_dir, 10)
+
+        cursor = self.db.cursor
+        cursor.execute("SELECT COUNT(*) FROM details")
+        self.assertEqual(cursor.fetchone()[0], 3)
+
+    def _age_directories(self, directory):
+        """Directories modified in the last second are not stored, see walk."""
+        for dirpath, dirnames, filenames in os.walk(directory):
+            os.utime(dirpath, (0, 3600))
+
+    def _listed_directories(self, base_dir):
+        with patch("os.scandir", side_effect=os.scandir) as scandir:
+            self.updater.update_db(base_dir, 10)
+        return sorted(call.args[0] for call in scandir.call_args_list)
+
+    def test_update_db_stores_listed_directories(self):
+        self._create_test_structure()
+        base_dir = os.path.join(self.temp_dir, "00 All")
+        self._age_directories(base_dir)
+
+        self.updater.update_db(base_dir, 10)
+
+        directories = self.db.get_directories()
+        album_dir = os.path.join(base_dir, "Test Artist", "1990 Test Album")
+        self.assertEqual(len(directories), 3)
+        self.assertEqual(directories[album_dir], (3600 * 10**9, 2))
+
+    def test_update_db_lists_recently_modified_directories_again(self):
+        self._create_test_structure()
+        base_dir = os.path.join(self.temp_dir, "00 All")
+        self._age_directories(base_dir)
+        album_dir = os.path.join(base_dir, "Test Artist", "1990 Test Album")
+        os.utime(album_dir)
+        self.updater.update_db(base_dir, 10)
+
+        self.assertEqual(self.db.get_directories()[album_dir], (None, 2))
+        self.assertEqual(self._listed_directories(base_dir), [album_dir])
+
+    def test_update_db_does_not_list_unchanged_directories(self):
+        self._create_test_structure()
+        base_dir = os.path.join(self.temp_dir, "00 All")
+        self._age_directories(base_dir)
+        self.updater.update_db(base_dir, 10)
+
+        self.assertEqual(self._listed_directories(base_dir), [])
+
+    def test_update_db_finds_new_files_in_changed_directories(self):
+        self._create_test_structure()
+        base_dir = os.path.join(self.temp_dir, "00 All")
+        self._age_directories(base_dir)
+        self.updater.update_db(base_dir, 10)
+
+        album_dir = os.path.join(base_dir, "Test Artist", "1990 Test Album")
+        with open(os.path.join(album_dir, "03 New Song.mp3"), "w") as f:
+            f.write("fake mp3 content")
+
+        self.assertEqual(self._listed_directories(base_dir), [album_dir])
+        cursor = self.db.cursor
+        cursor.execute("SELECT COUNT(*) FROM details")
+        self.assertEqual(cursor.fetchone()[0], 3)
+
+    def test_update_db_prunes_under_a_root_with_a_trailing_slash(self):
+        self._create_test_structure()
+        base_dir = os.path.join(self.temp_dir, "00 All")
+        self._age_directories(base_dir)
+        self.updater.update_db(base_dir + os.sep, 10)
+        self.updater.update_db(base_dir + os.sep, 10)
+
+        album_dir = os.path.join(base_dir, "Test Artist", "1990 Test Album")
+        with open(os.path.join(album_dir, "03 New Song.mp3"), "w") as f:
+            f.write("fake mp3 content")
+        self.updater.update_db(base_dir + os.sep, 10)
+
+        self.assertIn(album_dir, self.db.get_directories())
+        self.assertNotIn(base_dir + os.sep, self.db.get_directories())
+        cursor = self.db.cursor
+        cursor.execute("SELECT COUNT(*) FROM details")
+        self.assertEqual(cursor.fetchone()[0], 3)
+
+    def test_update_files_refreshes_known_paths(self):
+        song = self._create_test_structure()[0]
+        with open(song, "wb") as f:
+            f.write(b"0" * 10)
+        self.updater.update_files([song], 10)
+        self.db.decrease_prio(song)
+        # the rest of the copy
+        with open(song, "ab") as f:
+            f.write(b"0" * 5 * 1024 * 1024)
+        self.updater.update_files([song], 10)
+
+        cursor = self.db.cursor
+        cursor.execute("SELECT size, priority FROM details WHERE path = ?", [song])
+        self.assertEqual(cursor.fetchone(), (10 + 5 * 1024 * 1024, 9))
+        cursor.execute("SELECT COUNT(*) FROM details")
+        self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_update_db_full_lists_unchanged_directories(self):
+        self._create_test_structure()
+        base_dir = os.path.join(self.temp_dir, "00 All")
+        self._age_directories(base_dir)
+        self.updater.update_db(base_dir, 10)
+
+        with patch("os.scandir", side_effect=os.scandir) as scandir:
+            self.updater.update_db(base_dir, 10, full=True)
+
+        self.assertEqual(scandir.call_count, 3)
+
+    def test_update_db_forgets_vanished_directories(self):
+        self._create_test_structure()
+        base_dir = os.path.join(self.temp_dir, "00 All")
+        album_dir = os.path.join(base_dir, "Test Artist", "1990 Test Album")
+        os.makedirs(os.path.join(album_dir, "Covers"))
+        self._age_directories(base_dir)
+        self.updater.update_db(base_dir, 10)
+
+        shutil.rmtree(album_dir)
+        os.utime(os.path.join(base_dir, "Test Artist"), (0, 7200))
+        self.updater.update_db(base_dir, 10)
+
+        directories = self.db.get_directories()
+        self.assertEqual(len(directories), 3)
+        # its tracks are only removed by remove_not_existing_entries
+        self.assertEqual(directories[album_dir], (None, None))
+
+    def test_update_db_stores_categories(self):
+        album_dir = os.path.join(self.temp_dir, "00 All", "01 Punk", "Artist", "1994 Album")
+        os.makedirs(album_dir)
+        with open(os.path.join(album_dir, "01 Song.mp3"), "w") as f:
+            f.write("fake mp3 content")
+
+        self.updater.update_db(os.path.join(self.temp_dir, "00 All"), 10)
+
+        cursor = self.db.cursor
+        cursor.execute("SELECT category FROM details")
+        self.assertEqual(cursor.fetchall(), [("01 Punk",)])
+
     def test_remove_not_existing_entries(self):
         # Add entries to database
         existing_path = self._create_test_structure()[0]
@@ -214,19 +485,21 @@ class TestDatabaseUpdater(unittest.TestCase):
         
         self.assertIn(existing_path, remaining_guitar_paths)
 
-    def test_close_commits_and_closes(self):
+    def test_close_commits(self):
         existing_path = self._create_test_structure()[0]
         self.db.add_detail_row(existing_path, "Artist", "1990", "Album", "1", "01", "Song", 1)
-        
-        # Manually rollback to test that close() commits
-        self.db.conn.rollback()
-        
+        self.db.cursor.execute("UPDATE tracks SET priority = 2")
+
         self.updater.close()
-        
-        # Should be closed
-        with self.assertRaises(Exception):  # sqlite3.ProgrammingError or similar
-            self.db.cursor.execute("SELECT 1")
 
+        other_db = Database(self.db_file.name)
+        try:
+            other_db.cursor.execute("SELECT priority FROM details")
+            self.assertEqual(other_db.cursor.fetchall(), [(2,)])
+        finally:
+            other_db.close()
+        # still open
+        self.db.cursor.execute("SELECT 1")
 
 if __name__ == "__main__":
     unittest.main()
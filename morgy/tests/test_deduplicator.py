@@ -0,0 +1,122 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from morgy.database import Database
+from morgy.database.content_hasher import PARTIAL_HASH_CHUNK
+from morgy.deduplicator import Deduplicator
+
+
+class TestDeduplicator(unittest.TestCase):
+    def setUp(self):
+        self.print_patcher = patch('builtins.print', MagicMock())
+        self.print_patcher.start()
+
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.db = Database(self.db_file.name)
+        self.temp_dir = tempfile.mkdtemp()
+        self.deduplicator = Deduplicator(self.db)
+
+    def tearDown(self):
+        self.print_patcher.stop()
+        self.db.conn.close()
+        os.unlink(self.db_file.name)
+        shutil.rmtree(self.temp_dir)
+
+    def _add_file(self, name, content):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        self.db.add_detail_row(path, "artist", "1990", "album", "1", "01", name, 5)
+        return path
+
+    def query(self, query, values=[]):
+        self.db.cursor.execute(query, values)
+        return self.db.cursor.fetchall()
+
+    def test_identical_small_files(self):
+        path1 = self._add_file("a.mp3", b"same content")
+        path2 = self._add_file("b.mp3", b"same content")
+        self._add_file("c.mp3", b"other content")
+
+        duplicates = self.deduplicator.find_duplicates()
+
+        self.assertEqual(len(duplicates), 1)
+        self.assertEqual(duplicates[0][0], len(b"same content"))
+        self.assertEqual(sorted(duplicates[0][1]), [path1, path2])
+
+    def test_small_files_are_not_fully_hashed(self):
+        self._add_file("a.mp3", b"same content")
+        self._add_file("b.mp3", b"same content")
+
+        with patch.object(self.deduplicator.hasher, "full_hash") as full_hash:
+            self.deduplicator.find_duplicates()
+
+        full_hash.assert_not_called()
+
+    def test_same_ends_different_middle(self):
+        start = b"s" * PARTIAL_HASH_CHUNK
+        end = b"e" * PARTIAL_HASH_CHUNK
+        path1 = self._add_file("a.mp3", start + b"1" * 1000 + end)
+        path2 = self._add_file("b.mp3", start + b"1" * 1000 + end)
+        self._add_file("c.mp3", start + b"2" * 1000 + end)
+
+        duplicates = self.deduplicator.find_duplicates()
+
+        self.assertEqual(len(duplicates), 1)
+        self.assertEqual(sorted(duplicates[0][1]), [path1, path2])
+
+    def test_unique_sizes_are_not_hashed(self):
+        self._add_file("a.mp3", b"a")
+        self._add_file("b.mp3", b"bb")
+
+        with patch.object(self.deduplicator.hasher, "partial_hash") as partial_hash:
+            self.assertEqual(self.deduplicator.find_duplicates(), [])
+
+        partial_hash.assert_not_called()
+
+    def test_sizes_and_hashes_are_stored_and_reused(self):
+        content = b"x" * (3 * PARTIAL_HASH_CHUNK)
+        self._add_file("a.mp3", content)
+        self._add_file("b.mp3", content)
+        self.deduplicator.find_duplicates()
+
+        result = self.query("SELECT size, partial_hash, hash FROM details")
+        self.assertEqual(len(result), 2)
+        for size, partial_hash, full_hash in result:
+            self.assertEqual(size, len(content))
+            self.assertIsNotNone(partial_hash)
+            self.assertIsNotNone(full_hash)
+
+        with patch.object(self.deduplicator.hasher, "partial_hash") as partial_hash:
+            with patch.object(self.deduplicator.hasher, "full_hash") as full_hash:
+                duplicates = self.deduplicator.find_duplicates()
+        partial_hash.assert_not_called()
+        full_hash.assert_not_called()
+        self.assertEqual(len(duplicates), 1)
+
+    def test_missing_files_are_skipped(self):
+        self._add_file("a.mp3", b"same content")
+        self._add_file("b.mp3", b"same content")
+        self.db.add_detail_row("/not/existing.mp3", "artist", "1990", "album", "1", "01", "t", 5, None, 12)
+
+        duplicates = self.deduplicator.find_duplicates()
+
+        self.assertEqual(len(duplicates), 1)
+        self.assertEqual(len(duplicates[0][1]), 2)
+
+    def test_write_report(self):
+        output = io.StringIO()
+        self.deduplicator.write_report([(2 * 1024 * 1024, ["/b.mp3", "/a.mp3", "/c.mp3"])], output)
+        self.assertEqual(
+            output.getvalue(),
+            "3 copies, 2.0 MB each:\n/a.mp3\n/b.mp3\n/c.mp3\n\n2 redundant files, 4.0 MB\n",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,8 @@
 import unittest
+from unittest.mock import patch
+
 from morgy.database.detail_fetcher import DetailFetcher
+from morgy.database.library_layout import LibraryLayout
 
 
 class TestDetailFetcher(unittest.TestCase):
@@ -85,6 +88,59 @@ class TestDetailFetcher(unittest.TestCase):
         self.assertIsNone(number)
         self.assertEqual(title, "96 quite bitter beings")
 
+    def test_category_is_the_first_directory_under_00_all(self):
+        dirpath = "00 All/01 Külföldi Punk/Millencolin/1994 Same old tunes"
+        self.assertEqual(self.fetcher.fetch_category(dirpath), "01 Külföldi Punk")
+
+    def test_directories_are_parsed_once_per_dirpath(self):
+        dirpath = "00 All/01 Külföldi Punk/Millencolin/1994 Same old tunes"
+        with patch.object(
+            self.fetcher, "split_to_dirs", wraps=self.fetcher.split_to_dirs
+        ) as split_to_dirs:
+            self.fetcher.fetch_detail(dirpath, "01 Bullion")
+            (artist, _, album, _, number, title) = self.fetcher.fetch_detail(
+                dirpath, "06 Leona"
+            )
+        self.assertEqual(split_to_dirs.call_count, 1)
+        self.assertEqual(artist, "Millencolin")
+        self.assertEqual(album, "Same old tunes")
+        self.assertEqual(number, "06")
+        self.assertEqual(title, "Leona")
+
+    def test_directory_cache_is_bounded(self):
+        fetcher = DetailFetcher(cache_size=2)
+        for artist in ["A", "B", "C"]:
+            fetcher.fetch_detail("00 All/01 Külföldi Punk/" + artist, "Song")
+        self.assertEqual(fetcher.parse_dirs.cache_info().currsize, 2)
+
+    def test_paths_outside_the_library_root(self):
+        (artist, year, album, cd_number, number, title) = self.fetcher.fetch_detail(
+            "/home/someone/Downloads", "01 Something"
+        )
+        self.assertIsNone(artist)
+        self.assertIsNone(number)
+        self.assertEqual(title, "01 Something")
+
+    def test_directories_without_matching_rule(self):
+        dirpath = "00 All/01 Külföldi Punk/Millencolin/1994 Same old tunes/CD1/extra"
+        details = self.fetcher.fetch_detail(dirpath, "06 Leona")
+        self.assertEqual(details, (None, None, None, None, None, "06 Leona"))
+
+    def test_custom_layout(self):
+        layout = LibraryLayout(
+            ["{artist}/{year} - {album}/{number}. {title}", "{artist}/{title}"],
+            root="/srv/music",
+        )
+        fetcher = DetailFetcher(layout)
+        self.assertEqual(
+            fetcher.fetch_detail("/srv/music/Millencolin/1994 - Same old tunes", "06. Leona"),
+            ("Millencolin", "1994", "Same old tunes", None, "06", "Leona"),
+        )
+        self.assertEqual(
+            fetcher.fetch_detail("/srv/music/Millencolin", "Leona"),
+            ("Millencolin", None, None, None, None, "Leona"),
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
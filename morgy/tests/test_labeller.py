@@ -0,0 +1,99 @@
+import unittest
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from morgy.database import Database
+from morgy.labeller import Labeller
+
+
+class TestLabeller(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.db = Database(self.db_file.name)
+        self.temp_dir = tempfile.mkdtemp()
+        self.paths = list()
+        for album in ["A", "B"]:
+            os.makedirs(os.path.join(self.temp_dir, album))
+            for number in range(1, 4):
+                path = os.path.join(self.temp_dir, album, "{}.mp3".format(number))
+                open(path, "w").close()
+                self.db.add_detail_row(path, album, None, None, None, None, str(number), 5)
+                self.paths.append(path)
+        self.labeller = Labeller(self.db)
+
+    def tearDown(self):
+        self.db.close()
+        os.unlink(self.db_file.name)
+        shutil.rmtree(self.temp_dir)
+
+    def labelled(self, name="car"):
+        self.db.cursor.execute(
+            """SELECT track_id FROM track_labels
+            JOIN labels ON labels.id = label_id WHERE name = ?""",
+            [name],
+        )
+        return len(self.db.cursor.fetchall())
+
+    def test_playlist(self):
+        playlist = os.path.join(self.temp_dir, "car.m3u")
+        with open(playlist, "w") as f:
+            f.write("#EXTM3U\n#EXTINF:123,A - 1\nA/1.mp3\n\n{}\nA/missing.mp3\n".format(self.paths[4]))
+        found, changed, missing = self.labeller.label("car", [playlist])
+        self.assertEqual((found, changed), (2, 2))
+        self.assertEqual(missing, [os.path.join(self.temp_dir, "A", "missing.mp3")])
+        self.assertEqual(self.labelled(), 2)
+
+    def test_directory_glob_and_path(self):
+        sources = [
+            os.path.join(self.temp_dir, "A") + os.sep,
+            os.path.join(self.temp_dir, "B", "[12].mp3"),
+            self.paths[5],
+            os.path.join(self.temp_dir, "C*"),
+        ]
+        found, changed, missing = self.labeller.label("car", sources)
+        self.assertEqual((found, changed), (6, 6))
+        self.assertEqual(missing, [sources[3]])
+
+    def test_relative_sources(self):
+        cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        try:
+            found, changed, missing = self.labeller.label("car", ["A", "B/[12].mp3", "B/3.mp3", "C"])
+        finally:
+            os.chdir(cwd)
+        self.assertEqual((found, changed), (6, 6))
+        self.assertEqual(missing, [os.path.join(self.temp_dir, "C")])
+
+    def test_names_that_cannot_be_selected(self):
+        for name in ["road trip", "car?", "", "not", "AND", "Or"]:
+            with self.assertRaises(ValueError):
+                self.labeller.label(name, [self.paths[0]])
+        self.assertEqual(self.db.get_labels(), ["guitar"])
+        self.assertEqual(self.labeller.label("road-trip_2", [self.paths[0]]), (1, 1, []))
+
+    def test_labelling_twice_and_unlabelling(self):
+        directory = os.path.join(self.temp_dir, "A")
+        self.labeller.label("car", [directory])
+        self.assertEqual(self.labeller.label("car", [directory, self.paths[3]]), (4, 1, []))
+        self.assertEqual(self.labeller.unlabel("car", [self.paths[0], self.paths[5]]), (2, 1, []))
+        self.assertEqual(self.labelled(), 3)
+
+    def test_one_transaction(self):
+        label_tracks = self.db.label_tracks
+
+        def fail_after_labelling(name, track_ids):
+            label_tracks(name, track_ids)
+            raise RuntimeError()
+
+        with patch.object(self.db, "label_tracks", side_effect=fail_after_labelling):
+            with self.assertRaises(RuntimeError):
+                self.labeller.label("car", [self.temp_dir])
+        self.assertNotIn("car", self.db.get_labels())
+        self.assertEqual(self.labelled(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+
+from morgy.database import Database
+from morgy.database.labels import LabelIndex, from_bitmap, normalise, to_bitmap, tokenize
+from morgy.database.selection import Selection
+from morgy.smart_picker import SmartPicker
+
+
+class TestBitmaps(unittest.TestCase):
+    def test_round_trip(self):
+        track_ids = [1, 2, 7, 8, 9, 1000, 65537]
+        self.assertEqual(from_bitmap(to_bitmap(track_ids)), track_ids)
+        self.assertEqual(to_bitmap([]), 0)
+        self.assertEqual(from_bitmap(0), [])
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize("guitar AND NOT(christmas or road-trip) "),
+            ["guitar", "AND", "NOT", "(", "christmas", "or", "road-trip", ")"],
+        )
+        with self.assertRaises(ValueError):
+            tokenize("guitar & car")
+
+    def test_normalise(self):
+        self.assertEqual(normalise(" Car  AND not(kids)"), "Car and not ( kids )")
+
+
+class TestLabelIndex(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.db = Database(self.db_file.name)
+        for number in range(1, 6):
+            self.db.add_detail_row(
+                "/a/{}.mp3".format(number), "A", None, None, None, None, str(number), 5
+            )
+        labels = {"guitar": [1, 2, 3], "christmas": [3, 4], "car": [2, 5]}
+        for label, numbers in labels.items():
+            for number in numbers:
+                self.db.add_label_row("/a/{}.mp3".format(number), label)
+        self.index = LabelIndex(self.db)
+
+    def tearDown(self):
+        self.db.close()
+        os.unlink(self.db_file.name)
+
+    def paths(self, expression):
+        track_ids = self.index.track_ids(expression)
+        return sorted(os.path.basename(path) for path in self.db.get_paths_matching(Selection(), track_ids))
+
+    def test_expressions(self):
+        self.assertEqual(self.paths("guitar"), ["1.mp3", "2.mp3", "3.mp3"])
+        self.assertEqual(self.paths("guitar AND NOT christmas"), ["1.mp3", "2.mp3"])
+        self.assertEqual(self.paths("christmas or car"), ["2.mp3", "3.mp3", "4.mp3", "5.mp3"])
+        self.assertEqual(self.paths("not guitar"), ["4.mp3", "5.mp3"])
+        # NOT binds stronger than AND, AND stronger than OR
+        self.assertEqual(self.paths("car OR guitar AND christmas"), ["2.mp3", "3.mp3", "5.mp3"])
+        self.assertEqual(self.paths("(car OR guitar) AND NOT NOT christmas"), ["3.mp3"])
+
+    def test_invalid_expressions(self):
+        for expression in ["", "guitar AND", "(guitar", "guitar)", "AND car", "bicycle", "guitar car"]:
+            with self.assertRaises(ValueError):
+                self.index.evaluate(expression)
+
+    def test_labels_without_tracks(self):
+        self.db.delete_labels_under("/a", "car")
+        self.index.reload()
+        self.assertEqual(self.paths("car"), [])
+        self.assertEqual(self.paths("NOT car"), ["1.mp3", "2.mp3", "3.mp3", "4.mp3", "5.mp3"])
+
+    def test_changes_are_followed(self):
+        self.assertEqual(self.paths("car"), ["2.mp3", "5.mp3"])
+        self.db.add_label_row("/a/1.mp3", "car")
+        self.assertEqual(self.paths("car"), ["1.mp3", "2.mp3", "5.mp3"])
+
+    def test_labelling(self):
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db.add_label_row("/a/1.mp3", "guitar")
+        self.db.delete_label_row("/a/1.mp3", "guitar")
+        self.db.delete_entry_with_path("/a/2.mp3")
+        self.assertEqual(self.db.get_labels(), ["car", "christmas", "guitar"])
+        self.assertEqual(self.paths("guitar"), ["3.mp3"])
+        self.assertEqual([path for path, in self.db.get_all_guitar_paths()], ["/a/3.mp3"])
+
+    def test_picker_picks_only_the_labelled_tracks(self):
+        picker = SmartPicker(self.db, self.index.track_ids("christmas"))
+        titles = picker.build_dict_from_database()
+        self.assertEqual(sorted(titles), ["3", "4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import configparser
+import unittest
+
+from morgy.database.library_layout import LibraryLayout, DEFAULT_RULES
+
+
+class TestLibraryLayout(unittest.TestCase):
+    def setUp(self):
+        self.layout = LibraryLayout()
+
+    def test_split_to_dirs_below_the_root(self):
+        dirs = self.layout.split_to_dirs("/music/00 All/01 Külföldi Punk/Millencolin")
+        self.assertEqual(dirs, ["01 Külföldi Punk", "Millencolin"])
+
+    def test_split_to_dirs_uses_the_innermost_root(self):
+        dirs = self.layout.split_to_dirs("00 All/backup/00 All/01 Külföldi Punk")
+        self.assertEqual(dirs, ["01 Külföldi Punk"])
+
+    def test_split_to_dirs_outside_the_root(self):
+        self.assertIsNone(self.layout.split_to_dirs("/somewhere/else"))
+
+    def test_split_to_dirs_with_absolute_root(self):
+        layout = LibraryLayout(root="/srv/music")
+        self.assertEqual(layout.split_to_dirs("/srv/music"), [])
+        self.assertEqual(layout.split_to_dirs("/srv/music/Punk/CKY"), ["Punk", "CKY"])
+        self.assertIsNone(layout.split_to_dirs("/srv/musicals/Cats"))
+
+    def test_rules_are_dispatched_by_depth(self):
+        self.assertEqual(sorted(self.layout.rules_by_depth.keys()), [1, 2, 3, 4])
+
+    def test_match_dirs_keeps_rule_order(self):
+        candidates = self.layout.match_dirs(["07 Indie, játékzenék", "THPS 2"])
+        self.assertEqual(len(candidates), 2)
+        self.assertEqual(candidates[0][0], {"category": "07 Indie, játékzenék"})
+        self.assertEqual(candidates[1][0]["artist"], "THPS 2")
+
+    def test_optional_parts(self):
+        regex = self.layout.compile("[{year} ]{album}")
+        self.assertEqual(
+            regex.fullmatch("1994 Same old tunes").groupdict(),
+            {"year": "1994", "album": "Same old tunes"},
+        )
+        self.assertEqual(
+            regex.fullmatch("Same old tunes").groupdict(),
+            {"year": None, "album": "Same old tunes"},
+        )
+
+    def test_literal_characters_are_escaped(self):
+        regex = self.layout.compile("{artist} (live).{title}")
+        self.assertIsNone(regex.fullmatch("A (live)x B"))
+        self.assertEqual(regex.fullmatch("A (live).B").group("title"), "B")
+
+    def test_unknown_field_is_rejected(self):
+        with self.assertRaises(ValueError):
+            LibraryLayout(["{genre}/{title}"])
+
+    def test_rule_without_title_is_rejected(self):
+        with self.assertRaises(ValueError):
+            LibraryLayout(["{artist}/{number}"])
+
+    def test_from_config_defaults(self):
+        config = configparser.ConfigParser()
+        layout = LibraryLayout.from_config(config["DEFAULT"])
+        self.assertEqual(layout.root, "00 All")
+        self.assertEqual(
+            sum(len(rules) for rules in layout.rules_by_depth.values()),
+            len(DEFAULT_RULES),
+        )
+
+    def test_from_config_rules(self):
+        config = configparser.ConfigParser()
+        config.read_string(
+            "[DEFAULT]\n"
+            "library_root = /srv/music\n"
+            "layout_rules =\n"
+            "    {artist}/{album}/{number} {title}\n"
+            "    {artist}/{title}\n"
+        )
+        layout = LibraryLayout.from_config(config["DEFAULT"])
+        self.assertEqual(layout.root, "/srv/music")
+        self.assertEqual(sorted(layout.rules_by_depth.keys()), [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
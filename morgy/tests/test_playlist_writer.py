@@ -0,0 +1,97 @@
+import unittest
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from morgy.database import Database
+from morgy.database.selection import Selection
+from morgy.playlist_writer import PlaylistWriter
+
+
+class TestPlaylistWriter(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.db = Database(self.db_file.name)
+        self.temp_dir = tempfile.mkdtemp()
+        rows = [
+            ("/music/A/1.mp3", "A", 1990, None, None, None, "One", 5, 200.4),
+            ("/music/A/2.mp3", "A", 1995, None, None, None, "Two", 3, None),
+            ("/music/B/3.mp3", None, 2005, None, None, None, "Három", 8, 61.6),
+        ]
+        for row in rows:
+            self.db.add_detail_row(*row)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        os.unlink(self.db_file.name)
+        shutil.rmtree(self.temp_dir)
+
+    def read(self, name):
+        with open(os.path.join(self.temp_dir, name), encoding="utf-8") as playlist:
+            return playlist.read()
+
+    def write(self, writer, *playlists):
+        return writer.write(
+            [
+                (os.path.join(self.temp_dir, name), Selection(terms), track_ids)
+                for name, terms, track_ids in playlists
+            ]
+        )
+
+    def test_extended_m3u(self):
+        counts = self.write(PlaylistWriter(self.db), ("all.m3u", [], None))
+        self.assertEqual(counts, [3])
+        self.assertEqual(
+            self.read("all.m3u"),
+            "#EXTM3U\n"
+            "#EXTINF:200,A - One\n/music/A/1.mp3\n"
+            "#EXTINF:-1,A - Two\n/music/A/2.mp3\n"
+            "#EXTINF:62,Három\n/music/B/3.mp3\n",
+        )
+
+    def test_plain_and_relative(self):
+        self.write(PlaylistWriter(self.db, "/music", False), ("a.m3u", ["artist=A"], None))
+        self.assertEqual(self.read("a.m3u"), "A/1.mp3\nA/2.mp3\n")
+
+    def test_urls_of_a_streamer(self):
+        self.write(
+            PlaylistWriter(self.db, extended=False, url="http://phone:8081"),
+            ("a.m3u", ["artist=A"], None),
+        )
+        self.assertEqual(
+            self.read("a.m3u"), "http://phone:8081/tracks/1.mp3\nhttp://phone:8081/tracks/2.mp3\n"
+        )
+
+    def test_several_playlists_in_one_pass(self):
+        writer = PlaylistWriter(self.db, extended=False)
+        with patch.object(self.db, "get_playlist_entries", wraps=self.db.get_playlist_entries) as entries:
+            counts = self.write(
+                writer,
+                ("a.m3u", ["artist=A"], None),
+                ("new.m3u", ["year=1995.."], None),
+                ("best.m3u", ["priority>=5"], {1}),
+                ("none.m3u", ["title=Four"], None),
+            )
+        entries.assert_called_once()
+        self.assertEqual(counts, [2, 2, 1, 0])
+        self.assertEqual(self.read("new.m3u"), "/music/A/2.mp3\n/music/B/3.mp3\n")
+        self.assertEqual(self.read("best.m3u"), "/music/A/1.mp3\n")
+        self.assertEqual(self.read("none.m3u"), "")
+
+    def test_spread(self):
+        self.db.add_detail_row("/music/A/4.mp3", "A", 1990, None, None, None, "Four", 5)
+        self.db.add_detail_row("/music/B/5.mp3", None, 2005, None, None, None, "Five", 5)
+        self.write(PlaylistWriter(self.db, extended=False, spread=True), ("spread.m3u", [], None))
+        artists = [path.split("/")[2] for path in self.read("spread.m3u").split()]
+        self.assertEqual(sorted(artists), ["A", "A", "A", "B", "B"])
+        self.assertEqual(artists[::2], ["A", "A", "A"])
+
+    def test_no_playlists(self):
+        self.assertEqual(PlaylistWriter(self.db).write([]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+import os
+import tempfile
+from unittest.mock import patch
+
+from morgy.database import Database
+from morgy.database.prefix_index import PrefixIndex, normalise
+
+
+class TestPrefixIndex(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.db = Database(self.db_file.name)
+        rows = [
+            ("/a/1.mp3", "Mark Knopfler", None, None, None, None, "Going Home", 5),
+            ("/a/2.mp3", "Mark Knopfler", None, None, None, None, "Sailing to Philadelphia", 5),
+            ("/b/1.mp3", "Kispál és a Borz", None, None, None, None, "Zsákutca", 5),
+            ("/c/1.mp3", "Marley", None, None, None, None, "Kaya", 5),
+        ]
+        for row in rows:
+            self.db.add_detail_row(*row)
+        self.db.commit()
+        self.index = PrefixIndex(self.db, max_age=0)
+
+    def tearDown(self):
+        self.db.close()
+        os.unlink(self.db_file.name)
+
+    def values(self, prefix, **kwargs):
+        return [value for value, _, _ in self.index.complete(prefix, **kwargs)]
+
+    def test_normalise(self):
+        self.assertEqual(normalise("Kispál És"), "kispal es")
+        self.assertEqual(normalise("Ősz Ű"), "osz u")
+
+    def test_most_frequent_first(self):
+        self.assertEqual(
+            self.index.complete("mar"),
+            [("Mark Knopfler", "artist", 2), ("Marley", "artist", 1)],
+        )
+
+    def test_words_accents_and_fields(self):
+        self.assertEqual(self.values("knopf"), ["Mark Knopfler"])
+        self.assertEqual(self.values("borz"), ["Kispál és a Borz"])
+        self.assertEqual(self.values("ZSAK"), ["Zsákutca"])
+        self.assertEqual(self.values("k"), ["Mark Knopfler", "Kaya", "Kispál és a Borz"])
+        self.assertEqual(self.values("k", field="title"), ["Kaya"])
+        self.assertEqual(self.values("k", k=1), ["Mark Knopfler"])
+        self.assertEqual(self.values("xyz"), [])
+
+    def test_built_lazily_once(self):
+        with patch.object(self.db, "get_artists_and_titles", wraps=self.db.get_artists_and_titles) as read:
+            self.assertIsNone(self.index.last_change)
+            self.index.complete("m")
+            self.index.complete("k")
+            self.assertEqual(read.call_count, 1)
+
+    def test_follows_changes(self):
+        self.index.complete("m")
+        self.db.add_detail_row("/c/2.mp3", "Marley", None, None, None, None, "Jamming", 5)
+        self.db.add_detail_row("/c/3.mp3", "Marley", None, None, None, None, "Is This Love", 5)
+        self.db.delete_entry_with_path("/a/1.mp3")
+        self.db.commit()
+        with patch.object(self.db, "get_artists_and_titles") as read:
+            self.assertEqual(
+                self.index.complete("mar"),
+                [("Marley", "artist", 3), ("Mark Knopfler", "artist", 1)],
+            )
+            self.assertEqual(self.values("goi"), [])
+            self.assertEqual(self.values("jam"), ["Jamming"])
+            read.assert_not_called()
+
+    def test_rebuilds_when_too_far_behind(self):
+        self.index.complete("m")
+        with patch("morgy.database.prefix_index.PrefixIndex.build") as build:
+            self.db.cursor.execute("DELETE FROM track_changes")
+            self.db.add_detail_row("/d/1.mp3", "Other", None, None, None, None, "Title", 5)
+            self.db.commit()
+            self.index.complete("m")
+            build.assert_called_once_with()
+
+    def test_wide_prefixes_are_cached_until_a_change(self):
+        with patch("morgy.database.prefix_index.SCAN_LIMIT", 0):
+            first = self.index.complete("m")
+            self.assertIs(self.index.complete("m"), first)
+            self.db.add_detail_row("/e/1.mp3", "Madonna", None, None, None, None, "Music", 5)
+            self.db.commit()
+            self.assertIn(("Madonna", "artist", 1), self.index.complete("m"))
+
+
+if __name__ == "__main__":
+    unittest.main()
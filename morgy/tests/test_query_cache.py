@@ -0,0 +1,122 @@
+import unittest
+import os
+import tempfile
+from unittest.mock import patch
+
+from morgy.database import Database
+from morgy.database.query_cache import QueryCache, size_of, size_of_row
+from morgy.database.selection import Selection
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.db = Database(self.db_file.name)
+        for number in range(1, 4):
+            self.db.add_detail_row(
+                "/a/{}.mp3".format(number), "A", 1990 + number, None, None, None, str(number), 5
+            )
+        self.db.commit()
+        self.cache = QueryCache(self.db)
+        self.reads = 0
+
+    def tearDown(self):
+        self.db.close()
+        os.unlink(self.db_file.name)
+
+    def paths(self, text):
+        selection = Selection.parse(text)
+
+        def read():
+            self.reads += 1
+            return self.db.get_paths_matching(selection)
+
+        return self.cache.get(("paths", selection.key()), read)
+
+    def test_results_are_kept_until_the_library_changes(self):
+        self.assertEqual(self.paths("year>=1992"), ("/a/2.mp3", "/a/3.mp3"))
+        # the same terms in another order
+        self.assertEqual(self.paths("priority=5 year>=1992"), ("/a/2.mp3", "/a/3.mp3"))
+        self.assertEqual(self.paths("year>=1992 priority=5"), ("/a/2.mp3", "/a/3.mp3"))
+        self.assertEqual(self.reads, 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+        self.db.add_detail_row("/a/4.mp3", "A", 1994, None, None, None, "4", 5)
+        self.assertEqual(self.paths("year>=1992"), ("/a/2.mp3", "/a/3.mp3", "/a/4.mp3"))
+        self.assertEqual(self.reads, 3)
+        # the other result was dropped with its generation
+        self.assertEqual(len(self.cache.results), 1)
+
+    def test_changes_of_another_connection_are_seen(self):
+        self.paths("year>=1992")
+        other = Database(self.db_file.name)
+        try:
+            other.decrease_prio("/a/3.mp3")
+            other.commit()
+        finally:
+            other.close()
+        self.assertEqual(self.paths("priority=5"), ("/a/1.mp3", "/a/2.mp3"))
+        self.paths("year>=1992")
+        self.assertEqual(self.reads, 3)
+
+    def test_least_recently_used_results_are_evicted(self):
+        size = size_of(("/a/1.mp3",))
+        self.cache.max_bytes = 2 * size
+        self.paths("year=1991")
+        self.paths("year=1992")
+        # year=1991 is used last, year=1992 goes
+        self.paths("year=1991")
+        self.paths("year=1993")
+        self.assertEqual(self.reads, 3)
+        self.assertLessEqual(self.cache.size, self.cache.max_bytes)
+        self.paths("year=1991")
+        self.assertEqual(self.reads, 3)
+        self.paths("year=1992")
+        self.assertEqual(self.reads, 4)
+
+    def test_results_larger_than_the_cache_are_not_kept(self):
+        self.cache.max_bytes = size_of(("/a/1.mp3",))
+        self.assertEqual(len(self.paths("")), 3)
+        self.assertEqual(self.cache.results, {})
+        self.assertEqual(self.cache.size, 0)
+
+    def test_streamed_results_are_passed_on_while_read(self):
+        read = list()
+
+        def rows():
+            for path in self.db.get_paths_matching(Selection.parse("")):
+                read.append(path)
+                yield path
+
+        streamed = self.cache.stream("paths", rows)
+        self.assertEqual(next(streamed), "/a/1.mp3")
+        self.assertEqual(read, ["/a/1.mp3"])
+        # given up half way, nothing is kept
+        streamed.close()
+        self.assertEqual(self.cache.results, {})
+        self.assertEqual(list(self.cache.stream("paths", rows)), ["/a/1.mp3", "/a/2.mp3", "/a/3.mp3"])
+        self.assertEqual(list(self.cache.stream("paths", rows)), ["/a/1.mp3", "/a/2.mp3", "/a/3.mp3"])
+        self.assertEqual(len(read), 4)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_streamed_results_larger_than_the_cache_are_not_kept(self):
+        self.cache.max_bytes = 2 * size_of_row("/a/1.mp3")
+        streamed = self.cache.stream("paths", lambda: self.db.get_paths_matching(Selection.parse("")))
+        self.assertEqual(len(list(streamed)), 3)
+        self.assertEqual(self.cache.results, {})
+
+    def test_older_generations_are_not_stored(self):
+        generation = self.db.get_generation()
+        self.db.decrease_prio("/a/1.mp3")
+        self.paths("year=1992")
+        # a thread that read the generation before the change comes last
+        with patch.object(self.db, "get_generation", return_value=generation):
+            self.assertEqual(self.cache.get("old", lambda: ["old"]), ("old",))
+        self.assertNotIn("old", self.cache.results)
+        self.assertEqual(self.paths("year=1992"), ("/a/2.mp3",))
+        self.assertEqual(self.reads, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
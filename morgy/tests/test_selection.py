@@ -0,0 +1,108 @@
+import unittest
+import os
+import tempfile
+
+from morgy.database import Database
+from morgy.database.selection import GUITAR_TRACK_IDS, Selection, compile_where
+
+
+class TestSelection(unittest.TestCase):
+    def test_empty_selection_matches_everything(self):
+        self.assertEqual(Selection().where(), "1")
+        self.assertEqual(Selection().parameters(), [])
+
+    def test_terms_are_parameters(self):
+        selection = Selection.parse("artist=\"Mark Knopfler\" album='x OR 1=1'")
+        self.assertEqual(selection.where(), "tracks.album = ? AND tracks.artist = ?")
+        self.assertEqual(selection.parameters(), ["x OR 1=1", "Mark Knopfler"])
+
+    def test_ranges(self):
+        self.assertEqual(Selection(["year=1990..1999"]).parameters(), [1990, 1999])
+        self.assertEqual(Selection(["year=1990.."]).shape(), (("year", ">="),))
+        self.assertEqual(Selection(["priority=..3"]).shape(), (("priority", "<="),))
+
+    def test_repeated_fields_match_any_value(self):
+        selection = Selection(["year=1990..1999", "artist=A", "year=2005", "artist=B", "year!=1995"])
+        self.assertEqual(
+            selection.where(),
+            "(tracks.artist = ? OR tracks.artist = ?)"
+            " AND (tracks.year BETWEEN ? AND ? OR tracks.year = ?)"
+            " AND tracks.year != ?",
+        )
+        self.assertEqual(selection.parameters(), ["A", "B", 1990, 1999, 2005, 1995])
+
+    def test_comparisons_of_a_field_all_have_to_match(self):
+        selection = Selection(["priority>=5", "priority<=8"])
+        self.assertEqual(selection.where(), "tracks.priority <= ? AND tracks.priority >= ?")
+
+    def test_guitar(self):
+        self.assertEqual(
+            Selection(["guitar"]).where(),
+            "tracks.id IN ({})".format(GUITAR_TRACK_IDS),
+        )
+        self.assertEqual(
+            Selection(["guitar=no"]).where(),
+            "tracks.id NOT IN ({})".format(GUITAR_TRACK_IDS),
+        )
+
+    def test_invalid_terms(self):
+        for term in ["artist", "genre=Punk", "year=nineties", "artist>A", "guitar=maybe", "year=..", "1=1; DROP TABLE tracks"]:
+            with self.assertRaises(ValueError):
+                Selection([term])
+
+    def test_same_shapes_share_the_sql(self):
+        where = Selection(["artist=A", "year=1990..1999"]).where()
+        self.assertIs(Selection(["year=1970..1979", "artist=B"]).where(), where)
+        self.assertGreater(compile_where.cache_info().hits, 0)
+
+
+class TestSelectionQueries(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.db = Database(self.db_file.name)
+        rows = [
+            ("/00 All/01 Punk/A/1.mp3", "A", "1990", "X", None, "01", "One", 5),
+            ("/00 All/01 Punk/B/2.mp3", "B", "1995", "Y", None, "02", "Two", 3),
+            ("/00 All/02 Rock/A/3.mp3", "A", "2005", "Z", None, "03", "Three", 8),
+        ]
+        for row in rows:
+            self.db.add_detail_row(*row)
+        self.db.set_categories(
+            [("01 Punk", "/00 All/01 Punk/A"), ("01 Punk", "/00 All/01 Punk/B"), ("02 Rock", "/00 All/02 Rock/A")]
+        )
+        self.db.add_guitar_row("/00 All/01 Punk/B/2.mp3", 1)
+
+    def tearDown(self):
+        self.db.close()
+        os.unlink(self.db_file.name)
+
+    def paths(self, *terms):
+        return sorted(os.path.basename(path) for path in self.db.get_paths_matching(Selection(terms)))
+
+    def test_get_paths_matching(self):
+        self.assertEqual(self.paths(), ["1.mp3", "2.mp3", "3.mp3"])
+        self.assertEqual(self.paths("artist=A"), ["1.mp3", "3.mp3"])
+        self.assertEqual(self.paths("artist=A", "year=..1999"), ["1.mp3"])
+        self.assertEqual(self.paths("category=01 Punk", "priority>3"), ["1.mp3"])
+        self.assertEqual(self.paths("guitar"), ["2.mp3"])
+        self.assertEqual(self.paths("guitar=no", "artist=B"), [])
+        self.assertEqual(self.paths("artist=A' OR '1'='1"), [])
+
+    def test_selections_use_indexes(self):
+        for terms in [["artist=A"], ["category=01 Punk"], ["priority>=5"]]:
+            selection = Selection(terms)
+            self.db.cursor.execute(
+                """EXPLAIN QUERY PLAN SELECT tracks.id FROM tracks
+                JOIN directories ON directories.id = tracks.dir_id
+                WHERE {}""".format(
+                    selection.where()
+                ),
+                selection.parameters(),
+            )
+            plan = [row[3] for row in self.db.cursor.fetchall()]
+            self.assertTrue(any("INDEX" in detail for detail in plan), plan)
+
+
+if __name__ == "__main__":
+    unittest.main()
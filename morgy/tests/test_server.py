@@ -0,0 +1,118 @@
+import unittest
+import http.client
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+from morgy.database import Database
+from morgy.server import Api, ApiServer
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = Database(self.db_file.name)
+        self.paths = list()
+        for number, (artist, title) in enumerate(
+            [("Mark Knopfler", "Going Home"), ("Mark Knopfler", "Sailing"), ("Marley", "Kaya")]
+        ):
+            path = os.path.join(self.temp_dir, "{}.mp3".format(number))
+            with open(path, "wb") as f:
+                f.write(b"0" * 1024)
+            self.db.add_detail_row(path, artist, 1990 + number, "Album", None, None, title, 5, 180.0)
+            self.paths.append(path)
+        self.db.commit()
+        self.server = ApiServer(("127.0.0.1", 0), Api(self.db), workers=2, quiet=True)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.connection = http.client.HTTPConnection(*self.server.server_address)
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.db.close()
+        os.unlink(self.db_file.name)
+        shutil.rmtree(self.temp_dir)
+
+    def request(self, method, url, body=None):
+        data = json.dumps(body) if body is not None else None
+        self.connection.request(method, url, data)
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_search_and_complete(self):
+        status, results = self.request("GET", "/search?q=sail")
+        self.assertEqual(status, 200)
+        self.assertEqual([result["title"] for result in results], ["Sailing"])
+        status, results = self.request("GET", "/complete?prefix=mar&field=artist")
+        self.assertEqual(
+            results,
+            [
+                {"value": "Mark Knopfler", "field": "artist", "count": 2},
+                {"value": "Marley", "field": "artist", "count": 1},
+            ],
+        )
+
+    def test_songs_are_streamed(self):
+        self.connection.request("GET", "/songs?selection=year%3E%3D1991")
+        response = self.connection.getresponse()
+        self.assertEqual(response.getheader("Transfer-Encoding"), "chunked")
+        self.assertEqual(json.loads(response.read()), self.paths[1:])
+        self.assertEqual(self.request("GET", "/songs?selection=year%3E%3D1991")[1], self.paths[1:])
+        self.assertEqual(self.server.api.cache.hits, 1)
+        # the connection is kept alive
+        status, results = self.request("GET", "/songs?selection=artist%3DNobody")
+        self.assertEqual((status, results), (200, []))
+
+    def test_songs_larger_than_the_cache(self):
+        self.server.api.cache.max_bytes = 100
+        for _ in range(2):
+            self.assertEqual(self.request("GET", "/songs")[1], self.paths)
+        self.assertEqual((self.server.api.cache.hits, self.server.api.cache.results), (0, {}))
+
+    def test_labelling_goes_through_the_writer(self):
+        # cached until the labels change
+        self.assertEqual(self.request("GET", "/labels"), (200, ["guitar"]))
+        status, result = self.request("POST", "/labels/car", {"sources": self.paths[:2] + ["/nowhere.mp3"]})
+        self.assertEqual(status, 200)
+        self.assertEqual(result, {"found": 2, "changed": 2, "missing": ["/nowhere.mp3"]})
+        self.assertEqual(self.request("GET", "/labels"), (200, ["car", "guitar"]))
+        status, results = self.request("GET", "/songs?labels=car%20AND%20NOT%20guitar")
+        self.assertEqual(results, self.paths[:2])
+        status, result = self.request("DELETE", "/labels/car", {"sources": [self.paths[0]]})
+        self.assertEqual(result["changed"], 1)
+
+    def test_pick_decreases_priorities(self):
+        status, picked = self.request("POST", "/pick", {"hours": 1})
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(picked), self.paths)
+        self.db.cursor.execute("SELECT DISTINCT priority FROM details")
+        self.assertEqual(self.db.cursor.fetchall(), [(4,)])
+
+    def test_errors(self):
+        self.assertEqual(self.request("GET", "/nothing")[0], 404)
+        status, result = self.request("GET", "/songs?selection=genre%3DPunk")
+        self.assertEqual((status, result), (400, {"error": "Unknown field: genre"}))
+        self.assertEqual(self.request("GET", "/songs?labels=bicycle")[0], 400)
+        self.assertEqual(self.request("POST", "/pick", {})[0], 400)
+        self.assertEqual(self.request("POST", "/pick", [1])[0], 400)
+        self.assertEqual(self.request("GET", "/complete?k=many")[0], 400)
+
+    def test_reader_cannot_write(self):
+        reader = self.db.reader()
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                reader.decrease_prio(self.paths[0])
+        finally:
+            reader.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
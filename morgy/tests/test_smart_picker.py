@@ -125,6 +125,52 @@ class TestSmartPicker(unittest.TestCase):
         # Should be at most the target (600KB) + the largest possible single file (500KB)
         self.assertLessEqual(total_size, (600 + 500) * 1024)
 
+    def test_pick_respects_duration_limit(self):
+        for i in range(10):
+            path = self._create_test_file("file{}.mp3".format(i))
+            self.db.add_detail_row(path, "artist", "1990", "album", "1", "01", "Song{}".format(i), 1, 60.0)
+
+        result = self.smart_picker.pick(duration=150)
+
+        # stops with the song that runs over the budget
+        self.assertEqual(len(result), 3)
+
+    def test_pick_stops_at_the_first_exhausted_budget(self):
+        for i in range(10):
+            path = self._create_test_file("file{}.mp3".format(i), 100 * 1024)
+            self.db.add_detail_row(path, "artist", "1990", "album", "1", "01", "Song{}".format(i), 1, 60.0)
+
+        self.assertEqual(len(self.smart_picker.pick(150 * 1024, 3600)), 2)
+        self.assertEqual(len(self.smart_picker.pick(10 * 1024 * 1024, 150)), 3)
+
+    def test_pick_reads_unknown_durations_from_the_file(self):
+        for i in range(10):
+            path = os.path.join(self.temp_dir, "file{}.mp3".format(i))
+            with open(path, "wb") as f:
+                # one second of 128 kbps constant bitrate mp3
+                f.write(b"\xff\xfb\x90\x00" + b"\x00" * (16000 - 4))
+            self._add_row_with_defaults(path=path, title="Song{}".format(i))
+
+        self.assertEqual(len(self.smart_picker.pick(duration=2.5)), 3)
+
+    def test_pick_skips_songs_without_duration(self):
+        unknown = set()
+        for i in range(5):
+            # neither the database nor the file header knows the duration
+            unknown.add(self._add_row_with_defaults(
+                path=self._create_test_file("unknown{}.mp3".format(i)), title="Unknown{}".format(i)
+            ))
+        self.assertEqual(self.smart_picker.pick(duration=150), [])
+
+        for i in range(10):
+            path = self._create_test_file("file{}.mp3".format(i))
+            self.db.add_detail_row(path, "artist", "1990", "album", "1", "01", "Song{}".format(i), 1, 60.0)
+        result = self.smart_picker.pick(duration=150)
+        self.assertEqual(len(result), 3)
+        self.assertFalse(unknown & set(result))
+        # a size budget alone still picks them
+        self.assertEqual(len(self.smart_picker.pick(quantity=100 * 1024)), 15)
+
     def test_pick_no_duplicates(self):
         path1 = self._create_test_file("file1.mp3", 100 * 1024)
         path2 = self._create_test_file("file2.mp3", 100 * 1024)
@@ -137,6 +183,16 @@ class TestSmartPicker(unittest.TestCase):
         # Should not have duplicates
         self.assertEqual(len(result), len(set(result)))
 
+    def test_spread(self):
+        paths = list()
+        for number, artist in enumerate(["A", "A", "B", "A", "B"]):
+            paths.append(self._add_row_with_defaults(
+                path=self._create_test_file("{}.mp3".format(number)), artist=artist, title=str(number)
+            ))
+        order = self.smart_picker.spread(paths)
+        self.assertEqual(sorted(order), sorted(paths))
+        self.assertEqual([os.path.basename(path) for path in order[::2]], ["0.mp3", "1.mp3", "3.mp3"])
+
     def test_pick_all_from_guitar(self):
         path1 = self._add_row_with_defaults(title="Song1")
         path2 = self._add_row_with_defaults(path=self._create_test_file("test2.mp3"), title="Song2")
@@ -0,0 +1,46 @@
+import unittest
+import random
+
+from morgy.spreader import interleave, spread
+
+
+def back_to_back(order, key):
+    return sum(1 for first, second in zip(order, order[1:]) if key(first) == key(second))
+
+
+class TestSpreader(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(0)
+
+    def test_interleave_keeps_the_order_of_a_group(self):
+        order = interleave([["a1", "a2", "a3"], ["b1", "b2"]], self.rng)
+        self.assertEqual([item for item in order if item[0] == "a"], ["a1", "a2", "a3"])
+        self.assertEqual(back_to_back(order, lambda item: item[0]), 0)
+
+    def test_spreads_artists_apart(self):
+        songs = [(artist, None, i) for artist in "ABCD" for i in range(5)]
+        self.rng.shuffle(songs)
+        order = spread(songs, lambda song: song[0], lambda song: song[1], self.rng)
+        self.assertEqual(sorted(order), sorted(songs))
+        self.assertEqual(back_to_back(order, lambda song: song[0]), 0)
+
+    def test_frequent_artists_are_spread_evenly(self):
+        songs = [("A", None, i) for i in range(10)] + [(artist, None, 0) for artist in "BCDEFGHIJK"]
+        order = spread(songs, lambda song: song[0], lambda song: song[1], self.rng)
+        self.assertEqual(back_to_back(order, lambda song: song[0]), 0)
+        positions = [i for i, song in enumerate(order) if song[0] == "A"]
+        gaps = [second - first for first, second in zip(positions, positions[1:])]
+        self.assertLessEqual(max(gaps), 3)
+
+    def test_spreads_albums_of_an_artist(self):
+        songs = [("A", album, i) for album in "XY" for i in range(3)] + [("B", "Z", i) for i in range(6)]
+        order = spread(songs, lambda song: song[0], lambda song: song[1], self.rng)
+        songs_of_a = [song for song in order if song[0] == "A"]
+        self.assertEqual(back_to_back(songs_of_a, lambda song: song[1]), 0)
+
+    def test_empty(self):
+        self.assertEqual(spread([], None, None), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
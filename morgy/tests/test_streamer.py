@@ -0,0 +1,169 @@
+import unittest
+import asyncio
+import http.client
+import io
+import os
+import sqlite3
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stderr
+from unittest.mock import patch
+
+from morgy.database import Database
+from morgy.streamer import Streamer, parse_range
+
+
+class TestParseRange(unittest.TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range("bytes=0-99", 1000), (0, 99))
+        self.assertEqual(parse_range("bytes=900-", 1000), (900, 999))
+        self.assertEqual(parse_range("bytes=900-5000", 1000), (900, 999))
+        self.assertEqual(parse_range("bytes=-100", 1000), (900, 999))
+        self.assertEqual(parse_range("bytes=-5000", 1000), (0, 999))
+
+    def test_ignored_ranges(self):
+        for header in [None, "", "bytes=-", "bytes=5-1", "bytes=0-1,5-9", "lines=1-2"]:
+            self.assertIsNone(parse_range(header, 1000))
+
+    def test_unsatisfiable_ranges(self):
+        for header, size in [("bytes=1000-", 1000), ("bytes=-0", 1000), ("bytes=-10", 0)]:
+            with self.assertRaises(ValueError):
+                parse_range(header, size)
+
+
+class TestStreamer(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = Database(self.db_file.name)
+        self.data = bytes(range(256)) * 64
+        for number, artist in enumerate(["A", "A", "B"], 1):
+            path = os.path.join(self.temp_dir, "{}.mp3".format(number))
+            with open(path, "wb") as f:
+                f.write(self.data)
+            self.db.add_detail_row(path, artist, 1990, None, None, None, str(number), 5, 100.0)
+        self.db.add_label_row(os.path.join(self.temp_dir, "2.mp3"), "car")
+        self.db.commit()
+
+        self.streamer = Streamer(self.db)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        server = asyncio.run_coroutine_threadsafe(
+            self.streamer.start("127.0.0.1", 0), self.loop
+        ).result()
+        self.address = server.sockets[0].getsockname()[:2]
+        self.connection = http.client.HTTPConnection(*self.address)
+
+    def tearDown(self):
+        self.connection.close()
+        asyncio.run_coroutine_threadsafe(self.streamer.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.streamer.close()
+        self.db.close()
+        os.unlink(self.db_file.name)
+        shutil.rmtree(self.temp_dir)
+
+    def request(self, url, headers={}, method="GET", connection=None):
+        connection = connection or self.connection
+        connection.request(method, url, headers=headers)
+        response = connection.getresponse()
+        return response, response.read()
+
+    def test_whole_file(self):
+        response, body = self.request("/tracks/1.mp3")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, self.data)
+        self.assertEqual(response.getheader("Content-Type"), "audio/mpeg")
+        self.assertEqual(response.getheader("Accept-Ranges"), "bytes")
+
+    def test_ranges(self):
+        response, body = self.request("/tracks/2.mp3", {"Range": "bytes=100-199"})
+        self.assertEqual(response.status, 206)
+        self.assertEqual(body, self.data[100:200])
+        self.assertEqual(response.getheader("Content-Range"), "bytes 100-199/16384")
+        # on the same connection
+        response, body = self.request("/tracks/2", {"Range": "bytes=-10"})
+        self.assertEqual((response.status, body), (206, self.data[-10:]))
+        response, body = self.request("/tracks/2.mp3", {"Range": "bytes=16384-"})
+        self.assertEqual(response.status, 416)
+        self.assertEqual(response.getheader("Content-Range"), "bytes */16384")
+
+    def test_head(self):
+        response, body = self.request("/tracks/3.mp3", {"Range": "bytes=0-9"}, "HEAD")
+        self.assertEqual((response.status, body), (206, b""))
+        self.assertEqual(response.getheader("Content-Length"), "10")
+
+    def test_not_found(self):
+        for url in ["/tracks/4.mp3", "/tracks/x.mp3", "/tracks", "/"]:
+            self.assertEqual(self.request(url)[0].status, 404)
+        os.unlink(os.path.join(self.temp_dir, "1.mp3"))
+        self.assertEqual(self.request("/tracks/1.mp3")[0].status, 404)
+        self.assertEqual(self.request("/tracks/1.mp3", method="POST")[0].status, 405)
+
+    def test_playlist(self):
+        response, body = self.request("/playlist.m3u?selection=artist%3DA")
+        self.assertEqual(response.status, 200)
+        base = "http://{}:{}".format(*self.address)
+        self.assertEqual(
+            body.decode(),
+            "#EXTM3U\n"
+            "#EXTINF:100,A - 1\n{0}/tracks/1.mp3\n"
+            "#EXTINF:100,A - 2\n{0}/tracks/2.mp3\n".format(base),
+        )
+        response, body = self.request("/playlist.m3u?labels=NOT%20car&spread=yes")
+        self.assertEqual(body.decode().count("/tracks/"), 2)
+        self.assertNotIn("/tracks/2.mp3", body.decode())
+        self.assertEqual(self.request("/playlist.m3u?labels=bicycle")[0].status, 400)
+
+    def test_playlists_are_cached_until_the_library_changes(self):
+        self.request("/playlist.m3u")
+        self.request("/playlist.m3u")
+        self.assertEqual((self.streamer.cache.hits, self.streamer.cache.misses), (1, 1))
+        self.db.decrease_prio(os.path.join(self.temp_dir, "1.mp3"))
+        self.db.commit()
+        response, body = self.request("/playlist.m3u?selection=priority%3D5")
+        self.assertEqual(body.decode().count("/tracks/"), 2)
+
+    def test_database_errors(self):
+        error = sqlite3.OperationalError("database is locked")
+        errors = io.StringIO()
+        with patch.object(self.streamer, "playlist", side_effect=error), redirect_stderr(errors):
+            response, body = self.request("/playlist.m3u")
+        self.assertEqual(response.status, 500)
+        self.assertEqual(response.getheader("Connection"), "close")
+        self.assertIn("GET /playlist.m3u HTTP/1.1 failed: OperationalError", errors.getvalue())
+        self.connection.close()
+        self.assertEqual(self.request("/playlist.m3u")[0].status, 200)
+
+    def test_many_listeners(self):
+        listeners = 50
+        barrier = threading.Barrier(listeners)
+
+        def listen(number):
+            connection = http.client.HTTPConnection(*self.address)
+            try:
+                # every listener connects before any of them is answered
+                connection.connect()
+                barrier.wait()
+                first = number * 100
+                response, body = self.request(
+                    "/tracks/{}.mp3".format(number % 3 + 1),
+                    {"Range": "bytes={}-{}".format(first, first + 4095)},
+                    connection=connection,
+                )
+                return body == self.data[first : first + 4096]
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(listeners) as executor:
+            self.assertTrue(all(executor.map(listen, range(listeners))))
+
+
+if __name__ == "__main__":
+    unittest.main()
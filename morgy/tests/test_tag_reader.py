@@ -0,0 +1,256 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from morgy.database.tag_reader import (
+    ASF_CONTENT_DESCRIPTION,
+    ASF_EXTENDED_CONTENT_DESCRIPTION,
+    ASF_FILE_PROPERTIES,
+    ASF_HEADER,
+    TagReader,
+)
+
+# MPEG 1 layer III, 128 kbps, 44100 Hz, stereo
+MP3_FRAME_HEADER = b"\xff\xfb\x90\x00"
+
+
+def synchsafe_bytes(size):
+    return bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+
+
+def id3v2(frames, version=3):
+    body = b""
+    for frame_id, text in frames:
+        data = b"\x03" + text.encode("utf-8") if version == 4 else b"\x01" + text.encode("utf-16")
+        if version == 2:
+            body += frame_id.encode() + len(data).to_bytes(3, "big") + data
+        elif version == 4:
+            body += frame_id.encode() + synchsafe_bytes(len(data)) + b"\x00\x00" + data
+        else:
+            body += frame_id.encode() + struct.pack(">I", len(data)) + b"\x00\x00" + data
+    body += b"\x00" * 32
+    return b"ID3" + bytes([version, 0, 0]) + synchsafe_bytes(len(body)) + body
+
+
+def id3v1(title, artist, album, year, track):
+    def field(text, size):
+        return text.encode("latin-1").ljust(size, b"\x00")
+
+    return (
+        b"TAG" + field(title, 30) + field(artist, 30) + field(album, 30)
+        + field(year, 4) + field("", 28) + b"\x00" + bytes([track]) + b"\x00"
+    )
+
+
+def flac(comments, picture_size=0, sample_rate=0, total_samples=0):
+    # 20 bits sample rate, 3 bits channels, 5 bits bits per sample, 36 bits samples
+    packed = (sample_rate << 44) | (1 << 41) | (15 << 36) | total_samples
+    streaminfo = b"\x00" * 10 + packed.to_bytes(8, "big") + b"\x00" * 16
+    streaminfo = b"\x00" + (34).to_bytes(3, "big") + streaminfo
+    picture = b"\x06" + picture_size.to_bytes(3, "big") + b"\xff" * picture_size
+    vendor = b"test"
+    block = struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", len(comments))
+    for comment in comments:
+        encoded = comment.encode("utf-8")
+        block += struct.pack("<I", len(encoded)) + encoded
+    vorbis = b"\x84" + len(block).to_bytes(3, "big") + block
+    return b"fLaC" + streaminfo + picture + vorbis + b"\x00" * 64
+
+
+def asf(title, author, attributes, duration=0, preroll=0):
+    def utf16(text):
+        return (text + "\x00").encode("utf-16-le")
+
+    description = struct.pack("<HHHHH", len(utf16(title)), len(utf16(author)), 0, 0, 0)
+    description += utf16(title) + utf16(author)
+    extended = struct.pack("<H", len(attributes))
+    for name, value in attributes:
+        if isinstance(value, int):
+            encoded_value, value_type = struct.pack("<I", value), 3
+        else:
+            encoded_value, value_type = utf16(value), 0
+        extended += struct.pack("<H", len(utf16(name))) + utf16(name)
+        extended += struct.pack("<HH", value_type, len(encoded_value)) + encoded_value
+    properties = b"\x00" * 40 + struct.pack(
+        "<QQQ", int((duration + preroll / 1000) * 10000000), 0, preroll
+    ) + b"\x00" * 16
+    objects = (
+        ASF_CONTENT_DESCRIPTION + struct.pack("<Q", 24 + len(description)) + description
+        + ASF_EXTENDED_CONTENT_DESCRIPTION + struct.pack("<Q", 24 + len(extended)) + extended
+        + ASF_FILE_PROPERTIES + struct.pack("<Q", 24 + len(properties)) + properties
+    )
+    return ASF_HEADER + struct.pack("<QIBB", 30 + len(objects), 3, 1, 2) + objects
+
+
+class TestTagReader(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.tag_reader = TagReader()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read(self, content, name="song.mp3"):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return self.tag_reader.read_tags(path)
+
+    def test_id3v23(self):
+        frames = [
+            ("TPE1", "Millencolin"),
+            ("TALB", "Same old tunes"),
+            ("TYER", "1994"),
+            ("TRCK", "6/14"),
+            ("TIT2", "Leona"),
+        ]
+        tags = self.read(id3v2(frames) + b"\xff\xfb" * 100)
+        self.assertEqual(
+            tags,
+            {
+                "artist": "Millencolin",
+                "album": "Same old tunes",
+                "year": "1994",
+                "number": "6",
+                "title": "Leona",
+            },
+        )
+
+    def test_id3v24_with_accents(self):
+        frames = [("TPE1", "Tankcsapda"), ("TDRC", "1995-03-01"), ("TIT2", "Mennyország")]
+        tags = self.read(id3v2(frames, version=4))
+        self.assertEqual(tags["year"], "1995")
+        self.assertEqual(tags["title"], "Mennyország")
+
+    def test_id3v22(self):
+        tags = self.read(id3v2([("TT2", "Leona"), ("TP1", "Millencolin")], version=2))
+        self.assertEqual(tags, {"title": "Leona", "artist": "Millencolin"})
+
+    def test_large_frames_are_skipped(self):
+        picture = b"APIC" + struct.pack(">I", 1 << 20) + b"\x00\x00" + b"\x00" * (1 << 20)
+        content = id3v2([("TIT2", "Leona")])
+        size = len(content) - 10 + len(picture)
+        content = b"ID3\x03\x00\x00" + synchsafe_bytes(size) + picture + content[10:]
+        self.assertEqual(self.read(content)["title"], "Leona")
+
+    def test_pictures_are_not_copied(self):
+        sizes = list()
+
+        class Data(bytes):
+            def __getitem__(self, index):
+                item = bytes.__getitem__(self, index)
+                if isinstance(index, slice):
+                    sizes.append(len(item))
+                return item
+
+        content = id3v2([("TIT2", "Leona")])
+        # unsynchronised, every 0xff 0x00 is one byte of the picture
+        for flags, picture_size in [(0x00, 1 << 16), (0x80, 1 << 15)]:
+            sizes.clear()
+            picture = b"APIC" + struct.pack(">I", picture_size) + b"\x00\x00" + b"\xff\x00" * (1 << 15)
+            size = len(content) - 10 + len(picture)
+            tag = b"ID3\x03\x00" + bytes([flags]) + synchsafe_bytes(size) + picture + content[10:]
+            self.assertEqual(self.tag_reader.parse(Data(tag))["title"], "Leona")
+            self.assertLess(max(sizes), 1024)
+
+    def test_unsynchronised_id3v23(self):
+        picture = b"\x00" + b"\xff\xfb\xff\x00" * 100
+        frames = b""
+        for frame_id, data in [(b"APIC", picture), (b"TIT2", b"\x00Le\xffna"), (b"TPE1", b"\x00Millencolin")]:
+            frames += frame_id + struct.pack(">I", len(data)) + b"\x00\x00" + data
+        # a 0x00 after every 0xff, also in the frame headers
+        frames = frames.replace(b"\xff", b"\xff\x00")
+        tag = b"ID3\x03\x00\x80" + synchsafe_bytes(len(frames)) + frames
+        tags = self.read(tag + MP3_FRAME_HEADER + b"\x00" * 413)
+        self.assertEqual((tags["title"], tags["artist"]), ("Le\xffna", "Millencolin"))
+
+    def test_id3v1(self):
+        tags = self.read(b"\xff\xfb" * 100 + id3v1("Leona", "Millencolin", "Same old tunes", "1994", 6))
+        self.assertEqual(
+            tags,
+            {
+                "title": "Leona",
+                "artist": "Millencolin",
+                "album": "Same old tunes",
+                "year": "1994",
+                "number": "6",
+            },
+        )
+
+    def test_id3v2_is_completed_from_id3v1(self):
+        content = id3v2([("TIT2", "Leona")]) + id3v1("Other", "Millencolin", "", "", 0)
+        self.assertEqual(self.read(content), {"title": "Leona", "artist": "Millencolin"})
+
+    def test_flac_vorbis_comments(self):
+        comments = ["TITLE=Leona", "artist=Millencolin", "TRACKNUMBER=06", "DISCNUMBER=1/2"]
+        tags = self.read(flac(comments, picture_size=4096), "song.flac")
+        self.assertEqual(
+            tags,
+            {"title": "Leona", "artist": "Millencolin", "number": "06", "cd_number": "1"},
+        )
+
+    def test_asf(self):
+        attributes = [("WM/AlbumTitle", "Same old tunes"), ("WM/TrackNumber", 6), ("WM/Year", "1994")]
+        tags = self.read(asf("Leona", "Millencolin", attributes) + b"\x00" * 64, "song.wma")
+        self.assertEqual(
+            tags,
+            {
+                "title": "Leona",
+                "artist": "Millencolin",
+                "album": "Same old tunes",
+                "number": "6",
+                "year": "1994",
+            },
+        )
+
+    def test_cbr_mp3_duration_is_extrapolated_from_the_first_frame(self):
+        audio = MP3_FRAME_HEADER + b"\x00" * (160000 - 4)
+        content = id3v2([("TIT2", "Leona")]) + audio + id3v1("Leona", "", "", "", 0)
+        self.assertAlmostEqual(self.read(content)["duration"], 10.0)
+
+    def test_mp3_duration_from_xing_header(self):
+        xing = b"Xing" + struct.pack(">II", 1, 1000)
+        content = MP3_FRAME_HEADER + b"\x00" * 32 + xing + b"\x00" * 5000
+        self.assertAlmostEqual(self.read(content)["duration"], 1000 * 1152 / 44100)
+
+    def test_mp3_duration_from_vbri_header(self):
+        vbri = b"VBRI" + struct.pack(">HHHII", 1, 0, 75, 100000, 2000)
+        content = MP3_FRAME_HEADER + b"\x00" * 32 + vbri + b"\x00" * 5000
+        self.assertAlmostEqual(self.read(content)["duration"], 2000 * 1152 / 44100)
+
+    def test_mp3_frame_sync_is_validated(self):
+        # 0xff bytes that are not a valid frame header are skipped
+        content = b"\xff\xff\xff\x00" + MP3_FRAME_HEADER + b"\x00" * (16000 - 4)
+        self.assertAlmostEqual(self.read(content)["duration"], 1.0)
+
+    def test_flac_duration_from_streaminfo(self):
+        content = flac([], sample_rate=44100, total_samples=441000)
+        self.assertAlmostEqual(self.read(content, "song.flac")["duration"], 10.0)
+
+    def test_asf_duration_without_preroll(self):
+        content = asf("Leona", "Millencolin", [], duration=10, preroll=3000)
+        self.assertAlmostEqual(self.read(content, "song.wma")["duration"], 10.0)
+
+    def test_read_duration(self):
+        path = os.path.join(self.temp_dir, "song.mp3")
+        with open(path, "wb") as f:
+            f.write(MP3_FRAME_HEADER + b"\x00" * (16000 - 4))
+        self.assertAlmostEqual(self.tag_reader.read_duration(path), 1.0)
+
+    def test_file_without_tags(self):
+        self.assertEqual(self.read(b"fake mp3 content"), {})
+
+    def test_empty_file(self):
+        self.assertEqual(self.read(b""), {})
+
+    def test_truncated_tag(self):
+        self.assertEqual(self.read(id3v2([("TIT2", "Leona")])[:12]), {})
+
+    def test_missing_file(self):
+        self.assertEqual(self.tag_reader.read_tags("/definitely/not/existing.mp3"), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
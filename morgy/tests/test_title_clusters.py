@@ -0,0 +1,132 @@
+import unittest
+import configparser
+import os
+import tempfile
+from unittest.mock import patch
+
+from morgy.database import Database
+from morgy.database.title_clusters import TitleClusterer
+from morgy.smart_picker import SmartPicker
+
+
+class TestTitleClusterer(unittest.TestCase):
+    def setUp(self):
+        self.clusterer = TitleClusterer()
+
+    def clusters(self, tracks):
+        """Return the clusters as sorted lists of track ids."""
+        members = dict()
+        for track_id, cluster in self.clusterer.clusters(tracks).items():
+            members.setdefault(cluster, list()).append(track_id)
+        return sorted(sorted(ids) for ids in members.values())
+
+    def test_normalise(self):
+        for title in [
+            "Enter Sandman (Remastered)",
+            "enter sandman",
+            "Enter sandman - live",
+            "Enter Sandman [Live at Wembley] (2011 Remaster)",
+            "Enter, Sandman!",
+        ]:
+            self.assertEqual(self.clusterer.normalise(title), "enter sandman")
+        self.assertEqual(self.clusterer.normalise("Fél (Part 2)"), "fel part 2")
+        self.assertEqual(self.clusterer.normalise("(Live)"), "live")
+
+    def test_configurable_steps(self):
+        clusterer = TitleClusterer(["case"])
+        self.assertEqual(clusterer.normalise("Fél  (Live)"), "fél (live)")
+        with self.assertRaises(ValueError):
+            TitleClusterer(["case", "soundex"])
+
+    def test_from_config(self):
+        config = configparser.ConfigParser()
+        config.read_string("[DEFAULT]\ntitle_normalisation = case, accents\ntitle_similarity = 0.9\n")
+        clusterer = TitleClusterer.from_config(config["DEFAULT"])
+        self.assertEqual(clusterer.normalise("Fél - Live"), "fel - live")
+        self.assertEqual(clusterer.similarity, 0.9)
+
+    def test_same_keys_cluster_across_artists(self):
+        tracks = [
+            (1, "Metallica", "Enter Sandman"),
+            (2, "Metallica", "Enter Sandman (Remastered)"),
+            (3, "Motörhead", "enter sandman - live"),
+            (4, "Metallica", "Sad but True"),
+        ]
+        self.assertEqual(self.clusters(tracks), [[1, 2, 3], [4]])
+
+    def test_similar_keys_cluster_within_an_artist(self):
+        tracks = [
+            (1, "Metallica", "Enter Sandman"),
+            (2, "Metallica", "Enter Sandmann"),
+            (3, "Other", "Enter Sandmen"),
+            (4, "Metallica", "Nothing Else Matters"),
+        ]
+        self.assertEqual(self.clusters(tracks), [[1, 2], [3], [4]])
+
+    def test_numbers_have_to_match(self):
+        tracks = [
+            (1, "Artist", "Symphony of Destruction Part 1"),
+            (2, "Artist", "Symphony of Destruction Part 2"),
+        ]
+        self.assertEqual(self.clusters(tracks), [[1], [2]])
+
+
+class TestTitleClustersInDatabase(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.db = Database(self.db_file.name)
+        rows = [
+            ("/a/1.mp3", "Metallica", None, None, None, None, "Enter Sandman", 5),
+            ("/a/2.mp3", "Metallica", None, None, None, None, "Enter Sandman (Remastered)", 3),
+            ("/a/3.mp3", "Metallica", None, None, None, None, "enter sandman - live", 1),
+            ("/a/4.mp3", "Metallica", None, None, None, None, "One", 2),
+        ]
+        for row in rows:
+            self.db.add_detail_row(*row)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        os.unlink(self.db_file.name)
+
+    def test_update_stores_only_changes(self):
+        clusterer = TitleClusterer()
+        self.assertEqual(clusterer.update(self.db), 4)
+        self.assertEqual(clusterer.update(self.db), 0)
+        self.db.cursor.execute("SELECT title, cluster FROM tracks ORDER BY id")
+        clusters = self.db.cursor.fetchall()
+        self.assertEqual([cluster for _, cluster in clusters], [1, 1, 1, 4])
+
+    def test_update_skips_unchanged_titles(self):
+        TitleClusterer().update(self.db)
+        with patch.object(self.db, "get_titles_and_clusters") as titles:
+            self.assertEqual(TitleClusterer().update(self.db), 0)
+            # a priority is no change of a title
+            self.db.decrease_prio("/a/1.mp3")
+            self.assertEqual(TitleClusterer().update(self.db), 0)
+        titles.assert_not_called()
+
+        self.db.add_detail_row("/a/5.mp3", "Metallica", None, None, None, None, "One (Live)", 1)
+        self.assertEqual(TitleClusterer().update(self.db), 1)
+        # other settings cluster again, the bracketed suffixes stay
+        self.assertEqual(TitleClusterer(["case"]).update(self.db), 2)
+        self.db.cursor.execute("SELECT cluster FROM tracks ORDER BY id")
+        self.assertEqual(self.db.cursor.fetchall(), [(1,), (2,), (1,), (4,), (5,)])
+
+    def test_picker_groups_by_cluster(self):
+        TitleClusterer().update(self.db)
+        self.db.add_detail_row("/a/5.mp3", "Metallica", None, None, None, None, "Fuel (live)", 1)
+        titles = SmartPicker(self.db).build_dict_from_database()
+        self.assertEqual(
+            titles,
+            {
+                1: [("/a/1.mp3", 5), ("/a/2.mp3", 3), ("/a/3.mp3", 1)],
+                4: [("/a/4.mp3", 2)],
+                "Fuel": [("/a/5.mp3", 1)],
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from morgy.database import Database
+from morgy.database.updater import DatabaseUpdater
+from morgy.watcher import InotifyBackend, PollingBackend, Watcher
+
+
+class WatcherTests:
+    poll = False
+
+    def setUp(self):
+        self.print_patcher = patch('builtins.print', MagicMock())
+        self.print_patcher.start()
+
+        self.db_file = tempfile.NamedTemporaryFile(delete=False)
+        self.db_file.close()
+        self.db = Database(self.db_file.name)
+        self.temp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.temp_dir, "00 All")
+        self.album_dir = os.path.join(self.root, "01 Punk", "Artist", "1990 Album")
+        os.makedirs(self.album_dir)
+        self.watcher = Watcher(DatabaseUpdater(self.db), [self.root], 7, 0.05, self.poll)
+        if self.poll:
+            self.watcher.backend.interval = 0.01
+            self.watcher.backend.next_scan = time.monotonic()
+
+    def tearDown(self):
+        self.watcher.backend.close()
+        self.print_patcher.stop()
+        self.db.conn.close()
+        os.unlink(self.db_file.name)
+        shutil.rmtree(self.temp_dir)
+
+    def _write(self, path, content="content"):
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _paths(self):
+        self.db.cursor.execute("SELECT path, priority FROM details ORDER BY path")
+        return self.db.cursor.fetchall()
+
+    def _size(self, path):
+        self.db.cursor.execute("SELECT size FROM details WHERE path = ?", [path])
+        return self.db.cursor.fetchone()[0]
+
+    def _run_until(self, expected, timeout=5):
+        deadline = time.monotonic() + timeout
+        while self._paths() != expected and time.monotonic() < deadline:
+            self.watcher.step(0.1)
+        self.assertEqual(self._paths(), expected)
+
+    def test_new_files_are_added(self):
+        song = os.path.join(self.album_dir, "01 Song.mp3")
+        self._write(song)
+        self._write(os.path.join(self.album_dir, "cover.jpg"))
+        self._run_until([(song, 7)])
+
+    def test_deleted_files_are_removed(self):
+        song = os.path.join(self.album_dir, "01 Song.mp3")
+        self._write(song)
+        self._run_until([(song, 7)])
+        os.unlink(song)
+        self._run_until([])
+
+    def test_moved_files_keep_their_priority(self):
+        song = os.path.join(self.album_dir, "01 Song.mp3")
+        self._write(song)
+        self._run_until([(song, 7)])
+        self.db.decrease_prio(song)
+        self.db.commit()
+        moved = os.path.join(self.album_dir, "01 Renamed.mp3")
+        os.rename(song, moved)
+        self._run_until([(moved, 6)])
+
+    def test_rewritten_files_are_refreshed(self):
+        song = os.path.join(self.album_dir, "01 Song.mp3")
+        self._write(song)
+        self._run_until([(song, 7)])
+        self.db.decrease_prio(song)
+        self.db.commit()
+        self._write(song, "longer content")
+        deadline = time.monotonic() + 5
+        while self._size(song) != 14 and time.monotonic() < deadline:
+            self.watcher.step(0.1)
+        self.assertEqual(self._size(song), 14)
+        self.assertEqual(self._paths(), [(song, 6)])
+
+    def test_flush_is_one_transaction(self):
+        song = os.path.join(self.album_dir, "01 Song.mp3")
+        self._write(song)
+        self.watcher.created.add(song)
+        with patch.object(self.watcher.db_updater, "remove_entries", side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.watcher.flush()
+        self.assertEqual(self._paths(), [])
+
+    def test_changes_are_debounced_into_one_batch(self):
+        songs = [os.path.join(self.album_dir, "0{} Song.mp3".format(i)) for i in range(1, 4)]
+        with patch.object(
+            self.watcher.db_updater, "update_files", wraps=self.watcher.db_updater.update_files
+        ) as update_files:
+            for song in songs:
+                self._write(song)
+            self._run_until([(song, 7) for song in songs])
+        self.assertEqual(update_files.call_count, 1)
+
+
+class TestWatcherWithPolling(WatcherTests, unittest.TestCase):
+    poll = True
+
+
+class TestWatcherWithInotify(WatcherTests, unittest.TestCase):
+    def setUp(self):
+        try:
+            InotifyBackend([]).close()
+        except (OSError, AttributeError):
+            self.skipTest("inotify is not available")
+        super().setUp()
+
+    def test_new_directories_are_added(self):
+        new_album = os.path.join(self.root, "01 Punk", "Artist", "1994 Other")
+        os.makedirs(new_album)
+        song = os.path.join(new_album, "01 Song.mp3")
+        self._write(song)
+        self._run_until([(song, 7)])
+
+    def test_files_are_reported_once_closed(self):
+        song = os.path.join(self.album_dir, "01 Song.mp3")
+        with open(song, "w") as f:
+            f.write("partial")
+            f.flush()
+            # only created so far
+            self.assertEqual(self.watcher.backend.read_events(0.1), [])
+        self.assertEqual(self.watcher.backend.read_events(1), [("created", song, False)])
+
+    def test_moved_directories_keep_their_entries(self):
+        song = os.path.join(self.album_dir, "01 Song.mp3")
+        self._write(song)
+        self._run_until([(song, 7)])
+        moved_album = os.path.join(self.root, "01 Punk", "Artist", "1991 Album")
+        os.rename(self.album_dir, moved_album)
+        self._run_until([(os.path.join(moved_album, "01 Song.mp3"), 7)])
+
+    def test_deleted_directories_are_removed(self):
+        song = os.path.join(self.album_dir, "01 Song.mp3")
+        self._write(song)
+        self._run_until([(song, 7)])
+        shutil.rmtree(os.path.join(self.root, "01 Punk"))
+        self._run_until([])
+
+
+class TestPollingBackend(unittest.TestCase):
+    def test_idle_reads_do_not_scan(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            backend = PollingBackend([temp_dir], interval=60)
+            with patch.object(backend, "scan") as scan:
+                self.assertEqual(backend.read_events(0), [])
+            scan.assert_not_called()
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# a file is only complete when it is closed, IN_CREATE is for directories
+CREATED_MASK = IN_CLOSE_WRITE | IN_MOVED_TO
+DELETED_MASK = IN_MOVED_FROM | IN_DELETE
+# struct inotify_event without its name: wd, mask, cookie, len
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class InotifyBackend:
+    """Reports ("created" or "deleted", path, is_dir) events through inotify,
+    watching every directory of the roots. Blocks without any cost while
+    nothing happens."""
+
+    def __init__(self, roots):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = dict()
+        for root in roots:
+            self.watch_tree(root)
+
+    def watch_tree(self, directory):
+        for dirpath, dirnames, filenames in os.walk(directory):
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(dirpath), WATCH_MASK
+            )
+            # the directory may be gone already
+            if wd >= 0:
+                self.directories[wd] = dirpath
+
+    def read_events(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return list()
+        data = os.read(self.fd, 64 * 1024)
+        events = list()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size : offset + INOTIFY_EVENT.size + length]
+            offset = offset + INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append(("overflow", None, True))
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            if wd not in self.directories:
+                continue
+            path = os.path.join(self.directories[wd], os.fsdecode(name.rstrip(b"\x00")))
+            is_dir = bool(mask & IN_ISDIR)
+            if mask & CREATED_MASK or (mask & IN_CREATE and is_dir):
+                if is_dir:
+                    self.watch_tree(path)
+                events.append(("created", path, is_dir))
+            elif mask & DELETED_MASK:
+                events.append(("deleted", path, is_dir))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingBackend:
+    """Reports the same events as InotifyBackend by comparing the size and
+    modification time of every file in the roots every interval seconds."""
+
+    def __init__(self, roots, interval=10.0):
+        self.roots = roots
+        self.interval = interval
+        self.files = self.scan()
+        self.next_scan = time.monotonic() + interval
+
+    def scan(self):
+        files = dict()
+        for root in self.roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files[path] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def read_events(self, timeout):
+        now = time.monotonic()
+        if timeout is None or now + timeout >= self.next_scan:
+            time.sleep(max(self.next_scan - now, 0))
+        else:
+            time.sleep(timeout)
+            return list()
+        self.next_scan = time.monotonic() + self.interval
+        files = self.scan()
+        events = [
+            ("created", path, False)
+            for path, stat in files.items()
+            if self.files.get(path) != stat
+        ]
+        events.extend(
+            ("deleted", path, False) for path in self.files if path not in files
+        )
+        self.files = files
+        return events
+
+    def close(self):
+        pass
+
+
+class Watcher:
+    """Keeps the database in sync with the library roots. Events are
+    collected until nothing happens for debounce seconds, then applied in
+    one go: new and moved files first, so that moves are recognised by
+    DatabaseUpdater, then the deleted ones."""
+
+    def __init__(self, db_updater, roots, priority=10, debounce=2.0, poll=False):
+        self.db_updater = db_updater
+        self.roots = [os.path.realpath(root) for root in roots]
+        self.priority = priority
+        self.debounce = debounce
+        # flush even if the events never stop
+        self.max_delay = 10 * debounce
+        self.backend = PollingBackend(self.roots) if poll else self.default_backend()
+        self.created = set()
+        self.deleted = set()
+        self.deleted_dirs = set()
+        self.rescan = False
+        self.first_event = None
+        self.last_event = None
+
+    def default_backend(self):
+        try:
+            return InotifyBackend(self.roots)
+        except (OSError, AttributeError):
+            print("inotify is not available, polling instead.")
+            return PollingBackend(self.roots)
+
+    def add_event(self, kind, path, is_dir):
+        if kind == "overflow":
+            self.rescan = True
+        elif kind == "created" and is_dir:
+            for dirpath, names in self.db_updater.walk(path):
+                for name in names:
+                    self.add_event("created", os.path.join(dirpath, name), False)
+        elif kind == "created" and self.db_updater.is_song(path):
+            self.created.add(path)
+            self.deleted.discard(path)
+        elif kind == "deleted" and is_dir:
+            self.deleted_dirs.add(path)
+        elif kind == "deleted" and self.db_updater.is_song(path):
+            self.deleted.add(path)
+            self.created.discard(path)
+
+    def has_pending(self):
+        return bool(self.created or self.deleted or self.deleted_dirs or self.rescan)
+
+    def step(self, idle_timeout=None):
+        """Wait for events and flush them once they are due. Without pending
+        events it waits idle_timeout seconds, for ever if None."""
+        if self.has_pending():
+            quiet_until = self.last_event + self.debounce
+            timeout = max(min(quiet_until, self.first_event + self.max_delay) - time.monotonic(), 0)
+        else:
+            timeout = idle_timeout
+        events = self.backend.read_events(timeout)
+        now = time.monotonic()
+        if events:
+            if not self.has_pending():
+                self.first_event = now
+            self.last_event = now
+            for event in events:
+                self.add_event(*event)
+        if self.has_pending() and (
+            now - self.last_event >= self.debounce
+            or now - self.first_event >= self.max_delay
+        ):
+            self.flush()
+
+    def flush(self):
+        """Apply the pending events in one transaction."""
+        with self.db_updater.db.transaction():
+            if self.rescan:
+                print("Too many changes, rescanning.")
+                for root in self.roots:
+                    self.db_updater.update_db(root, self.priority, full=True)
+                self.db_updater.remove_not_existing_entries()
+            else:
+                self.db_updater.update_files(sorted(self.created), self.priority)
+                self.db_updater.remove_entries(
+                    [path for path in self.deleted if not os.path.exists(path)]
+                )
+                for directory in self.deleted_dirs:
+                    if not os.path.exists(directory):
+                        self.db_updater.db.delete_entries_under(directory)
+        self.created.clear()
+        self.deleted.clear()
+        self.deleted_dirs.clear()
+        self.rescan = False
+
+    def run(self):
+        try:
+            while True:
+                self.step()
+        except KeyboardInterrupt:
+            if self.has_pending():
+                self.flush()
+        finally:
+            self.backend.close()